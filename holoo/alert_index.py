@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+class AlertIndex:
+    """Predicted stockouts from the forecast results, sorted by stockout date.
+
+    The results file is read and parsed once; the index is rebuilt only when
+    the file's inode, mtime or size changes (or on an explicit ``reload()``),
+    so each alert request is a binary search over a sorted date array. With a
+    ``store`` (a ForecastStore) the index arrays are published there and the
+    other worker processes map them instead of parsing the file again.
+    """
+
+    def __init__(self, storage, dataset, stockout_columns, store=None):
+        self.storage = storage
+        self.dataset = dataset
+        self.stockout_columns = stockout_columns
+        self.store = store
+        self._lock = threading.Lock()
+        self._signature = None
+        self._dates = np.array([], dtype='datetime64[D]')
+        self._skus = np.array([], dtype=str)
+        # Index into stockout_columns
+        self._columns = np.array([], dtype=np.int8)
+        self.built_at = None
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.storage.path(self.dataset))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self):
+        """Rebuild the index if the results file changed since it was built.
+
+        Without a results file the index is built empty, so alerts() has
+        nothing to report rather than no index to read.
+        """
+        signature = self._file_signature()
+        if self.built_at is None or signature != self._signature:
+            self._build(signature)
+
+    def reload(self):
+        """Rebuild the index unconditionally, e.g. after a new results file was uploaded."""
+        self._build(self._file_signature())
+
+    def _read_arrays(self, signature):
+        """Parse the results file into date-sorted ``dates``, ``skus`` and ``columns`` arrays."""
+        dates, skus, columns = [], [], []
+        if signature is not None:
+            df = self.storage.read(self.dataset, columns=['SKU_ID'] + self.stockout_columns)
+            for code, column in enumerate(self.stockout_columns):
+                # Non-date values such as 'No stockout projected' become NaT and are dropped
+                parsed = pd.to_datetime(df[column], errors='coerce')
+                valid = parsed.notna().to_numpy()
+                dates.append(parsed[valid].to_numpy().astype('datetime64[D]'))
+                skus.append(df['SKU_ID'].astype(str).to_numpy()[valid])
+                columns.append(np.full(valid.sum(), code, dtype=np.int8))
+        if not dates:
+            return {
+                'dates': np.array([], dtype='datetime64[D]'),
+                'skus': np.array([], dtype=str),
+                'columns': np.array([], dtype=np.int8),
+            }
+        dates = np.concatenate(dates)
+        order = np.argsort(dates, kind='stable')
+        # Fixed-width strings rather than objects so the array can be memory-mapped
+        return {'dates': dates[order], 'skus': np.concatenate(skus)[order].astype(str),
+                'columns': np.concatenate(columns)[order]}
+
+    def _build(self, signature):
+        with self._lock:
+            arrays = None
+            if self.store is not None and signature is not None:
+                arrays = self.store.load(self.dataset, signature, ['dates', 'skus', 'columns'])
+            if arrays is None:
+                arrays = self._read_arrays(signature)
+                if self.store is not None and signature is not None:
+                    try:
+                        self.store.publish(self.dataset, signature, arrays)
+                    except OSError as e:
+                        logger.error(f"Error publishing alert index: {str(e)}")
+            self._dates = arrays['dates']
+            self._skus = arrays['skus']
+            self._columns = arrays['columns']
+            self._signature = signature
+            self.built_at = datetime.now()
+            logger.info(f"Built alert index with {len(self._dates)} predicted stockouts")
+
+    def etag(self, today):
+        """ETag for the alerts served on ``today``: changes with the results file or the date."""
+        key = f"{self._signature}|{today}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def alerts(self, today, window_days):
+        """Return alerts for stockouts from ``today`` up to ``window_days`` days ahead."""
+        with self._lock:
+            today = np.datetime64(today, 'D')
+            start = np.searchsorted(self._dates, today, side='left')
+            end = np.searchsorted(self._dates, today + np.timedelta64(window_days, 'D'), side='right')
+            dates = self._dates[start:end]
+            skus = self._skus[start:end]
+            columns = [self.stockout_columns[code] for code in self._columns[start:end]]
+            timestamp = self.built_at.strftime('%Y-%m-%d %H:%M:%S')
+        days_until = (dates - today).astype(np.int64)
+        return [
+            {
+                'type': 'stockout',
+                'title': 'Stockout Predicted',
+                'message': f"{column.replace('_', ' ')} for SKU {sku} is predicted on {str(date)} (in {days} days)",
+                'timestamp': timestamp
+            }
+            for date, sku, column, days in zip(dates, skus, columns, days_until)
+        ]
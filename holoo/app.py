@@ -1,106 +1,147 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, g
 import pandas as pd
 from datetime import datetime, timedelta
 import logging
 import os
-from shopify_integration import ShopifyIntegration
+from shopify_integration import ShopifyClientManager
+from config_service import ConfigService, CONFIG_FILE, DEFAULT_CONFIG
+from storage import get_storage
+from alert_index import AlertIndex
+from forecast_store import ForecastStore
+from forecast_results import read_page, stockout_tiers, InvalidCursor, PAGE_SIZE, MAX_PAGE_SIZE, TIER_NAMES
+from leader import LeaderLock, LEADER_LOCK_FILE
+from forecast_jobs import ForecastScheduler
+from model_cache import ModelCache
+from metrics import REGISTRY, observe_request
+from warmup import prewarm
 import threading
 import time
-import json
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging; set HOLOO_LOG_LEVEL=DEBUG for verbose output
+logging.basicConfig(level=os.environ.get('HOLOO_LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Configuration
-CONFIG_FILE = 'config.json'
-DEFAULT_CONFIG = {
-    'shopify_enabled': False,
-    'shopify_shop_url': '',
-    'shopify_access_token': ''
+# Configuration, cached in memory and reloaded when another worker saves it
+config_service = ConfigService(CONFIG_FILE, DEFAULT_CONFIG)
+
+storage = get_storage()
+ML_FORECAST_DATASET = 'inventory_forecast_results'
+STOCKOUT_COLUMNS = ['Prophet_Estimated_Stockout_Date', 'XGB_Estimated_Stockout_Date']
+ALERT_WINDOW_DAYS = 7
+# Results served by /api/forecasts: dataset and SKU column per ``dataset`` parameter
+RESULT_DATASETS = {
+    'inventory': (ML_FORECAST_DATASET, 'SKU_ID'),
+    'stockout': ('stockout_forecast_results', 'SKU'),
 }
+# Worker processes share the parsed alert index through memory-mapped snapshots
+alert_index = AlertIndex(storage, ML_FORECAST_DATASET, STOCKOUT_COLUMNS, store=ForecastStore(storage.directory))
+# Shopify clients of the web side, which only read the order history; syncing
+# happens in the sync leader (see background_sync)
+shopify_clients = ShopifyClientManager(config_service, storage, read_only=True)
 
-def load_config():
-    try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r') as f:
-                return json.load(f)
-        return DEFAULT_CONFIG
-    except Exception as e:
-        logger.error(f"Error loading config: {str(e)}")
-        return DEFAULT_CONFIG
+# The forecast scheduler of this process, created on first use (see get_forecast_scheduler)
+forecast_scheduler = None
+forecast_scheduler_pid = None
+forecast_scheduler_lock = threading.Lock()
 
-def save_config(config):
-    try:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f)
-    except Exception as e:
-        logger.error(f"Error saving config: {str(e)}")
+def get_forecast_scheduler():
+    """This process's forecast scheduler, created the first time it is needed
 
-# Initialize Shopify integration if enabled
-config = load_config()
-shopify_integration = None
-if config['shopify_enabled'] and config['shopify_shop_url'] and config['shopify_access_token']:
-    try:
-        shopify_integration = ShopifyIntegration(
-            shop_url=config['shopify_shop_url'],
-            access_token=config['shopify_access_token']
-        )
-    except Exception as e:
-        logger.error(f"Error initializing Shopify integration: {str(e)}")
+    Under gunicorn's ``preload_app`` the app is imported in the master, so a
+    scheduler built at import time would be created there, model cache
+    directory and job threads included, and copied into every forked worker.
+    A worker that inherits one anyway builds its own.
+    """
+    global forecast_scheduler, forecast_scheduler_pid
+    with forecast_scheduler_lock:
+        if forecast_scheduler is None or forecast_scheduler_pid != os.getpid():
+            forecast_scheduler = ForecastScheduler(storage, ML_FORECAST_DATASET, cache=ModelCache())
+            forecast_scheduler_pid = os.getpid()
+        return forecast_scheduler
 
-ML_FORECAST_FILE = 'inventory_forecast_results.csv'
-ALERT_WINDOW_DAYS = 7
+# Prophet and XGBoost load on first use; HOLOO_PREWARM=1 loads them at startup instead
+if os.environ.get('HOLOO_PREWARM', '0') == '1':
+    prewarm()
+
+# Seconds between syncs, and before retrying a failed one
+SYNC_INTERVAL = 3600
+SYNC_RETRY_INTERVAL = 300
+# Seconds between the sync loop's checks for a changed config
+CONFIG_POLL_INTERVAL = 10
+leader_lock = LeaderLock(os.path.join(storage.directory, LEADER_LOCK_FILE))
 
 def background_sync():
-    """Background task to sync orders periodically"""
-    if not shopify_integration:
-        return
-        
+    """Background task to sync orders periodically
+
+    Runs only in the process holding the leader lock, which is the single writer
+    of the order log. Every configured shop is synced concurrently, straight
+    away after a config change and every SYNC_INTERVAL seconds otherwise.
+    """
+    clients = ShopifyClientManager(config_service, storage)
+    synced_version = None
+    next_sync = 0
     while True:
-        try:
-            logger.info("Starting background sync with Shopify")
-            new_orders = shopify_integration.sync_orders(days=7)
-            logger.info(f"Synced {new_orders} new orders from Shopify")
-            time.sleep(3600)  # Sync every hour
-        except Exception as e:
-            logger.error(f"Error in background sync: {str(e)}")
-            time.sleep(300)  # Wait 5 minutes before retrying
+        config_service.refresh()
+        if config_service.version != synced_version:
+            synced_version = config_service.version
+            next_sync = 0
+        if time.time() >= next_sync:
+            try:
+                written, skus = clients.sync_all(days=7)
+                for shop_url, new_orders in written.items():
+                    logger.info(f"Synced {new_orders} new orders from Shopify shop {shop_url}")
+                if skus:
+                    # Re-forecast only the SKUs that received new orders
+                    get_forecast_scheduler().submit(skus, source='sync', reuse_running=False)
+                next_sync = time.time() + SYNC_INTERVAL
+            except Exception as e:
+                logger.error(f"Error in background sync: {str(e)}")
+                next_sync = time.time() + SYNC_RETRY_INTERVAL
+        time.sleep(CONFIG_POLL_INTERVAL)
+
+sync_leader_thread = None
+
+def start_sync_leader():
+    """Start a standby thread that runs background_sync once this process holds the leader lock"""
+    global sync_leader_thread
+    if sync_leader_thread is not None:
+        return
+    def run():
+        leader_lock.acquire()
+        background_sync()
+    sync_leader_thread = threading.Thread(target=run, name='sync-leader', daemon=True)
+    sync_leader_thread.start()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # A config saved by another worker takes effect here, within CONFIG_CHECK_INTERVAL
+    config_service.refresh()
+
+@app.after_request
+def record_request_time(response):
+    # Routes are labelled by their pattern so /api/forecast/jobs/<job_id> is one series
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
 
 def check_ml_alerts():
-    alerts = []
+    """Return stockout alerts within ALERT_WINDOW_DAYS from the cached alert index (refreshed by the caller)"""
     try:
-        if not os.path.exists(ML_FORECAST_FILE):
-            return alerts
-        df = pd.read_csv(ML_FORECAST_FILE)
-        today = pd.Timestamp(datetime.now().date())
-        # Check for each row if either model predicts stockout within ALERT_WINDOW_DAYS
-        for _, row in df.iterrows():
-            for model_col in ['Prophet_Estimated_Stockout_Date', 'XGB_Estimated_Stockout_Date']:
-                if pd.notnull(row[model_col]):
-                    try:
-                        stockout_date = pd.to_datetime(row[model_col])
-                        days_until_stockout = (stockout_date - today).days
-                        if 0 <= days_until_stockout <= ALERT_WINDOW_DAYS:
-                            alerts.append({
-                                'type': 'stockout',
-                                'title': 'Stockout Predicted',
-                                'message': f"{model_col.replace('_', ' ')} for SKU {row['SKU_ID']} is predicted on {stockout_date.strftime('%Y-%m-%d')} (in {days_until_stockout} days)",
-                                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            })
-                    except Exception as e:
-                        logger.error(f"Error parsing date for {model_col}: {str(e)}")
+        return alert_index.alerts(datetime.now().date(), ALERT_WINDOW_DAYS)
     except Exception as e:
         logger.error(f"Error checking ML alerts: {str(e)}")
-    return alerts
+        return []
 
 @app.route('/')
 def index():
     try:
         logger.info("Loading main page")
-        return render_template('index.html', shopify_enabled=config['shopify_enabled'])
+        return render_template('index.html', shopify_enabled=config_service.get()['shopify_enabled'])
     except Exception as e:
         logger.error(f"Error in index route: {str(e)}")
         return render_template('error.html', error=str(e))
@@ -108,7 +149,7 @@ def index():
 @app.route('/api/config', methods=['GET'])
 def get_config():
     try:
-        return jsonify(load_config())
+        return jsonify(config_service.get())
     except Exception as e:
         logger.error(f"Error getting config: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -117,22 +158,10 @@ def get_config():
 def update_config():
     try:
         new_config = request.json
-        save_config(new_config)
-        
-        # Reinitialize Shopify if enabled
-        global shopify_integration
-        if new_config['shopify_enabled'] and new_config['shopify_shop_url'] and new_config['shopify_access_token']:
-            try:
-                shopify_integration = ShopifyIntegration(
-                    shop_url=new_config['shopify_shop_url'],
-                    access_token=new_config['shopify_access_token']
-                )
-            except Exception as e:
-                logger.error(f"Error initializing Shopify integration: {str(e)}")
-                return jsonify({"error": "Failed to initialize Shopify integration"}), 500
-        else:
-            shopify_integration = None
-            
+        if not isinstance(new_config, dict):
+            return jsonify({"error": "Config must be a JSON object"}), 400
+        # Swapped in as a whole; Shopify clients and the other workers follow the new version
+        config_service.update(new_config)
         return jsonify({"status": "success"})
     except Exception as e:
         logger.error(f"Error updating config: {str(e)}")
@@ -141,39 +170,132 @@ def update_config():
 @app.route('/api/alerts', methods=['GET'])
 def get_alerts():
     try:
-        alerts = check_ml_alerts()
-        return jsonify(alerts)
+        # The alerts only change with the results file or the date
+        alert_index.refresh()
+        etag = alert_index.etag(datetime.now().date())
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+        response = jsonify(check_ml_alerts())
+        response.set_etag(etag)
+        return response
     except Exception as e:
         logger.error(f"Error getting alerts: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def _list_arg(name):
+    """Values of a query parameter given repeatedly and/or comma-separated, or None if absent"""
+    values = [value.strip() for arg in request.args.getlist(name) for value in arg.split(',') if value.strip()]
+    return values or None
+
+@app.route('/api/forecasts', methods=['GET'])
+def get_forecasts():
+    """One page of forecast results, filtered by ``sku`` and alert ``tier``; follow ``next_cursor`` for more"""
+    try:
+        source = request.args.get('dataset', 'inventory')
+        if source not in RESULT_DATASETS:
+            return jsonify({"error": f"dataset must be one of {', '.join(RESULT_DATASETS)}"}), 400
+        # Parsed here rather than with type=int, which falls back to the default on a malformed value
+        try:
+            limit = int(request.args.get('limit', PAGE_SIZE))
+        except ValueError:
+            limit = None
+        if limit is None or not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({"error": f"limit must be an integer between 1 and {MAX_PAGE_SIZE}"}), 400
+        tiers = _list_arg('tier')
+        if tiers is not None:
+            tiers = [tier.lower() for tier in tiers]
+            if not set(tiers) <= set(TIER_NAMES):
+                return jsonify({"error": f"tier must be one of {', '.join(TIER_NAMES)}"}), 400
+        dataset, sku_column = RESULT_DATASETS[source]
+        today = datetime.now().date()
+        # The inventory forecasts' tier is their earliest predicted stockout as of today
+        tier_of = lambda chunk: stockout_tiers(chunk, STOCKOUT_COLUMNS, today)
+        page = read_page(storage, dataset, sku_column, skus=_list_arg('sku'), tiers=tiers, tier_of=tier_of,
+                         cursor=request.args.get('cursor'), limit=limit)
+        return jsonify(page)
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error getting forecasts: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return app.response_class(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/sync-status', methods=['GET'])
 def get_sync_status():
-    if not shopify_integration:
-        return jsonify({
-            'enabled': False,
-            'last_sync': None,
-            'total_orders': 0
-        })
-        
     try:
-        if os.path.exists('input_data.csv'):
-            df = pd.read_csv('input_data.csv')
-            last_date = pd.to_datetime(df['date'].max())
+        clients = shopify_clients.clients()
+        if not clients:
             return jsonify({
-                'enabled': True,
-                'last_sync': last_date.strftime('%Y-%m-%d %H:%M:%S'),
-                'total_orders': len(df)
+                'enabled': False,
+                'last_sync': None,
+                'total_orders': 0
             })
+        
+        # Answered from the record kept up to date by sync_orders, without reading the history.
+        # The record covers the whole order history, so any shop's client can read it.
+        status = clients[0].sync_status()
+        last_date = status['max_date'] and pd.Timestamp(status['max_date']).strftime('%Y-%m-%d %H:%M:%S')
         return jsonify({
             'enabled': True,
-            'last_sync': None,
-            'total_orders': 0
+            'last_sync': last_date,
+            'total_orders': status['total_orders'],
+            'total_rows': status['total_rows'],
+            'last_sync_at': status['last_sync_at'],
+            'last_sync_duration': status['last_sync_duration'],
+            'last_sync_orders': status['last_sync_orders'],
+            'last_sync_rows': status['last_sync_rows'],
+            'last_backfill_at': status['last_backfill_at'],
+            'last_backfill_orders': status['last_backfill_orders'],
+            'last_backfill_rows': status['last_backfill_rows'],
+            'shops': [client.shop_url for client in clients]
         })
     except Exception as e:
         logger.error(f"Error getting sync status: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/forecast/run', methods=['POST'])
+def run_forecast():
+    try:
+        body = request.get_json(silent=True) or {}
+        skus = body.get('skus')
+        if skus is not None and (not isinstance(skus, list) or not skus):
+            return jsonify({"error": "skus must be a non-empty list"}), 400
+        job = get_forecast_scheduler().submit(skus)
+        return jsonify(job.to_dict()), 202
+    except Exception as e:
+        logger.error(f"Error starting forecast: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/forecast/jobs', methods=['GET'])
+def list_forecast_jobs():
+    return jsonify([job.to_dict() for job in get_forecast_scheduler().jobs()])
+
+@app.route('/api/forecast/jobs/<job_id>', methods=['GET'])
+def get_forecast_job(job_id):
+    job = get_forecast_scheduler().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/forecast/jobs/<job_id>/progress', methods=['GET'])
+def get_forecast_progress(job_id):
+    job = get_forecast_scheduler().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(dict(job.progress(), status=job.status))
+
+@app.route('/api/forecast/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_forecast_job(job_id):
+    job = get_forecast_scheduler().cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/api/upload-csv', methods=['POST'])
 def upload_csv():
     try:
@@ -184,8 +306,9 @@ def upload_csv():
             return jsonify({"error": "No file selected"}), 400
         if not file.filename.endswith('.csv'):
             return jsonify({"error": "File must be a CSV"}), 400
-        # Save the uploaded file as the ML forecast file
-        file.save(ML_FORECAST_FILE)
+        # Save the uploaded file as the ML forecast results
+        storage.write(ML_FORECAST_DATASET, pd.read_csv(file))
+        alert_index.reload()
         return jsonify({"status": "success"})
     except Exception as e:
         logger.error(f"Error uploading CSV: {str(e)}")
@@ -193,10 +316,8 @@ def upload_csv():
 
 if __name__ == '__main__':
     try:
-        # Start background sync thread only if Shopify is enabled
-        if shopify_integration:
-            sync_thread = threading.Thread(target=background_sync, daemon=True)
-            sync_thread.start()
+        # Development server; see gunicorn.conf.py for production serving
+        start_sync_leader()
         
         logger.info("Starting Flask application on port 5001")
         app.run(host='0.0.0.0', port=5001, debug=True)
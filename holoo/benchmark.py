@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from storage import get_storage
+from sku_partitions import SkuPartitions
+from inventory_forecast import (load_data, create_features, fit_prophet_model, fit_xgb_model, lag_history,
+                                per_sku_predictor, recursive_forecast, result_rows, DEFAULT_HORIZON)
+from stockout_engine import compute_stockouts
+from prophet_batch import predict_yhat, future_dates
+
+# "<skus>x<days>" scales run by default
+DEFAULT_SCALES = ['10x180', '100x365', '1000x730']
+# Prophet is timed on this many SKUs per scale; fitting every SKU would dominate the run
+PROPHET_SAMPLE = 5
+# Requests timed against /api/alerts after the first (index-building) one
+ALERT_REQUESTS = 50
+# Statements timed by --startup, each in a fresh interpreter; 'python' is the bare interpreter
+STARTUP_TARGETS = {
+    'python': 'pass',
+    'app': 'import app',
+    'inventory_forecast': 'import inventory_forecast',
+    'stockout_forecast': 'import stockout_forecast',
+    'prewarm': 'import warmup; warmup.prewarm()',
+}
+# Fresh interpreters started per startup target
+STARTUP_REPEATS = 5
+
+def generate_orders(n_skus, days, seasonality=0.3, intermittency=0.0, seed=0, start='2024-01-01'):
+    """Synthetic daily demand in the input_data format.
+
+    Each SKU gets a base rate drawn log-uniformly between 0.1 and 50 units a
+    day, modulated by weekly and yearly cycles of relative amplitude
+    ``seasonality``. ``intermittency`` is the probability a day has no sale;
+    such days are left out, as they are in a real order export. Inventory
+    runs down with sales and is restocked whenever it falls below two weeks
+    of demand.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=days)
+    t = np.arange(days)
+    cycle = 1 + seasonality * (np.sin(2 * np.pi * t / 7) + 0.5 * np.sin(2 * np.pi * t / 365.25))
+    rates = np.exp(rng.uniform(np.log(0.1), np.log(50), n_skus))
+    units = rng.poisson(np.maximum(rates[:, None] * cycle[None, :], 0))
+    sold = rng.random((n_skus, days)) >= intermittency
+    units = np.where(sold, units, 0)
+
+    restock = np.ceil(rates * 60).astype(np.int64)
+    inventory = np.empty_like(units)
+    level = restock.copy()
+    for day in range(days):
+        level = level - units[:, day]
+        low = level < rates * 14
+        level = np.where(low, level + restock, level)
+        inventory[:, day] = np.maximum(level, 0)
+
+    keep = sold | (units > 0)
+    sku_index, day_index = np.nonzero(keep)
+    df = pd.DataFrame({
+        'sku_id': np.char.add('SKU', np.char.zfill(sku_index.astype(str), 6)),
+        'date': dates[day_index].strftime('%Y-%m-%d'),
+        'units_sold': units[sku_index, day_index],
+        'inventory_level': inventory[sku_index, day_index],
+    })
+    # Exports are in date order
+    return df.iloc[np.argsort(day_index, kind='stable')].reset_index(drop=True)
+
+def parse_scale(scale):
+    n_skus, days = scale.lower().split('x')
+    return int(n_skus), int(days)
+
+def _timed(timings, name, function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    timings[name] = round(time.perf_counter() - started, 6)
+    return result
+
+def _alert_latency(storage):
+    """Time /api/alerts: the first request builds the alert index, the rest are served from it."""
+    import app
+    from alert_index import AlertIndex
+    app.alert_index = AlertIndex(storage, app.ML_FORECAST_DATASET, app.STOCKOUT_COLUMNS)
+    client = app.app.test_client()
+    started = time.perf_counter()
+    client.get('/api/alerts')
+    first = time.perf_counter() - started
+    latencies = []
+    for _ in range(ALERT_REQUESTS):
+        started = time.perf_counter()
+        client.get('/api/alerts')
+        latencies.append(time.perf_counter() - started)
+    return {
+        'first': round(first, 6),
+        'p50': round(float(np.percentile(latencies, 50)), 6),
+        'p95': round(float(np.percentile(latencies, 95)), 6),
+    }
+
+def run_scale(n_skus, days, horizon=DEFAULT_HORIZON, seasonality=0.3, intermittency=0.0, seed=0,
+              prophet_sample=PROPHET_SAMPLE, alerts=True):
+    """Run every pipeline stage once on synthetic data and return the timings in seconds."""
+    timings = {}
+    with tempfile.TemporaryDirectory(prefix='holoo-bench-') as directory:
+        orders = generate_orders(n_skus, days, seasonality, intermittency, seed)
+        storage = get_storage('csv', directory)
+        storage.write('input_data', orders)
+
+        df = _timed(timings, 'load', load_data, storage)
+        partitions = _timed(timings, 'partition', SkuPartitions, df)
+        skus = partitions.skus
+        _timed(timings, 'features', lambda: [create_features(partitions.get(sku)) for sku in skus])
+
+        sample = skus[:prophet_sample]
+        prophet_models = _timed(timings, 'prophet_fit', lambda: [fit_prophet_model(partitions.get(sku)) for sku in sample])
+        # Prophet's own predict, with its uncertainty sampling, against the batched yhat of the same models
+        _timed(timings, 'prophet_predict',
+               lambda: [model.predict(model.make_future_dataframe(periods=horizon, freq='D')) for model in prophet_models])
+        next_day = partitions.meta['last_date'].max() + pd.Timedelta(days=1)
+        _timed(timings, 'prophet_batch_predict', predict_yhat, prophet_models, future_dates(next_day, horizon))
+        timings['prophet_fit_predict'] = round(timings['prophet_fit'] + timings['prophet_predict'], 6)
+        timings['prophet_per_sku'] = round(timings['prophet_fit_predict'] / max(len(sample), 1), 6)
+
+        models = _timed(timings, 'xgb_fit', lambda: [fit_xgb_model(partitions.get(sku)) for sku in skus])
+        history = np.array([lag_history(partitions.get(sku)) for sku in skus])
+        start_dates = partitions.meta.loc[skus, 'last_date'].to_numpy()
+        dates, predictions = _timed(timings, 'recursive_predict', recursive_forecast,
+                                    per_sku_predictor(models), history, start_dates, horizon)
+
+        inventory = partitions.meta.loc[skus, 'last_inventory'].to_numpy(dtype=float)
+        _timed(timings, 'stockout', compute_stockouts, predictions, inventory, dates)
+
+        averages = predictions.mean(axis=1)
+        rows = result_rows(skus, inventory, horizon, [
+            ('Prophet', predictions, dates, averages),
+            ('XGB', predictions, dates, averages),
+        ])
+        _timed(timings, 'csv_write', storage.write, 'inventory_forecast_results', pd.DataFrame(rows))
+
+        if alerts:
+            timings['api_alerts'] = _alert_latency(storage)
+    return {'skus': n_skus, 'days': days, 'rows': len(orders), 'seconds': timings}
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def measure_startup(targets=STARTUP_TARGETS, repeats=STARTUP_REPEATS):
+    """Cold-start time of each statement in ``targets``, run in a new interpreter ``repeats`` times.
+
+    Times include starting the interpreter itself; subtract the 'python'
+    target for the cost of the imports alone. Returns the median and maximum
+    seconds per target.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for name, statement in targets.items():
+        times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, '-c', statement], cwd=directory, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - started)
+        results[name] = {'median': round(float(np.median(times)), 6), 'max': round(max(times), 6)}
+    return results
+
+def _report(options, **sections):
+    return {
+        'revision': _git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'options': options,
+        **sections,
+    }
+
+def run_benchmark(scales=DEFAULT_SCALES, **options):
+    """Benchmark each ``"<skus>x<days>"`` scale; returns a JSON-serializable report."""
+    return _report(options, scales=[run_scale(*parse_scale(scale), **options) for scale in scales])
+
+def run_startup_benchmark(repeats=STARTUP_REPEATS):
+    """Cold-start report of the web app and forecast entry points."""
+    return _report({'repeats': repeats}, startup=measure_startup(repeats=repeats))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time each stage of the forecasting pipeline on synthetic data.")
+    parser.add_argument('--scales', nargs='+', default=DEFAULT_SCALES, metavar='SKUSxDAYS',
+                        help="Scales to run, e.g. 100x365")
+    parser.add_argument('--seasonality', type=float, default=0.3,
+                        help="Relative amplitude of the weekly and yearly cycles")
+    parser.add_argument('--intermittency', type=float, default=0.0,
+                        help="Probability that a SKU has no sale on a given day")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the generator")
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON, help="Number of days to forecast")
+    parser.add_argument('--prophet-sample', type=int, default=PROPHET_SAMPLE,
+                        help="Number of SKUs Prophet is timed on per scale")
+    parser.add_argument('--no-alerts', dest='alerts', action='store_false',
+                        help="Skip timing the /api/alerts endpoint")
+    parser.add_argument('--startup', action='store_true',
+                        help="Only time the cold start of the web app and the forecast scripts")
+    parser.add_argument('--startup-repeats', type=int, default=STARTUP_REPEATS,
+                        help="Fresh interpreters started per entry point with --startup")
+    parser.add_argument('--output', metavar='FILE', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--write-data', metavar='FILE',
+                        help="Only write synthetic orders for the first scale to FILE and exit")
+    args = parser.parse_args()
+    if args.write_data:
+        n_skus, days = parse_scale(args.scales[0])
+        generate_orders(n_skus, days, args.seasonality, args.intermittency, args.seed).to_csv(args.write_data,
+                                                                                            index=False)
+    else:
+        if args.startup:
+            report = run_startup_benchmark(args.startup_repeats)
+        else:
+            report = run_benchmark(args.scales, horizon=args.horizon, seasonality=args.seasonality,
+                                   intermittency=args.intermittency, seed=args.seed,
+                                   prophet_sample=args.prophet_sample, alerts=args.alerts)
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output + '\n')
+        else:
+            print(output)
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from storage import atomic_write
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE = 'config.json'
+DEFAULT_CONFIG = {
+    'shopify_enabled': False,
+    'shopify_shop_url': '',
+    'shopify_access_token': '',
+    # Further shops synced alongside the one above: [{"shop_url": ..., "access_token": ...}]
+    'shopify_shops': []
+}
+# Seconds between checks of the config file for changes saved by other processes
+CONFIG_CHECK_INTERVAL = 1.0
+
+def shop_credentials(config):
+    """``(shop_url, access_token)`` of every shop to sync under ``config``; empty when Shopify is disabled"""
+    if not config.get('shopify_enabled'):
+        return []
+    shops = [{'shop_url': config.get('shopify_shop_url'), 'access_token': config.get('shopify_access_token')}]
+    shops.extend(config.get('shopify_shops') or [])
+    credentials = {}
+    for shop in shops:
+        if shop.get('shop_url') and shop.get('access_token'):
+            credentials[shop['shop_url']] = shop['access_token']
+    return list(credentials.items())
+
+class ConfigService:
+    """The app configuration, cached in memory and shared with other processes through a JSON file.
+
+    ``get()`` returns the current config without touching the disk. It is
+    replaced as a whole, never modified in place, so readers always see one
+    consistent version; ``version`` increases with every change. ``update()``
+    writes the file atomically, and ``refresh()`` picks up a file saved by
+    another worker process, checking its signature at most every
+    ``check_interval`` seconds.
+    """
+
+    def __init__(self, path=CONFIG_FILE, defaults=DEFAULT_CONFIG, check_interval=CONFIG_CHECK_INTERVAL):
+        self.path = path
+        self.defaults = defaults
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._config = dict(defaults)
+        self._signature = None
+        self._checked_at = None
+        self.version = 0
+        self.refresh(force=True)
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return dict(self.defaults, **json.load(f))
+        except FileNotFoundError:
+            return dict(self.defaults)
+        except Exception as e:
+            logger.error(f"Error loading config: {str(e)}")
+            return None
+
+    def get(self):
+        """The current config; treat it as read-only."""
+        return self._config
+
+    def refresh(self, force=False):
+        """Reload the file if another process saved it. Returns whether the config changed."""
+        now = time.monotonic()
+        if not force and self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        # Taken before reading, so a save that lands in between is picked up next time
+        signature = self._file_signature()
+        if not force and signature == self._signature:
+            return False
+        config = self._read()
+        with self._lock:
+            self._signature = signature
+            if config is None or config == self._config:
+                return False
+            self._config = config
+            self.version += 1
+        logger.info(f"Loaded config version {self.version}")
+        return True
+
+    def update(self, changes):
+        """Save ``changes`` over the current config and make the result current. Returns it."""
+        with self._lock:
+            config = dict(self._config, **changes)
+            def write(tmp_path):
+                with open(tmp_path, 'w') as f:
+                    json.dump(config, f)
+            atomic_write(self.path, write)
+            self._signature = self._file_signature()
+            self._config = config
+            self.version += 1
+        return config
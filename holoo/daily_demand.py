@@ -0,0 +1,196 @@
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from storage import get_storage, CHUNK_ROWS
+
+logger = logging.getLogger(__name__)
+
+# Columns of the order history the forecasters need; everything else in the export is skipped
+DEMAND_COLUMNS = ['sku_id', 'date', 'units_sold', 'inventory_level']
+# Partial aggregates are merged once they hold this many rows, to keep them bounded
+MERGE_ROWS = 1000000
+# Stock counted per SKU (sku_id, inventory_level, as_of), used to fill in missing inventory levels
+INVENTORY_SNAPSHOT = 'inventory_snapshot'
+
+class DemandCounter:
+    """Units sold per SKU and day, folded in from Shopify orders a page at a time.
+
+    Only the counters and the ids of the orders folded in are kept, so memory
+    follows the number of SKU-days rather than the number of line items.
+    Pages may be added from several fetch threads. An order seen twice (e.g.
+    updated while it was being fetched) counts once.
+    """
+
+    def __init__(self):
+        self._units = {}
+        self._lock = threading.Lock()
+        # Order date -> ids of the orders folded in, for the order log's dedup index
+        self.order_ids = {}
+        self.orders = 0
+
+    def add(self, orders, skip=None):
+        """Fold in a page of order dicts, leaving out orders for which ``skip(order_id)`` is true."""
+        with self._lock:
+            for order in orders:
+                day = datetime.fromisoformat(order['created_at']).date().isoformat()
+                ids = self.order_ids.setdefault(day, set())
+                if order['id'] in ids or (skip is not None and skip(order['id'])):
+                    continue
+                ids.add(order['id'])
+                self.orders += 1
+                for item in order.get('line_items', []):
+                    # Line items without a SKU cannot be forecast
+                    if item.get('sku'):
+                        key = (item['sku'], day)
+                        self._units[key] = self._units.get(key, 0) + int(item.get('quantity') or 0)
+
+    def __len__(self):
+        return len(self._units)
+
+    def skus(self):
+        return sorted({sku for sku, _ in self._units})
+
+    def to_frame(self):
+        """The counters as order history rows (``DEMAND_COLUMNS``), by date and SKU, with no inventory level."""
+        keys = sorted(self._units, key=lambda key: (key[1], key[0]))
+        return pd.DataFrame({
+            'sku_id': [sku for sku, _ in keys],
+            'date': [day for _, day in keys],
+            'units_sold': np.array([self._units[key] for key in keys], dtype=np.int64),
+            'inventory_level': np.nan,
+        }, columns=DEMAND_COLUMNS)
+
+def reconstruct_inventory(df, snapshot):
+    """Fill in the missing inventory levels of a daily demand table from a stock count and the sales around it.
+
+    ``snapshot`` holds each SKU's ``inventory_level`` counted at the end of day
+    ``as_of``. A day's closing level is the count plus the units sold after
+    that day up to ``as_of``, or minus the units sold after ``as_of`` up to
+    that day. Restocks are not known, so levels after the count do not go
+    below zero. Levels already in ``df`` and SKUs missing from the snapshot
+    are left as they are.
+    """
+    snapshot = snapshot.assign(sku_id=snapshot['sku_id'].astype(str)).drop_duplicates('sku_id', keep='last')
+    snapshot = snapshot.set_index('sku_id')
+    skus = df['sku_id'].astype(str)
+    dates = pd.to_datetime(df['date']).dt.normalize()
+    units = df['units_sold'].astype(np.int64)
+    counted = skus.map(snapshot['inventory_level']).astype(float)
+    as_of = pd.to_datetime(skus.map(snapshot['as_of'])).dt.normalize()
+    # Units sold by each SKU up to and including each row's day, and up to the count
+    order = pd.DataFrame({'sku': skus, 'date': dates}).sort_values(['sku', 'date'], kind='stable').index
+    sold_through = units.loc[order].groupby(skus.loc[order], sort=False).cumsum().reindex(df.index)
+    sold_through_count = units.where(dates <= as_of, 0).groupby(skus).transform('sum')
+    level = (counted + sold_through_count - sold_through).clip(lower=0)
+    return df['inventory_level'].fillna(level)
+
+def load_inventory_snapshot(storage):
+    """The saved inventory snapshot, or None if there is none."""
+    if not storage.exists(INVENTORY_SNAPSHOT):
+        return None
+    return storage.read(INVENTORY_SNAPSHOT)
+
+def save_inventory_snapshot(storage, levels, as_of):
+    """Save stock levels (SKU -> units on hand at the end of ``as_of``) as the inventory snapshot."""
+    snapshot = pd.DataFrame({
+        'sku_id': list(levels),
+        'inventory_level': list(levels.values()),
+        'as_of': pd.Timestamp(as_of).normalize(),
+    })
+    storage.write(INVENTORY_SNAPSHOT, snapshot)
+    logger.info(f"Saved inventory snapshot of {len(snapshot)} SKUs as of {pd.Timestamp(as_of).date()}")
+    return snapshot
+
+def aggregate_chunk(chunk, offset):
+    """Reduce a chunk of line items to one row per SKU and day.
+
+    Units are summed and the last inventory level reported that day is kept.
+    ``first_row`` records the position of the group's first line item in the
+    whole history (``offset`` is the chunk's starting position), so the final
+    table can be put back in file order.
+    """
+    chunk = pd.DataFrame({
+        'sku_id': chunk['sku_id'].astype('category'),
+        'date': pd.to_datetime(chunk['date']).dt.normalize(),
+        'units_sold': pd.to_numeric(chunk['units_sold'], errors='coerce').fillna(0).astype(np.int32),
+        'inventory_level': pd.to_numeric(chunk['inventory_level'], errors='coerce'),
+        'first_row': np.arange(offset, offset + len(chunk), dtype=np.int64),
+    })
+    return merge_partials([chunk])
+
+def merge_partials(partials):
+    """Combine per-chunk aggregates; later chunks win for the inventory level."""
+    df = pd.concat(partials, ignore_index=True)
+    if len(partials) > 1:
+        # Chunks carry their own categories; union them so the groupby key stays categorical
+        skus = [partial['sku_id'] for partial in partials]
+        try:
+            df['sku_id'] = pd.api.types.union_categoricals(skus, ignore_order=True)
+        except TypeError:
+            # Numeric ids in one chunk and text in another
+            df['sku_id'] = pd.api.types.union_categoricals(
+                [sku.cat.rename_categories(sku.cat.categories.astype(str)) for sku in skus], ignore_order=True)
+    grouped = df.groupby(['sku_id', 'date'], observed=True, sort=False)
+    return grouped.agg(
+        units_sold=('units_sold', 'sum'),
+        inventory_level=('inventory_level', 'last'),
+        first_row=('first_row', 'min'),
+    ).reset_index()
+
+def _stream_daily_demand(storage, dataset, chunksize):
+    partials = []
+    partial_rows = 0
+    offset = 0
+    for chunk in storage.read_chunks(dataset, columns=DEMAND_COLUMNS, chunksize=chunksize):
+        chunk = chunk[chunk['sku_id'].notna()]
+        partial = aggregate_chunk(chunk, offset)
+        offset += len(chunk)
+        partials.append(partial)
+        partial_rows += len(partial)
+        if partial_rows > MERGE_ROWS and len(partials) > 1:
+            partials = [merge_partials(partials)]
+            partial_rows = len(partials[0])
+    if not partials:
+        return pd.DataFrame(columns=DEMAND_COLUMNS), offset
+    return merge_partials(partials), offset
+
+def load_daily_demand(storage=None, dataset='input_data', chunksize=CHUNK_ROWS):
+    """Stream the order history into a compact daily demand table.
+
+    The history is read ``chunksize`` rows at a time, decoding only the
+    demand columns, and line items are summed into one row per SKU and day as
+    they arrive, so memory grows with the number of SKU-days rather than the
+    number of line items. Rows come back in order of first appearance in the
+    history, with a categorical ``sku_id``, int32 ``units_sold``, dates
+    normalized to midnight, and the inventory as int32 when it is whole and has
+    no gaps. Missing inventory levels are reconstructed from the saved
+    inventory snapshot, if there is one (see reconstruct_inventory).
+    """
+    storage = storage or get_storage()
+    for attempt in range(3):
+        try:
+            df, line_items = _stream_daily_demand(storage, dataset, chunksize)
+            break
+        except FileNotFoundError:
+            # A compaction replaced segments mid-stream; start over from the new manifest
+            if attempt == 2 or not storage.is_partitioned(dataset):
+                raise
+    if df.empty:
+        return df
+    df = df.sort_values('first_row', kind='stable').drop(columns='first_row').reset_index(drop=True)
+    df['sku_id'] = df['sku_id'].cat.remove_unused_categories()
+    df['units_sold'] = df['units_sold'].astype(np.int32)
+    if df['inventory_level'].isna().any():
+        # Synced orders carry no inventory level; derive it from the last stock count
+        snapshot = load_inventory_snapshot(storage)
+        if snapshot is not None:
+            df['inventory_level'] = reconstruct_inventory(df, snapshot)
+    inventory = df['inventory_level']
+    whole = inventory.notna().all() and (inventory % 1 == 0).all()
+    df['inventory_level'] = inventory.astype(np.int32) if whole else inventory.astype(np.float32)
+    logger.info(f"Aggregated {line_items} line items into {len(df)} SKU-days")
+    return df[DEMAND_COLUMNS]
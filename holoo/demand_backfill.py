@@ -0,0 +1,125 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from storage import get_storage, atomic_write
+from config_service import ConfigService, CONFIG_FILE, DEFAULT_CONFIG
+from shopify_integration import ShopifyClientManager
+from daily_demand import save_inventory_snapshot
+from leader import LeaderLock, LEADER_LOCK_FILE
+
+logger = logging.getLogger(__name__)
+
+# Days of orders fetched, counted and saved per backfill step
+BACKFILL_WINDOW_DAYS = 30
+# Per-shop backfill progress, kept next to the order history
+BACKFILL_STATE_FILE = 'demand_backfill.json'
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+def _load_state(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def backfill_demand(client, since, until=None, window_days=BACKFILL_WINDOW_DAYS):
+    """Load the daily demand of every order created from ``since`` to ``until`` into the order history.
+
+    Orders are fetched by creation date, ``window_days`` at a time. Each
+    window's pages are folded into a DemandCounter as they arrive, its daily
+    totals are appended to the order log, and then the window is checkpointed,
+    so memory holds one window's SKU-days. Orders already in the history, e.g.
+    from syncs, are skipped. Run again with the same ``since`` (and ``until``,
+    if one was given), a backfill continues after its last checkpointed
+    window. Returns the number of rows written.
+    """
+    state_path = os.path.join(client.storage.directory, BACKFILL_STATE_FILE)
+    state = _load_state(state_path).get(client.shop_url)
+    resumed = (state is not None and state['since'] == since.isoformat()
+               and (until is None or state['until'] == until.isoformat()))
+    if resumed:
+        until = datetime.fromisoformat(state['until'])
+        start = datetime.fromisoformat(state['done_until'])
+        logger.info(f"Resuming backfill of {client.shop_url} from {start.date()}")
+    else:
+        until = until or datetime.now(timezone.utc)
+        start = since
+    written = 0
+    while start < until:
+        end = min(start + timedelta(days=window_days), until)
+        counter = client.fetch_demand(start, end, skip=lambda order_id: order_id in client.order_log,
+                                      field='created_at')
+        df = counter.to_frame()
+        rows = client.save_orders_to_csv(df, counter.order_ids) if not df.empty else 0
+        written += rows
+        # Kept apart from the sync stats, which describe the last incremental sync
+        client.record_backfill(datetime.now(timezone.utc), counter.orders, rows)
+        # Checkpoint: the window's totals are committed to the order log
+        states = _load_state(state_path)
+        states[client.shop_url] = {'since': since.isoformat(), 'until': until.isoformat(), 'done_until': end.isoformat()}
+        atomic_write(state_path, lambda tmp_path: _write_json(tmp_path, states))
+        logger.info(f"Backfilled {client.shop_url} up to {end.date()}: {counter.orders} orders, {rows} SKU-days")
+        start = end
+    return written
+
+def _utc_date(value):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+def main(since, until=None, window_days=BACKFILL_WINDOW_DAYS, inventory=False, inventory_file=None):
+    storage = get_storage()
+    # The order log has a single writer: hold the same lock as the app's sync leader
+    leader_lock = LeaderLock(os.path.join(storage.directory, LEADER_LOCK_FILE))
+    if not leader_lock.acquire(blocking=False):
+        print(f"Error: process {leader_lock.holder()} is syncing the order history; stop it before backfilling")
+        return 1
+    try:
+        clients = ShopifyClientManager(ConfigService(CONFIG_FILE, DEFAULT_CONFIG), storage)
+        shops = clients.clients()
+        if not shops:
+            print("Error: Shopify is not configured")
+            return 1
+        for client in shops:
+            written = backfill_demand(client, since, until, window_days)
+            print(f"Backfilled {written} SKU-days from {client.shop_url}")
+
+        # Stock counted now; the inventory history is reconstructed from it when the demand is loaded
+        levels = None
+        if inventory_file:
+            snapshot = pd.read_csv(inventory_file)
+            levels = dict(zip(snapshot['sku_id'], snapshot['inventory_level']))
+        elif inventory:
+            levels = {}
+            for client in shops:
+                for sku, units in client.fetch_inventory_levels().items():
+                    levels[sku] = levels.get(sku, 0) + units
+        if levels is not None:
+            save_inventory_snapshot(storage, levels, datetime.now().date())
+            print(f"Saved inventory snapshot of {len(levels)} SKUs")
+        clients.close()
+        return 0
+    finally:
+        leader_lock.release()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Backfill the daily demand history from Shopify orders.")
+    parser.add_argument('--since', type=_utc_date, required=True, help="First order date to load (YYYY-MM-DD)")
+    parser.add_argument('--until', type=_utc_date,
+                        help="Load orders created before this date (default: now, or the interrupted run's end)")
+    parser.add_argument('--window-days', type=int, default=BACKFILL_WINDOW_DAYS,
+                        help="Days of orders fetched and saved per checkpoint")
+    parser.add_argument('--inventory', action='store_true',
+                        help="Save the stock levels on Shopify now as the inventory snapshot")
+    parser.add_argument('--inventory-file', metavar='FILE',
+                        help="Save the stock levels in FILE (sku_id,inventory_level CSV) as the inventory snapshot")
+    args = parser.parse_args()
+    sys.exit(main(args.since, args.until, args.window_days, args.inventory, args.inventory_file))
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+# Days of history the fast forecasters look at
+FAST_WINDOW = 56
+# Smoothing constant shared by SES and Croston
+FAST_ALPHA = 0.1
+# Average demand interval (days per non-zero day) above which demand counts as
+# intermittent and is forecast with Croston (Syntetos-Boylan cut-off)
+INTERMITTENT_ADI = 1.32
+
+def demand_matrix(partitions, skus, window=FAST_WINDOW):
+    """Daily units sold for ``skus`` as an ``(n_skus, window)`` matrix, oldest day first.
+
+    Each row is right-aligned on that SKU's last recorded date; days without
+    rows count as zero sales. Also returns the number of trailing columns that
+    fall within each SKU's history, so days before its first sale are ignored.
+    """
+    skus = list(skus)
+    df = partitions.df
+    df = df[df['sku_id'].isin(skus)]
+    codes = pd.Categorical(df['sku_id'], categories=skus).codes
+    meta = partitions.meta.loc[skus]
+    last_dates = meta['last_date'].to_numpy().astype('datetime64[D]')
+    first_dates = meta['first_date'].to_numpy().astype('datetime64[D]')
+    offsets = (last_dates[codes] - df['date'].to_numpy().astype('datetime64[D]')).astype(np.int64)
+    keep = offsets < window
+    demand = np.zeros((len(skus), window))
+    units = df['units_sold'].fillna(0).to_numpy(dtype=float)
+    np.add.at(demand, (codes[keep], window - 1 - offsets[keep]), units[keep])
+    observed = np.minimum((last_dates - first_dates).astype(np.int64) + 1, window)
+    return demand, observed
+
+def ses(demand, observed, alpha=FAST_ALPHA):
+    """Simple exponential smoothing of every row at once; returns the final level per row."""
+    n_skus, window = demand.shape
+    start = window - observed
+    level = np.zeros(n_skus)
+    for t in range(window):
+        x = demand[:, t]
+        level = np.where(t == start, x, np.where(t > start, level + alpha * (x - level), level))
+    return level
+
+def croston(demand, observed, alpha=FAST_ALPHA):
+    """Croston's method with the Syntetos-Boylan bias correction, for every row at once.
+
+    Demand sizes and the intervals between non-zero days are smoothed
+    separately; the forecast daily rate is their (corrected) ratio.
+    """
+    n_skus, window = demand.shape
+    start = window - observed
+    size = np.zeros(n_skus)
+    interval = np.zeros(n_skus)
+    since = np.ones(n_skus)
+    seen = np.zeros(n_skus, dtype=bool)
+    for t in range(window):
+        x = demand[:, t]
+        active = t >= start
+        hit = active & (x > 0)
+        first = hit & ~seen
+        update = hit & seen
+        size = np.where(first, x, np.where(update, size + alpha * (x - size), size))
+        interval = np.where(first, since, np.where(update, interval + alpha * (since - interval), interval))
+        since = np.where(hit, 1, np.where(active, since + 1, since))
+        seen |= hit
+    rate = np.zeros(n_skus)
+    rate[seen] = (1 - alpha / 2) * size[seen] / interval[seen]
+    return rate
+
+def average_daily_units(demand, observed):
+    return demand.sum(axis=1) / np.maximum(observed, 1)
+
+def fast_forecast(demand, observed, horizon):
+    """Forecast ``horizon`` days for every row of ``demand``.
+
+    Intermittent rows are forecast with Croston, the rest with SES. Returns the
+    ``(n_skus, horizon)`` forecast and the method used per row.
+    """
+    nonzero_days = (demand > 0).sum(axis=1)
+    intermittent = observed > INTERMITTENT_ADI * nonzero_days
+    rate = np.where(intermittent, croston(demand, observed), ses(demand, observed))
+    methods = np.where(intermittent, 'croston', 'ses')
+    return np.repeat(rate[:, None], horizon, axis=1), methods
@@ -0,0 +1,162 @@
+import glob
+import logging
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Calendar features of each day
+CALENDAR_FEATURES = ['dayofweek', 'month', 'day']
+# Sales this many observations back within the SKU
+LAGS = [1, 7]
+# Observations covered by the rolling mean and standard deviation of past sales
+ROLLING_WINDOWS = [7, 28]
+FEATURE_COLUMNS = (CALENDAR_FEATURES + [f'lag{lag}' for lag in LAGS]
+                   + [f'rolling_mean{window}' for window in ROLLING_WINDOWS]
+                   + [f'rolling_std{window}' for window in ROLLING_WINDOWS])
+# Rows of earlier history the lag and rolling features of a day look back on
+CONTEXT_ROWS = max(LAGS + ROLLING_WINDOWS)
+# Directory, under the data directory, of the feature store
+FEATURE_DATASET = 'features'
+# The feature store is rewritten as a single segment once it has more than this many
+MAX_SEGMENTS = 30
+
+def calendar(dates):
+    """``dayofweek``, ``month`` and ``day`` of a date array of any shape, as the pandas ``.dt`` accessors give them."""
+    days = np.asarray(dates, dtype='datetime64[D]')
+    months = days.astype('datetime64[M]')
+    return {
+        # 1970-01-01 was a Thursday (dayofweek 3)
+        'dayofweek': (days.astype(np.int64) + 3) % 7,
+        'month': months.astype(np.int64) % 12 + 1,
+        'day': (days - months).astype(np.int64) + 1,
+    }
+
+def block_starts(sku_values):
+    """Position of the first row of each row's SKU block in a history sorted by SKU."""
+    n = len(sku_values)
+    if not n:
+        return np.array([], dtype=np.int64)
+    change = np.concatenate(([True], sku_values[1:] != sku_values[:-1]))
+    return np.maximum.accumulate(np.where(change, np.arange(n), 0))
+
+def build_features(df):
+    """Features of every row of a history sorted by SKU and date (like ``SkuPartitions.df``).
+
+    Lags and rolling statistics only look at earlier rows of the same SKU:
+    ``lag<n>`` is the sale ``n`` observations back and ``rolling_mean<w>`` /
+    ``rolling_std<w>`` (sample standard deviation) cover the ``w`` observations
+    before the row. All SKUs are done at once with positional arithmetic over
+    their contiguous blocks and running sums. Values with too little history
+    are 0, as in ``create_features``. Returns a frame on ``df``'s index.
+    """
+    units = df['units_sold'].to_numpy(dtype=float)
+    n = len(units)
+    rows = np.arange(n)
+    starts = block_starts(df['sku_id'].to_numpy())
+    columns = calendar(df['date'].to_numpy())
+    for lag in LAGS:
+        source = rows - lag
+        valid = source >= starts
+        columns[f'lag{lag}'] = np.where(valid, units[np.where(valid, source, 0)], 0.0)
+    # Running sums are exact for whole unit counts, so window sums do not drift
+    sums = np.concatenate(([0.0], np.cumsum(units)))
+    squares = np.concatenate(([0.0], np.cumsum(units * units)))
+    for window in ROLLING_WINDOWS:
+        lower = np.maximum(starts, rows - window)
+        count = rows - lower
+        total = sums[rows] - sums[lower]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns[f'rolling_mean{window}'] = np.where(count > 0, total / count, 0.0)
+            variance = (squares[rows] - squares[lower] - total * total / count) / (count - 1)
+        columns[f'rolling_std{window}'] = np.where(count > 1, np.sqrt(np.maximum(variance, 0.0)), 0.0)
+    return pd.DataFrame(columns, index=df.index)[FEATURE_COLUMNS]
+
+class FeatureStore:
+    """Features of the daily demand history, persisted so a run only computes features for new days.
+
+    The store is a directory of segment files in the storage backend's format.
+    Each update writes one segment holding the rows it computed, and for the
+    same SKU and day a later segment overrides an earlier one. Stored rows are
+    reused while the SKU's history up to them is unchanged (same units at the
+    same position); from the first new or changed row of a SKU on, features
+    are recomputed with ``CONTEXT_ROWS`` of earlier history to look back on.
+    """
+
+    def __init__(self, storage, dataset=FEATURE_DATASET):
+        self.storage = storage
+        self.dataset = dataset
+        self.root = storage.dataset_dir(dataset)
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.root, '*' + self.storage.extension)))
+
+    def _load(self):
+        frames = [self.storage.read_file(path, self.dataset) for path in self._segments()]
+        if not frames:
+            return None
+        stored = pd.concat(frames, ignore_index=True)
+        stored['sku_id'] = stored['sku_id'].astype(str)
+        stored['date'] = pd.to_datetime(stored['date']).astype('datetime64[ns]')
+        return stored.drop_duplicates(['sku_id', 'date'], keep='last')
+
+    def _write(self, rows):
+        os.makedirs(self.root, exist_ok=True)
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}{self.storage.extension}"
+        self.storage.write_file(os.path.join(self.root, name), self.dataset, rows)
+
+    def _compact(self):
+        segments = self._segments()
+        if len(segments) <= MAX_SEGMENTS:
+            return
+        # The merged segment sorts after the ones it replaces, so a crash before they are removed is harmless
+        self._write(self._load())
+        for path in segments:
+            os.remove(path)
+        logger.info(f"Compacted {len(segments)} feature segments in {self.root}")
+
+    @timed('features')
+    def features_for(self, df):
+        """Features of ``df`` (sorted by SKU and date), as ``build_features`` would compute them.
+
+        Rows already in the store are read back; the rest are computed and
+        added to the store.
+        """
+        keys = pd.DataFrame({
+            'sku_id': df['sku_id'].astype(str).to_numpy(),
+            'date': pd.to_datetime(df['date']).to_numpy(dtype='datetime64[ns]'),
+            'units_sold': df['units_sold'].to_numpy(dtype=float),
+        })
+        starts = block_starts(keys['sku_id'].to_numpy())
+        keys['position'] = np.arange(len(keys)) - starts
+        stored = self._load()
+        if stored is None:
+            reusable = np.zeros(len(keys), dtype=bool)
+            merged = keys
+        else:
+            merged = keys.merge(stored, on=['sku_id', 'date'], how='left', suffixes=('', '_stored'))
+            reusable = ((merged['units_sold_stored'].to_numpy() == keys['units_sold'].to_numpy())
+                        & (merged['position_stored'].to_numpy() == keys['position'].to_numpy()))
+        # A row is recomputed from the first row of its SKU that cannot be reused
+        first_stale = np.where(reusable, len(keys), np.arange(len(keys)))
+        first_stale = pd.Series(first_stale).groupby(starts).transform('min').to_numpy()
+        stale = np.arange(len(keys)) >= first_stale
+        result = pd.DataFrame(index=df.index, columns=FEATURE_COLUMNS, dtype=float)
+        if (~stale).any():
+            result.iloc[np.flatnonzero(~stale)] = merged.loc[~stale, FEATURE_COLUMNS].to_numpy(dtype=float)
+        if stale.any():
+            context = (first_stale < len(keys)) & (np.arange(len(keys)) >= np.maximum(first_stale - CONTEXT_ROWS, starts))
+            computed = build_features(df.iloc[np.flatnonzero(context)])
+            computed = computed[stale[context]]
+            result.iloc[np.flatnonzero(stale)] = computed.to_numpy(dtype=float)
+            new_rows = keys[stale].reset_index(drop=True)
+            self._write(pd.concat([new_rows, computed.reset_index(drop=True)], axis=1))
+            self._compact()
+        logger.info(f"Feature store: reused {int((~stale).sum())} rows, computed {int(stale.sum())}")
+        return result
@@ -0,0 +1,300 @@
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from inventory_forecast import load_data, run_forecasts, DEFAULT_CHUNK_SIZE, DEFAULT_HORIZON, NO_STOCKOUT
+from sku_partitions import SkuPartitions
+from storage import atomic_write
+from leader import file_lock
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Forecast jobs allowed to run at the same time
+JOB_WORKERS = 1
+# Finished jobs kept for the status endpoints
+MAX_FINISHED_JOBS = 100
+# Job records shared by every worker process, and the lock serializing their updates, in the data directory
+JOBS_FILE = 'forecast_jobs.json'
+JOBS_LOCK_FILE = 'forecast_jobs.lock'
+# Held while a job merges its rows into the results, which jobs in several processes may do at once
+RESULTS_LOCK_FILE = 'forecast_results.lock'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    pass
+
+class ForecastJob:
+    """One forecast run over all SKUs (``skus=None``) or a subset.
+
+    ``owner`` is the pid of the process that runs the job. Cancelling sets
+    ``cancel_requested``, which the owner checks after every chunk.
+    """
+
+    def __init__(self, skus=None, source='api'):
+        self.id = uuid.uuid4().hex[:12]
+        # SKU ids are kept as strings, as they arrive from the API and are stored in the job records
+        self.skus = None if skus is None else {str(sku) for sku in skus}
+        self.sources = [source]
+        self.status = QUEUED
+        self.done = 0
+        self.total = None
+        self.failures = 0
+        self.error = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.owner = os.getpid()
+        self.cancel_requested = False
+
+    def covers(self, skus):
+        """Whether this job forecasts every SKU in ``skus`` (None meaning all SKUs)."""
+        if self.skus is None:
+            return True
+        return skus is not None and {str(sku) for sku in skus} <= self.skus
+
+    def progress(self):
+        percent = round(100.0 * self.done / self.total, 1) if self.total else (100.0 if self.status == SUCCEEDED else 0.0)
+        return {'done': self.done, 'total': self.total, 'percent': percent}
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'skus': None if self.skus is None else sorted(self.skus),
+            'sources': self.sources,
+            'progress': self.progress(),
+            'failures': self.failures,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at and self.started_at.isoformat(),
+            'finished_at': self.finished_at and self.finished_at.isoformat(),
+        }
+
+    def to_record(self):
+        return dict(self.to_dict(), done=self.done, total=self.total, owner=self.owner,
+                    cancel_requested=self.cancel_requested)
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls(record['skus'])
+        job.id = record['id']
+        job.sources = record['sources']
+        job.status = record['status']
+        job.done = record['done']
+        job.total = record['total']
+        job.failures = record['failures']
+        job.error = record['error']
+        job.created_at = datetime.fromisoformat(record['created_at'])
+        job.started_at = record['started_at'] and datetime.fromisoformat(record['started_at'])
+        job.finished_at = record['finished_at'] and datetime.fromisoformat(record['finished_at'])
+        job.owner = record['owner']
+        job.cancel_requested = record['cancel_requested']
+        return job
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+class JobStore:
+    """Forecast job records in one JSON file, shared by every worker process.
+
+    Changes are read-modify-write under an exclusive ``flock`` and land with an
+    atomic rename, so reads need no lock. An unfinished job whose owner process
+    has exited is reported as failed.
+    """
+
+    def __init__(self, path, lock_path):
+        self.path = path
+        self.lock_path = lock_path
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                records = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        jobs = {}
+        for record in records:
+            job = ForecastJob.from_record(record)
+            if job.status not in FINISHED and not _alive(job.owner):
+                job.status = FAILED
+                job.error = f"Worker process {job.owner} exited before the job finished"
+                job.finished_at = job.finished_at or datetime.now()
+            jobs[job.id] = job
+        return jobs
+
+    @contextmanager
+    def update(self):
+        """Yield the jobs by id; changes made to them (and to the dict) are saved when the block ends."""
+        with file_lock(self.lock_path):
+            jobs = self.load()
+            yield jobs
+            records = [job.to_record() for job in jobs.values()]
+            atomic_write(self.path, lambda tmp_path: _write_json(tmp_path, records))
+
+def merge_results(existing, results, skus):
+    """Replace the rows of ``skus`` in an existing results frame, keeping every other SKU."""
+    if existing is None or existing.empty:
+        return results
+    replaced = existing['SKU_ID'].astype(str).isin({str(sku) for sku in skus})
+    # Storage parses the stockout dates on read; write them back the way run_forecasts produces them
+    existing = existing.assign(**{
+        column: existing[column].dt.strftime('%Y-%m-%d').fillna(NO_STOCKOUT)
+        for column in existing.select_dtypes('datetime').columns
+    })
+    return pd.concat([existing[~replaced], results], ignore_index=True)
+
+class ForecastScheduler:
+    """Runs inventory forecasts in the background on a bounded pool of job threads.
+
+    A request that is already covered by a queued job is merged into it instead
+    of starting another run, and an identical request for a running job returns
+    that job. Jobs over a subset of SKUs update only those SKUs' rows in the
+    results dataset; a file lock serializes the read-merge-write of the results.
+    Job records live in a JobStore in the data directory, so every worker
+    process can list, poll and cancel a job, whichever process runs it.
+    """
+
+    def __init__(self, storage, dataset='inventory_forecast_results', workers=JOB_WORKERS,
+                 forecast_workers=1, chunk_size=DEFAULT_CHUNK_SIZE, horizon=DEFAULT_HORIZON, cache=None):
+        self.storage = storage
+        self.dataset = dataset
+        self.forecast_workers = forecast_workers
+        self.chunk_size = chunk_size
+        self.horizon = horizon
+        self.cache = cache
+        self.store = JobStore(os.path.join(storage.directory, JOBS_FILE),
+                              os.path.join(storage.directory, JOBS_LOCK_FILE))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='forecast-job')
+
+    def submit(self, skus=None, source='api', reuse_running=True):
+        """Queue a forecast of ``skus`` (all SKUs if None) and return its job.
+
+        ``reuse_running=False`` is for callers whose data is newer than any
+        running job, such as a sync that just wrote new orders.
+        """
+        wanted = None if skus is None else {str(sku) for sku in skus}
+        with self.store.update() as jobs:
+            for job in jobs.values():
+                if job.status == QUEUED:
+                    # Not started yet, so it will see the same data: widen it to cover this request
+                    if not job.covers(wanted):
+                        job.skus = None if wanted is None else job.skus | wanted
+                    if source not in job.sources:
+                        job.sources.append(source)
+                    return job
+            if reuse_running:
+                for job in jobs.values():
+                    if job.status == RUNNING and job.skus == wanted:
+                        return job
+            job = ForecastJob(wanted, source)
+            jobs[job.id] = job
+            self._prune(jobs)
+        self._executor.submit(self._run, job.id)
+        logger.info(f"Queued forecast job {job.id} ({'all' if skus is None else len(job.skus)} SKUs, {source})")
+        return job
+
+    def get(self, job_id):
+        return self.store.load().get(job_id)
+
+    def jobs(self):
+        return sorted(self.store.load().values(), key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id):
+        """Request cancellation; a running job stops after its current chunk. Returns the job or None."""
+        with self.store.update() as jobs:
+            job = jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return job
+            job.cancel_requested = True
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = datetime.now()
+            return job
+
+    def _prune(self, jobs):
+        finished = sorted((job for job in jobs.values() if job.status in FINISHED),
+                          key=lambda job: job.finished_at)
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del jobs[job.id]
+
+    def _update(self, job_id, **fields):
+        """Set fields of a job's record and return the job, or None if it is gone."""
+        with self.store.update() as jobs:
+            job = jobs.get(job_id)
+            if job is not None:
+                for name, value in fields.items():
+                    setattr(job, name, value)
+            return job
+
+    @timed('forecast_job')
+    def _run(self, job_id):
+        with self.store.update() as jobs:
+            job = jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return
+            job.status = RUNNING
+            job.started_at = datetime.now()
+        status, error, failed = CANCELLED, None, 0
+        try:
+            partitions = SkuPartitions(load_data(self.storage))
+            skus = partitions.skus
+            if job.skus is not None:
+                # Requested ids arrive as JSON strings while the history may hold numeric SKUs
+                skus = [sku for sku in skus if str(sku) in job.skus]
+            self._update(job_id, total=len(skus))
+
+            def progress(done, total):
+                current = self._update(job_id, done=done)
+                if current is None or current.cancel_requested:
+                    raise JobCancelled()
+
+            results, failures = run_forecasts(partitions, skus, workers=self.forecast_workers,
+                                              chunk_size=self.chunk_size, horizon=self.horizon,
+                                              cache=self.cache, progress=progress)
+            failed = len(failures)
+            for failure in failures:
+                logger.warning(f"Forecast job {job_id}: SKU {failure['SKU_ID']} failed: {failure['Error']}")
+            self._save(job, pd.DataFrame(results))
+            status = SUCCEEDED
+        except JobCancelled:
+            status = CANCELLED
+        except Exception as e:
+            logger.error(f"Forecast job {job_id} failed: {str(e)}")
+            status, error = FAILED, str(e)
+        finally:
+            self._update(job_id, status=status, error=error, failures=failed, finished_at=datetime.now())
+            logger.info(f"Forecast job {job_id} {status}")
+
+    def _save(self, job, results):
+        with file_lock(os.path.join(self.storage.directory, RESULTS_LOCK_FILE)):
+            if job.skus is None:
+                self.storage.write(self.dataset, results)
+                return
+            if results.empty:
+                return
+            existing = self.storage.read(self.dataset) if self.storage.exists(self.dataset) else None
+            # SKUs that failed this time keep their previous forecast
+            self.storage.write(self.dataset, merge_results(existing, results, results['SKU_ID']))
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from stockout_engine import alert_tiers, ALERT_TIERS, ALERT_OK, ALERT_NONE
+
+logger = logging.getLogger(__name__)
+
+# Result rows buffered before they are written out as a batch and checkpointed
+RESULT_BATCH_ROWS = 500
+# Suffix of the directory holding an unfinished run's batches
+PARTIAL_SUFFIX = '.partial'
+CHECKPOINT_FILE = '_checkpoint.jsonl'
+
+# Rows per page of results unless fewer are asked for, and the most a page may hold
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Rows decoded at a time while scanning the results for a page
+PAGE_CHUNK_ROWS = 10000
+# Short names of the alert tiers, used to filter results
+TIER_NAMES = dict(zip(['critical', 'urgent', 'warning'], [alert for _, alert in ALERT_TIERS]),
+                  ok=ALERT_OK, none=ALERT_NONE)
+
+class ResultWriter:
+    """Forecast results written to disk in batches as they are produced, so a crashed run can resume.
+
+    Rows are buffered and every ``batch_rows`` written as a batch file in a
+    ``<dataset>.partial`` directory; the keys those rows complete (SKUs, or
+    backtest dates) are then appended to a checkpoint. ``finish()`` joins the
+    batches into the dataset in order and removes the directory. With
+    ``resume`` the checkpointed batches of an unfinished run are kept and
+    ``completed`` holds the keys the run can skip; otherwise they are discarded.
+    """
+
+    def __init__(self, storage, dataset, key_column, resume=False, batch_rows=RESULT_BATCH_ROWS):
+        self.storage = storage
+        self.dataset = dataset
+        self.key_column = key_column
+        self.batch_rows = batch_rows
+        self.root = storage.dataset_dir(dataset + PARTIAL_SUFFIX)
+        self.completed = set()
+        self._batches = []
+        self._sequence = 0
+        self._rows = []
+        self._keys = []
+        if not resume:
+            shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+        self._recover()
+
+    def _batch_path(self, batch):
+        return os.path.join(self.root, batch + self.storage.extension)
+
+    def _recover(self):
+        path = os.path.join(self.root, CHECKPOINT_FILE)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn final line from a crash mid-append
+                        continue
+                    if entry['batch'] is not None:
+                        self._batches.append(entry['batch'])
+                    self.completed.update(entry['keys'])
+                    self._sequence += 1
+        # A batch written just before a crash, without its checkpoint entry
+        committed = {self._batch_path(batch) for batch in self._batches}
+        for name in os.listdir(self.root):
+            file_path = os.path.join(self.root, name)
+            if name != CHECKPOINT_FILE and file_path not in committed:
+                os.remove(file_path)
+        if self.completed:
+            logger.info(f"Resuming {self.dataset} with {len(self.completed)} completed keys")
+
+    def add(self, rows, keys=None):
+        """Buffer result rows; ``keys`` (default: the rows' key column) are complete once they are written."""
+        self._rows.extend(rows)
+        self._keys.extend(str(key) for key in (keys if keys is not None else (row[self.key_column] for row in rows)))
+        if len(self._rows) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows as a batch and checkpoint their keys."""
+        if not self._rows and not self._keys:
+            return
+        batch = None
+        if self._rows:
+            batch = f"{self._sequence:06d}"
+            self.storage.write_file(self._batch_path(batch), self.dataset, pd.DataFrame(self._rows))
+        with open(os.path.join(self.root, CHECKPOINT_FILE), 'a') as f:
+            f.write(json.dumps({'batch': batch, 'keys': self._keys}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        if batch is not None:
+            self._batches.append(batch)
+        self.completed.update(self._keys)
+        self._sequence += 1
+        self._rows = []
+        self._keys = []
+
+    def finish(self):
+        """Write the dataset from every batch, including ones from the run that was resumed."""
+        self.flush()
+        if self._batches:
+            self.storage.concat_files(self.dataset, [self._batch_path(batch) for batch in self._batches])
+        else:
+            self.storage.write(self.dataset, pd.DataFrame([]))
+        shutil.rmtree(self.root)
+
+class InvalidCursor(ValueError):
+    pass
+
+def stockout_tiers(df, stockout_columns, today):
+    """Alert tier of each forecast row from its earliest predicted stockout; a date already passed counts as today."""
+    earliest = df[stockout_columns].apply(pd.to_datetime, errors='coerce').min(axis=1)
+    dates = earliest.to_numpy(dtype='datetime64[D]')
+    days = np.maximum((dates - np.datetime64(today, 'D')).astype(np.int64), 0)
+    return alert_tiers(np.where(np.isnat(dates), -1, days))
+
+def _results_token(storage, dataset):
+    try:
+        stat = os.stat(storage.path(dataset))
+    except FileNotFoundError:
+        return None
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    return hashlib.sha1(repr(signature).encode('utf-8')).hexdigest()[:12]
+
+def _records(df):
+    df = df.assign(**{column: df[column].dt.strftime('%Y-%m-%d') for column in df.select_dtypes('datetime').columns})
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+def read_page(storage, dataset, sku_column, skus=None, tiers=None, tier_of=None, cursor=None, limit=PAGE_SIZE,
+              chunksize=PAGE_CHUNK_ROWS):
+    """One page of a results dataset, scanned in chunks so the whole file is never loaded.
+
+    Rows are kept if their ``sku_column`` is in ``skus`` and their alert tier
+    is in ``tiers`` (names from TIER_NAMES); ``tier_of(chunk)`` gives the tier
+    of each row and is added to the rows as ``Alert`` unless they already have
+    one. ``cursor`` is the ``next_cursor`` of the previous page. It ties the
+    position to the results file, so a cursor from before the file was
+    rewritten raises InvalidCursor. The cursor holds the storage position of
+    the next row, so a page is read from there rather than from the first row.
+    Returns ``{'items': [...], 'next_cursor': ...}``.
+    """
+    token = _results_token(storage, dataset)
+    start = 0
+    if cursor:
+        position, _, cursor_token = cursor.partition('-')
+        if not position.isdigit() or cursor_token != token:
+            raise InvalidCursor("Invalid cursor, or the results changed since it was issued")
+        start = int(position)
+    items = []
+    next_cursor = None
+    if token is None:
+        return {'items': items, 'next_cursor': next_cursor}
+    wanted_skus = None if skus is None else {str(sku) for sku in skus}
+    wanted_tiers = None if tiers is None else {TIER_NAMES[tier] for tier in tiers}
+    last_end = None
+    for chunk, ends in storage.iter_file_from(storage.path(dataset), dataset, start, chunksize):
+        if tier_of is not None and 'Alert' not in chunk.columns:
+            chunk = chunk.assign(Alert=tier_of(chunk))
+        mask = np.ones(len(chunk), dtype=bool)
+        if wanted_skus is not None:
+            mask &= chunk[sku_column].astype(str).isin(wanted_skus).to_numpy()
+        if wanted_tiers is not None:
+            mask &= chunk['Alert'].isin(wanted_tiers).to_numpy()
+        matches = np.flatnonzero(mask)
+        taken = matches[:limit - len(items)]
+        items.extend(_records(chunk.iloc[taken]))
+        if len(taken):
+            last_end = ends[int(taken[-1])]
+        if len(taken) < len(matches):
+            # There is a further match: the next page starts right after the last row returned
+            next_cursor = f"{last_end}-{token}"
+            break
+    return {'items': items, 'next_cursor': next_cursor}
@@ -0,0 +1,64 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Directory, under the data directory, holding the published snapshots
+STORE_DIR = '.forecast_store'
+
+class ForecastStore:
+    """Read-only array snapshots shared by every worker process through memory maps.
+
+    A snapshot is a set of named NumPy arrays derived from a dataset, stored
+    as ``.npy`` files and identified by the dataset's file signature. The
+    first process to see a new signature builds the arrays and publishes them;
+    the others map the files instead of reading and parsing the dataset
+    themselves, so the data is held once in the page cache rather than once per
+    worker. Arrays must have a fixed-width dtype (no Python objects).
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.join(directory, STORE_DIR)
+
+    def _key(self, signature):
+        return hashlib.sha1(repr(signature).encode('utf-8')).hexdigest()[:16]
+
+    def _snapshot_dir(self, name, signature):
+        return os.path.join(self.directory, f"{name}-{self._key(signature)}")
+
+    def load(self, name, signature, array_names):
+        """Memory-map the snapshot of ``name`` for ``signature``; None if it has not been published."""
+        snapshot_dir = self._snapshot_dir(name, signature)
+        arrays = {}
+        try:
+            for array_name in array_names:
+                arrays[array_name] = np.load(os.path.join(snapshot_dir, f"{array_name}.npy"), mmap_mode='r')
+        except FileNotFoundError:
+            # Not published yet, or replaced by a newer snapshot while we were reading it
+            return None
+        return arrays
+
+    def publish(self, name, signature, arrays):
+        """Write a snapshot and make it visible in one rename; older snapshots of ``name`` are removed."""
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot_dir = self._snapshot_dir(name, signature)
+        staging = tempfile.mkdtemp(dir=self.directory, prefix='.')
+        try:
+            for array_name, array in arrays.items():
+                np.save(os.path.join(staging, f"{array_name}.npy"), array, allow_pickle=False)
+            os.rename(staging, snapshot_dir)
+        except OSError:
+            # Another process published the same snapshot first
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.isdir(snapshot_dir):
+                raise
+        for entry in os.listdir(self.directory):
+            if entry.startswith(f"{name}-") and entry != os.path.basename(snapshot_dir):
+                # Processes that still map the old files keep them until they unmap
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+        logger.info(f"Published {name} snapshot {os.path.basename(snapshot_dir)}")
@@ -0,0 +1,20 @@
+import multiprocessing
+import os
+
+# Production serving: gunicorn -c gunicorn.conf.py app:app
+# (python app.py runs the single-process development server)
+bind = os.environ.get('HOLOO_BIND', '0.0.0.0:5001')
+# Each worker process serves requests on a pool of threads. Requests mostly
+# wait on files and locks, so threads are cheap; processes add CPU parallelism.
+workers = int(os.environ.get('HOLOO_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('HOLOO_THREADS', 8))
+# Import the app once in the master and fork the workers from it, so with
+# HOLOO_PREWARM=1 the ML libraries are loaded once and shared copy-on-write
+preload_app = True
+
+def post_fork(server, worker):
+    # Threads do not survive fork: every worker starts its own standby, and the
+    # one that takes the leader lock runs the Shopify sync
+    from app import start_sync_leader
+    start_sync_leader()
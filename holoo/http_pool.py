@@ -0,0 +1,95 @@
+import http.client
+import threading
+import urllib.parse
+
+# Idle keep-alive connections kept per host
+POOL_SIZE = 8
+DEFAULT_TIMEOUT = 30
+
+class HttpError(Exception):
+    """Non-2xx response; ``code`` and ``headers`` as received."""
+
+    def __init__(self, url, code, reason, headers):
+        super().__init__(f"HTTP {code} {reason}: {url}")
+        self.url = url
+        self.code = code
+        self.reason = reason
+        self.headers = headers
+
+class HttpPool:
+    """Thread-safe pool of keep-alive HTTP(S) connections, per scheme, host and port.
+
+    A connection is checked out for one request at a time and returned once
+    its response has been read, so concurrent requests to the same host each
+    use their own connection and sequential ones reuse it instead of opening a
+    new TCP and TLS session every time. A pooled connection the server has
+    since closed is retried once on a fresh connection.
+    """
+
+    def __init__(self, max_per_host=POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, scheme, host, port):
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _checkout(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(*key), False
+
+    def _checkin(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, method, url, headers=None, body=None):
+        """Send a request and read the whole response; returns ``(status, headers, body bytes)``.
+
+        Raises HttpError for responses outside 2xx, after the response body has been read.
+        """
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        while True:
+            connection, reused = self._checkout(key)
+            try:
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused:
+                    # Closed by the server while idle in the pool
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            break
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(key, connection)
+        if not 200 <= response.status < 300:
+            raise HttpError(url, response.status, response.reason, response.headers)
+        return response.status, response.headers, data
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
@@ -1,149 +1,583 @@
 import pandas as pd
 import numpy as np
-from prophet import Prophet
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+import argparse
 import warnings
 warnings.filterwarnings('ignore', category=UserWarning)
-from xgboost import XGBRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error
+from sku_partitions import SkuPartitions
+from features import build_features, calendar, FeatureStore
+from storage import get_storage
+from daily_demand import load_daily_demand
+from model_cache import ModelCache, DEFAULT_MAX_BYTES
+from forecast_results import ResultWriter
+from prophet_batch import predict_yhat, history_and_future_dates
+from fast_forecast import demand_matrix, average_daily_units, fast_forecast
+from stockout_engine import compute_stockouts
+from metrics import timed, span, profiled, print_summary
+from warmup import prewarm
 
-def load_data(file_path):
+# Number of SKUs handed to a worker process at a time
+DEFAULT_CHUNK_SIZE = 25
+# Number of days forecast into the future
+DEFAULT_HORIZON = 30
+# Feature columns used by the XGBoost models, in matrix column order
+XGB_FEATURES = ['dayofweek', 'month', 'day', 'lag1', 'lag7']
+# Number of past observations kept for the lag features
+LAG_WINDOW = 7
+# SKU-level columns appended to XGB_FEATURES by the global model
+GLOBAL_SKU_FEATURES = ['sku_code', 'sku_mean_sales']
+GLOBAL_XGB_FEATURES = XGB_FEATURES + GLOBAL_SKU_FEATURES
+# Model hyperparameters; also part of the model cache key
+PROPHET_PARAMS = {'daily_seasonality': True, 'weekly_seasonality': True, 'yearly_seasonality': True}
+XGB_PARAMS = {'n_estimators': 100, 'random_state': 42}
+# The global model sees every SKU, so it gets more trees than a per-SKU model
+GLOBAL_XGB_PARAMS = {'n_estimators': 300, 'random_state': 42}
+# Stockout date column value for SKUs not projected to run out within the horizon
+NO_STOCKOUT = 'No stockout projected'
+# Average daily sales column of each model, over the horizon given in HORIZON_COLUMN
+AVG_SALES_COLUMN = '{}_Avg_Daily_Sales_Forecast'
+HORIZON_COLUMN = 'Horizon_Days'
+# A restock alert is raised when the stockout falls within this many days
+RESTOCK_ALERT_DAYS = 14
+# With the fast path on, SKUs selling less than this per day on average skip Prophet/XGBoost
+FAST_PATH_MAX_DAILY_UNITS = 1.0
+
+@timed('load_data')
+def load_data(storage=None):
     """Load and preprocess the input data."""
-    df = pd.read_csv(file_path)
-    df['date'] = pd.to_datetime(df['date'])
-    return df
+    # Streamed and summed into one row per SKU and day (see daily_demand)
+    return load_daily_demand(storage)
 
 def create_features(df):
     """Create time-based and lag features for ML forecasting."""
+    # Same pipeline as the whole-history features of SkuPartitions
     df = df.copy()
-    df['dayofweek'] = df['date'].dt.dayofweek
-    df['month'] = df['date'].dt.month
-    df['day'] = df['date'].dt.day
-    df['lag1'] = df['units_sold'].shift(1)
-    df['lag7'] = df['units_sold'].shift(7)
+    features = build_features(df)
+    df[features.columns] = features
     df = df.fillna(0)
     return df
 
-def forecast_sku_sales_prophet(df, sku_id):
-    """Generate sales forecast for a single SKU using Prophet."""
-    # Filter data for specific SKU
-    sku_data = df[df['sku_id'] == sku_id].copy()
-    
-    # Prepare data for Prophet
+def fit_prophet_model(sku_data, cache=None):
+    """Fit Prophet on a single SKU's history, or take the fitted model from ``cache``."""
     prophet_df = sku_data.rename(columns={'date': 'ds', 'units_sold': 'y'})
+    def fit():
+        # Deferred: importing Prophet loads cmdstanpy and takes over a second
+        from prophet import Prophet
+        model = Prophet(**PROPHET_PARAMS)
+        model.fit(prophet_df)
+        return model
+    with span('prophet_fit'):
+        if cache is None:
+            return fit()
+        return cache.get_or_fit('prophet', sku_data['sku_id'].iloc[0], prophet_df[['ds', 'y']], PROPHET_PARAMS, fit)
+
+def forecast_sku_sales_prophet(sku_data, horizon=DEFAULT_HORIZON, cache=None, uncertainty=False):
+    """Generate sales forecast for a single SKU using Prophet.
+
+    The forecast covers the fitted history and the next ``horizon`` days.
+    Only ``ds`` and ``yhat`` are computed unless ``uncertainty`` asks for
+    Prophet's full forecast with its sampled intervals.
+    """
+    model = fit_prophet_model(sku_data, cache)
+    with span('prophet_predict'):
+        if uncertainty:
+            return model.predict(model.make_future_dataframe(periods=horizon, freq='D'))
+        dates = history_and_future_dates(model, horizon)
+        return pd.DataFrame({'ds': dates, 'yhat': predict_yhat([model], dates)[0]})
+
+def forecast_prophet_batch(partitions, skus, horizon=DEFAULT_HORIZON, cache=None):
+    """Fit one Prophet model per SKU and predict them together.
+
+    SKUs fit on the same days share one future date frame and seasonality
+    matrix, and their ``yhat`` is computed in one batch (see prophet_batch).
+    Same return shape as forecast_xgb_batch.
+    """
+    groups = {}
+    failures = []
+    for sku in skus:
+        try:
+            model = fit_prophet_model(partitions.get(sku), cache)
+            groups.setdefault(model.history_dates.to_numpy().tobytes(), []).append((sku, model))
+        except Exception as e:
+            failures.append({'SKU_ID': sku, 'Error': str(e)})
+    forecasts = {}
+    with span('prophet_predict'):
+        for group in groups.values():
+            try:
+                dates = history_and_future_dates(group[0][1], horizon)
+                yhat = predict_yhat([model for _, model in group], dates)
+            except Exception as e:
+                failures.extend({'SKU_ID': sku, 'Error': str(e)} for sku, _ in group)
+                continue
+            for i, (sku, _) in enumerate(group):
+                forecasts[sku] = pd.DataFrame({'ds': dates, 'yhat': yhat[i]})
+    return forecasts, failures
+
+@timed('xgb_fit')
+def fit_xgb_model(sku_data, cache=None, features=None):
+    """Train an XGBoost model on a single SKU's history.
+
+    ``features`` are the SKU's precomputed feature rows (``SkuPartitions.features``);
+    without them they are computed here.
+    """
+    def fit():
+        features_df = create_features(sku_data) if features is None else features
+        X = features_df[XGB_FEATURES].to_numpy(dtype=float)
+        y = sku_data['units_sold'].to_numpy(dtype=float)
+        # Train on all available data
+        from xgboost import XGBRegressor
+        model = XGBRegressor(**XGB_PARAMS)
+        model.fit(X, y)
+        return model
+    if cache is None:
+        return fit()
+    key_params = {'model': XGB_PARAMS, 'features': XGB_FEATURES}
+    return cache.get_or_fit('xgb', sku_data['sku_id'].iloc[0], sku_data[['date', 'units_sold']], key_params, fit)
+
+def lag_history(sku_data, size=LAG_WINDOW):
+    """Return the last ``size`` observed sales, oldest first, zero-padded like create_features."""
+    values = sku_data['units_sold'].to_numpy(dtype=float)[-size:]
+    return np.pad(values, (size - len(values), 0))
+
+def calendar_features(start_dates, horizon):
+    """Compute dates and calendar features for the ``horizon`` days after each start date.
+
+    Returns ``(dates, dayofweek, month, day)``, each shaped ``(len(start_dates), horizon)``.
+    """
+    days = np.asarray(start_dates, dtype='datetime64[D]')[:, None] + np.arange(1, horizon + 1)
+    columns = calendar(days)
+    return days, columns['dayofweek'], columns['month'], columns['day']
+
+def per_sku_predictor(models):
+    """Wrap one fitted model per SKU into a predictor over a feature matrix (row i -> model i)."""
+    boosters = [model.get_booster() for model in models]
+    def predict(X):
+        return np.array([booster.inplace_predict(X[i:i + 1])[0] for i, booster in enumerate(boosters)])
+    return predict
+
+@timed('xgb_predict')
+def recursive_forecast(predict, history, start_dates, horizon=DEFAULT_HORIZON):
+    """Roll an autoregressive model forward ``horizon`` days for many SKUs at once.
+
+    ``predict`` maps an ``(n_skus, len(XGB_FEATURES))`` matrix to one prediction per
+    row, ``history`` is an ``(n_skus, LAG_WINDOW)`` array of the latest sales (oldest
+    first). Each step issues a single ``predict`` call for all SKUs and feeds the
+    predictions back through a circular lag buffer.
+    """
+    history = np.asarray(history, dtype=float)
+    n_skus = len(history)
+    dates, dayofweek, month, day = calendar_features(start_dates, horizon)
+    buffer = history.copy()
+    # Column holding the oldest value; the newest sits just before it
+    oldest = 0
+    X = np.empty((n_skus, len(XGB_FEATURES)))
+    predictions = np.empty((n_skus, horizon))
+    for step in range(horizon):
+        X[:, 0] = dayofweek[:, step]
+        X[:, 1] = month[:, step]
+        X[:, 2] = day[:, step]
+        X[:, 3] = buffer[:, (oldest - 1) % LAG_WINDOW]  # lag1
+        X[:, 4] = buffer[:, oldest]  # lag7
+        y_pred = predict(X)
+        predictions[:, step] = y_pred
+        buffer[:, oldest] = y_pred
+        oldest = (oldest + 1) % LAG_WINDOW
+    return dates, predictions
+
+def forecast_xgb_batch(partitions, skus, horizon=DEFAULT_HORIZON, cache=None):
+    """Fit one XGBoost model per SKU and forecast all of them together.
+
+    Returns a dict of SKU -> forecast DataFrame (``ds``, ``yhat``) and a list of
+    failures for SKUs whose model could not be trained.
+    """
+    models = []
+    fitted_skus = []
+    failures = []
+    for sku in skus:
+        try:
+            models.append(fit_xgb_model(partitions.get(sku), cache, partitions.features(sku)))
+            fitted_skus.append(sku)
+        except Exception as e:
+            failures.append({'SKU_ID': sku, 'Error': str(e)})
+    if not fitted_skus:
+        return {}, failures
+    
+    history = np.array([lag_history(partitions.get(sku)) for sku in fitted_skus])
+    start_dates = partitions.meta.loc[fitted_skus, 'last_date'].to_numpy()
+    dates, predictions = recursive_forecast(per_sku_predictor(models), history, start_dates, horizon)
+    forecasts = {
+        sku: pd.DataFrame({'ds': pd.to_datetime(dates[i]), 'yhat': predictions[i]})
+        for i, sku in enumerate(fitted_skus)
+    }
+    return forecasts, failures
+
+def create_global_features(df, features=None):
+    """Create features for a multi-SKU history sorted by SKU and date in one pass.
+
+    Lags are shifted within each SKU, and two SKU-level columns are added: an
+    integer ``sku_code`` and the SKU's mean daily sales (``sku_mean_sales``).
+    ``features`` are the history's precomputed rows from ``build_features``.
+    """
+    df = df.copy()
+    features = build_features(df) if features is None else features
+    df[features.columns] = features
+    grouped = df.groupby('sku_id', sort=False, observed=True)['units_sold']
+    df['sku_code'] = grouped.ngroup()
+    df['sku_mean_sales'] = grouped.transform('mean')
+    df = df.fillna(0)
+    return df
+
+@timed('xgb_global_fit')
+def fit_global_xgb_model(partitions, cache=None):
+    """Train a single XGBoost model across every SKU.
+
+    Returns the model and a DataFrame indexed by SKU holding the SKU-level
+    features needed to score it.
+    """
+    features_df = create_global_features(partitions.df, partitions.features())
+    def fit():
+        X = features_df[GLOBAL_XGB_FEATURES].to_numpy(dtype=float)
+        y = features_df['units_sold'].to_numpy(dtype=float)
+        from xgboost import XGBRegressor
+        model = XGBRegressor(**GLOBAL_XGB_PARAMS)
+        model.fit(X, y)
+        return model
+    if cache is None:
+        model = fit()
+    else:
+        key_params = {'model': GLOBAL_XGB_PARAMS, 'features': GLOBAL_XGB_FEATURES}
+        model = cache.get_or_fit('xgb', '*', partitions.df[['sku_id', 'date', 'units_sold']], key_params, fit)
+    sku_features = features_df.groupby('sku_id', sort=False, observed=True)[GLOBAL_SKU_FEATURES].first()
+    return model, sku_features
+
+def forecast_xgb_global(partitions, skus, horizon=DEFAULT_HORIZON, cache=None):
+    """Forecast all SKUs with one global XGBoost model and one predict call per step.
+
+    Same return shape as forecast_xgb_batch. If the global model cannot be
+    trained, every SKU is reported as failed.
+    """
+    try:
+        model, sku_features = fit_global_xgb_model(partitions, cache)
+    except Exception as e:
+        return {}, [{'SKU_ID': sku, 'Error': f"Global model failed: {str(e)}"} for sku in skus]
+    
+    skus = [sku for sku in skus if sku in partitions]
+    booster = model.get_booster()
+    sku_matrix = sku_features.loc[skus, GLOBAL_SKU_FEATURES].to_numpy(dtype=float)
+    def predict(X):
+        return booster.inplace_predict(np.hstack([X, sku_matrix]))
+    
+    history = np.array([lag_history(partitions.get(sku)) for sku in skus])
+    start_dates = partitions.meta.loc[skus, 'last_date'].to_numpy()
+    dates, predictions = recursive_forecast(predict, history, start_dates, horizon)
+    forecasts = {
+        sku: pd.DataFrame({'ds': pd.to_datetime(dates[i]), 'yhat': predictions[i]})
+        for i, sku in enumerate(skus)
+    }
+    return forecasts, []
+
+def forecast_sku_sales_xgb(sku_data, horizon=DEFAULT_HORIZON, cache=None):
+    """Generate sales forecast for a single SKU using XGBoost."""
+    model = fit_xgb_model(sku_data, cache)
+    start_dates = sku_data['date'].to_numpy()[-1:]
+    dates, predictions = recursive_forecast(per_sku_predictor([model]), [lag_history(sku_data)], start_dates, horizon)
+    return pd.DataFrame({'ds': pd.to_datetime(dates[0]), 'yhat': predictions[0]})
+
+def forecast_matrix(forecasts):
+    """Stack per-SKU forecast frames (``ds``, ``yhat``) into ``(n_skus, days)`` yhat and date matrices.
+
+    Shorter frames are padded at the end with zero sales, which leaves their
+    cumulative sales and so their stockout day unchanged.
+    """
+    width = max(len(forecast) for forecast in forecasts)
+    yhat = np.zeros((len(forecasts), width))
+    dates = np.full((len(forecasts), width), np.datetime64('NaT'), dtype='datetime64[D]')
+    for i, forecast in enumerate(forecasts):
+        yhat[i, :len(forecast)] = forecast['yhat'].to_numpy(dtype=float)
+        dates[i, :len(forecast)] = forecast['ds'].to_numpy().astype('datetime64[D]')
+    return yhat, dates
+
+def result_rows(skus, inventory, horizon, models):
+    """Build the result rows for many SKUs at once.
+
+    ``models`` lists ``(prefix, yhat, dates, averages)`` per model, where
+    ``yhat`` and ``dates`` are forecast matrices with one row per SKU. The
+    stockout day is the first day cumulative forecast sales exceed the
+    inventory, computed for all SKUs in one pass (see stockout_engine).
+    """
+    rows = [{'SKU_ID': sku} for sku in skus]
+    for prefix, yhat, dates, averages in models:
+        stockouts = compute_stockouts(yhat, inventory, dates, restock_days=RESTOCK_ALERT_DAYS)
+        for row, average, stockout_date, restock in zip(rows, averages, stockouts['stockout_date'], stockouts['restock']):
+            row[AVG_SALES_COLUMN.format(prefix)] = round(float(average), 2)
+            row[f'{prefix}_Estimated_Stockout_Date'] = NO_STOCKOUT if np.isnat(stockout_date) else str(stockout_date)
+            row[f'{prefix}_Restock_Alert'] = 'Yes' if restock else 'No'
+    for row in rows:
+        row[HORIZON_COLUMN] = horizon
+    return rows
+
+def forecast_sku_rows(partitions, skus, prophet_forecasts, xgb_forecasts, horizon=DEFAULT_HORIZON):
+    """Result rows for SKUs whose Prophet and XGBoost forecasts are ready.
+
+    The Prophet forecast includes the fitted history, and stockouts are
+    counted over all of it, as they always have been; the averages cover only
+    the last ``horizon`` days.
+    """
+    inventory = np.array([partitions.last_inventory(sku) for sku in skus], dtype=float)
+    models = []
+    for prefix, forecasts in (('Prophet', prophet_forecasts), ('XGB', xgb_forecasts)):
+        yhat, dates = forecast_matrix(forecasts)
+        averages = [forecast['yhat'].tail(horizon).mean() for forecast in forecasts]
+        models.append((prefix, yhat, dates, averages))
+    return result_rows(skus, inventory, horizon, models)
+
+def forecast_sku(partitions, sku, forecast_df_xgb=None, horizon=DEFAULT_HORIZON, cache=None):
+    """Run both forecasting models for a single SKU and build its result row.
+
+    ``forecast_df_xgb`` can be passed in when the XGBoost forecast was already
+    produced by the batched path.
+    """
+    sku_data = partitions.get(sku)
+    forecast_df_prophet = forecast_sku_sales_prophet(sku_data, horizon, cache)
+    if forecast_df_xgb is None:
+        forecast_df_xgb = forecast_sku_sales_xgb(sku_data, horizon, cache)
+    return forecast_sku_rows(partitions, [sku], [forecast_df_prophet], [forecast_df_xgb], horizon)[0]
+
+def forecast_sku_batch(partitions, skus, horizon=DEFAULT_HORIZON, xgb_forecasts=None, cache=None):
+    """Forecast a batch of SKUs, isolating failures so one bad SKU cannot abort the batch.
+
+    When ``xgb_forecasts`` is given (global model mode) those forecasts are used
+    instead of fitting a model per SKU; SKUs missing from it are skipped.
+    Stockouts for the whole batch are then computed together.
+    """
+    if xgb_forecasts is None:
+        xgb_forecasts, failures = forecast_xgb_batch(partitions, skus, horizon, cache)
+    else:
+        failures = []
+    prophet_forecasts, prophet_failures = forecast_prophet_batch(
+        partitions, [sku for sku in skus if sku in xgb_forecasts], horizon, cache)
+    failures.extend(prophet_failures)
+    forecasted = [sku for sku in skus if sku in prophet_forecasts]
+    if not forecasted:
+        return [], failures
+    results = forecast_sku_rows(partitions, forecasted, [prophet_forecasts[sku] for sku in forecasted],
+                                [xgb_forecasts[sku] for sku in forecasted], horizon)
+    return results, failures
+
+def forecast_fast_path(partitions, skus, horizon=DEFAULT_HORIZON, max_daily_units=FAST_PATH_MAX_DAILY_UNITS):
+    """Forecast low-volume SKUs with the vectorized statistical tier.
+
+    SKUs averaging fewer than ``max_daily_units`` sales per day are forecast
+    together as one matrix (see fast_forecast); their result rows carry the
+    same forecast in both the Prophet and XGB columns. Returns those rows and
+    the remaining SKUs, which need the full models.
+    """
+    skus = list(skus)
+    if not skus:
+        return [], []
+    demand, observed = demand_matrix(partitions, skus)
+    fast = average_daily_units(demand, observed) < max_daily_units
+    fast_skus = [sku for sku, is_fast in zip(skus, fast) if is_fast]
+    full_skus = [sku for sku, is_fast in zip(skus, fast) if not is_fast]
+    if not fast_skus:
+        return [], full_skus
+
+    forecasts, _ = fast_forecast(demand[fast], observed[fast], horizon)
+    meta = partitions.meta.loc[fast_skus]
+    dates, _, _, _ = calendar_features(meta['last_date'].to_numpy(), horizon)
+    inventory = meta['last_inventory'].to_numpy(dtype=float)
+    averages = forecasts.mean(axis=1)
+    rows = result_rows(fast_skus, inventory, horizon, [
+        ('Prophet', forecasts, dates, averages),
+        ('XGB', forecasts, dates, averages),
+    ])
+    return rows, full_skus
+
+def run_forecasts(partitions, skus=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, horizon=DEFAULT_HORIZON,
+                  global_xgb=False, cache=None, progress=None, fast_path_units=None, emit=None):
+    """Forecast all SKUs, optionally across a process pool.
+
+    SKUs are split into chunks of ``chunk_size``; each chunk is sent to a worker
+    together with only its own rows. Results come back in the same order as
+    ``skus`` regardless of which worker finishes first. With ``global_xgb`` a
+    single XGBoost model is trained over all SKUs up front and only Prophet
+    runs per SKU. Fitted models are reused from ``cache`` (a ModelCache) when
+    a SKU's history is unchanged. ``progress(done, total)``, if given, is called
+    as each chunk completes; an exception raised from it stops the run.
+    With ``fast_path_units`` set, SKUs selling less than that per day are
+    routed to ``forecast_fast_path`` and only the rest reach the full models.
+    With ``emit``, each chunk's result rows are passed to ``emit(rows)`` as
+    they complete, still in the order of ``skus``, instead of being collected
+    and returned.
+    """
+    if workers < 1 or chunk_size < 1:
+        raise ValueError(f"workers and chunk_size must be at least 1, got {workers} and {chunk_size}")
+    skus = list(partitions.skus if skus is None else skus)
+    if fast_path_units is not None:
+        fast_rows, full_skus = forecast_fast_path(partitions, skus, horizon, fast_path_units)
+        def full_progress(done, total):
+            if progress:
+                progress(done + len(fast_rows), len(skus))
+        # Back in the order of ``skus``
+        order = {sku: i for i, sku in enumerate(skus)}
+        if emit is None:
+            results, failures = run_forecasts(partitions, full_skus, workers, chunk_size, horizon, global_xgb, cache,
+                                              full_progress)
+            return sorted(results + fast_rows, key=lambda row: order[row['SKU_ID']]), failures
+        pending = fast_rows
+        def emit_merged(rows):
+            # Fast-path rows of SKUs before the end of this chunk go out with it
+            nonlocal pending
+            if not rows:
+                return
+            end = order[rows[-1]['SKU_ID']]
+            due = [row for row in pending if order[row['SKU_ID']] < end]
+            pending = pending[len(due):]
+            emit(sorted(rows + due, key=lambda row: order[row['SKU_ID']]))
+        _, failures = run_forecasts(partitions, full_skus, workers, chunk_size, horizon, global_xgb, cache,
+                                    full_progress, emit=emit_merged)
+        if pending:
+            emit(pending)
+        return [], failures
+    chunks = [skus[i:i + chunk_size] for i in range(0, len(skus), chunk_size)]
+    results = []
+    failures = []
+    done = 0
+    def deliver(chunk_results, chunk_failures):
+        nonlocal done
+        done += len(chunk_results) + len(chunk_failures)
+        failures.extend(chunk_failures)
+        if emit is None:
+            results.extend(chunk_results)
+        else:
+            emit(chunk_results)
+        if progress:
+            progress(done, len(skus))
     
-    # Initialize and fit Prophet model
-    model = Prophet(
-        daily_seasonality=True,
-        weekly_seasonality=True,
-        yearly_seasonality=True
-    )
-    model.fit(prophet_df)
+    xgb_forecasts = None
+    if global_xgb:
+        xgb_forecasts, failures = forecast_xgb_global(partitions, skus, horizon, cache)
+        done = len(failures)
+    def chunk_xgb_forecasts(chunk):
+        if xgb_forecasts is None:
+            return None
+        return {sku: xgb_forecasts[sku] for sku in chunk if sku in xgb_forecasts}
     
-    # Create future dataframe for 30 days
-    future = model.make_future_dataframe(periods=30, freq='D')
-    forecast = model.predict(future)
+    if workers <= 1:
+        for chunk in chunks:
+            deliver(*forecast_sku_batch(partitions, chunk, horizon, chunk_xgb_forecasts(chunk), cache))
+        return results, failures
     
-    return forecast
-
-def forecast_sku_sales_xgb(df, sku_id):
-    sku_data = df[df['sku_id'] == sku_id].copy()
-    sku_data = create_features(sku_data)
-    features = ['dayofweek', 'month', 'day', 'lag1', 'lag7']
-    X = sku_data[features]
-    y = sku_data['units_sold']
-    # Train on all available data
-    model = XGBRegressor(n_estimators=100, random_state=42)
-    model.fit(X, y)
-    # Forecast next 30 days
-    last_row = sku_data.iloc[-1:]
-    forecasts = []
-    for i in range(30):
-        next_date = last_row['date'].values[0] + np.timedelta64(1, 'D')
-        next_features = {
-            'dayofweek': next_date.astype('datetime64[D]').astype(object).weekday(),
-            'month': next_date.astype('datetime64[M]').astype(object).month,
-            'day': next_date.astype('datetime64[D]').astype(object).day,
-            'lag1': last_row['units_sold'].values[0],
-            'lag7': last_row['lag7'].values[0] if 'lag7' in last_row else 0
-        }
-        X_pred = pd.DataFrame([next_features])
-        y_pred = model.predict(X_pred)[0]
-        forecasts.append({'ds': pd.to_datetime(next_date), 'yhat': y_pred})
-        # Update last_row for next iteration
-        new_row = last_row.copy()
-        new_row['date'] = pd.to_datetime(next_date)
-        new_row['units_sold'] = y_pred
-        new_row['lag1'] = last_row['units_sold'].values[0]
-        new_row['lag7'] = last_row['lag6'].values[0] if 'lag6' in last_row else 0
-        last_row = new_row
-    forecast_df = pd.DataFrame(forecasts)
-    return forecast_df
-
-def calculate_stockout_date(current_inventory, forecast_df):
-    """Calculate when inventory will be depleted based on forecasted sales."""
-    # Use the entire forecast, not just dates after now
-    cumulative_sales = forecast_df['yhat'].cumsum()
-    stockout_mask = cumulative_sales > current_inventory
-    if stockout_mask.any():
-        stockout_date = forecast_df.loc[stockout_mask.idxmax(), 'ds']
-        return stockout_date
-    return None
-
-def main():
+    # Forked workers inherit the loaded models instead of each importing them
+    prewarm(['prophet', 'xgboost'])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(forecast_sku_batch, partitions.subset(chunk), chunk, horizon,
+                            chunk_xgb_forecasts(chunk), cache)
+            for chunk in chunks
+        ]
+        try:
+            # Collect in submission order so the output is deterministic
+            for chunk, future in zip(chunks, futures):
+                try:
+                    chunk_results, chunk_failures = future.result()
+                except Exception as e:
+                    # The worker itself died (e.g. killed or unpicklable result)
+                    chunk_results = []
+                    chunk_failures = [{'SKU_ID': sku, 'Error': f"Worker failed: {str(e)}"} for sku in chunk]
+                deliver(chunk_results, chunk_failures)
+        except BaseException:
+            # Stopped early: drop the chunks that have not started yet
+            for future in futures:
+                future.cancel()
+            raise
+    return results, failures
+
+def main(workers=1, chunk_size=DEFAULT_CHUNK_SIZE, horizon=DEFAULT_HORIZON, global_xgb=False,
+         model_cache_dir=None, model_cache_mb=DEFAULT_MAX_BYTES // (1024 * 1024), fast_path_units=None,
+         feature_store=False, resume=False):
     # Load data
+    storage = get_storage()
     try:
-        df = load_data('input_data.csv')
+        df = load_data(storage)
     except FileNotFoundError:
-        print("Error: input_data.csv not found. Please ensure the file exists in the current directory.")
+        print(f"Error: {storage.path('input_data')} not found. Please ensure the file exists in the current directory.")
         return
     
-    # Get unique SKUs
-    skus = df['sku_id'].unique()
+    # Group the history by SKU once
+    partitions = SkuPartitions(df)
+    skus = partitions.skus
+    if feature_store:
+        # Only days not seen by an earlier run get their features computed
+        partitions.use_feature_store(FeatureStore(storage))
     
-    # Create output dataframe
-    results = []
+    # Reuse fitted models for SKUs whose history has not changed
+    cache = None
+    if model_cache_dir:
+        cache = ModelCache(model_cache_dir, max_bytes=model_cache_mb * 1024 * 1024)
     
-    for sku in skus:
-        # Get current inventory for this SKU
-        current_inventory = df[df['sku_id'] == sku]['inventory_level'].iloc[-1]
-        
-        # Generate forecast
-        forecast_df_prophet = forecast_sku_sales_prophet(df, sku)
-        forecast_df_xgb = forecast_sku_sales_xgb(df, sku)
-        
-        # Calculate stockout date
-        stockout_date_prophet = calculate_stockout_date(current_inventory, forecast_df_prophet)
-        stockout_date_xgb = calculate_stockout_date(current_inventory, forecast_df_xgb)
-        
-        # Get last 30 days of forecasted sales (regardless of date)
-        last_30_prophet = forecast_df_prophet.tail(30)
-        last_30_xgb = forecast_df_xgb.tail(30)
-        # Calculate average daily sales for the last 30 forecasted days
-        avg_daily_sales_prophet = last_30_prophet['yhat'].mean()
-        avg_daily_sales_xgb = last_30_xgb['yhat'].mean()
-        # Determine if restock alert is needed
-        restock_alert_prophet = False
-        restock_alert_xgb = False
-        if stockout_date_prophet and (stockout_date_prophet - forecast_df_prophet['ds'].iloc[0]).days <= 14:
-            restock_alert_prophet = True
-        if stockout_date_xgb and (stockout_date_xgb - forecast_df_xgb['ds'].iloc[0]).days <= 14:
-            restock_alert_xgb = True
-        results.append({
-            'SKU_ID': sku,
-            'Prophet_Avg_Daily_Sales_Next_30_Days': round(avg_daily_sales_prophet, 2),
-            'Prophet_Estimated_Stockout_Date': stockout_date_prophet.strftime('%Y-%m-%d') if stockout_date_prophet else 'No stockout projected',
-            'Prophet_Restock_Alert': 'Yes' if restock_alert_prophet else 'No',
-            'XGB_Avg_Daily_Sales_Next_30_Days': round(avg_daily_sales_xgb, 2),
-            'XGB_Estimated_Stockout_Date': stockout_date_xgb.strftime('%Y-%m-%d') if stockout_date_xgb else 'No stockout projected',
-            'XGB_Restock_Alert': 'Yes' if restock_alert_xgb else 'No'
-        })
+    # Results are written out in batches as SKUs complete; a resumed run skips the SKUs already written
+    writer = ResultWriter(storage, 'inventory_forecast_results', 'SKU_ID', resume=resume)
+    pending_skus = [sku for sku in skus if str(sku) not in writer.completed]
+    if len(pending_skus) < len(skus):
+        print(f"Resuming: {len(skus) - len(pending_skus)} of {len(skus)} SKUs already forecast")
+    
+    # Forecast every SKU; failures are collected instead of aborting the run
+    _, failures = run_forecasts(partitions, pending_skus, workers=workers, chunk_size=chunk_size, horizon=horizon,
+                                global_xgb=global_xgb, cache=cache, fast_path_units=fast_path_units,
+                                emit=writer.add)
     
-    # Create and save results
-    results_df = pd.DataFrame(results)
-    results_df.to_csv('inventory_forecast_results.csv', index=False)
-    print("Forecast complete. Results saved to 'inventory_forecast_results.csv'")
+    for failure in failures:
+        print(f"Forecast failed for SKU {failure['SKU_ID']}: {failure['Error']}")
+    
+    # Join the batches into the results file
+    with span('write_results'):
+        writer.finish()
+    print(f"Forecast complete. Results saved to '{storage.path('inventory_forecast_results')}'")
+    if failures:
+        print(f"{len(failures)} of {len(skus)} SKUs failed to forecast")
+
+def positive_int(value):
+    """argparse type for options that must be a whole number of at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Forecast SKU sales and stockout dates.")
+    parser.add_argument('--workers', type=positive_int, default=1,
+                        help="Number of worker processes (1 runs serially)")
+    parser.add_argument('--chunk-size', type=positive_int, default=DEFAULT_CHUNK_SIZE,
+                        help="Number of SKUs sent to a worker at a time")
+    parser.add_argument('--horizon', type=positive_int, default=DEFAULT_HORIZON,
+                        help="Number of days to forecast")
+    parser.add_argument('--global-xgb', action='store_true',
+                        help="Train one XGBoost model across all SKUs instead of one per SKU")
+    parser.add_argument('--model-cache', metavar='DIR',
+                        help="Directory for cached fitted models; unchanged SKUs skip refitting")
+    parser.add_argument('--model-cache-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Size limit of the model cache in megabytes")
+    parser.add_argument('--fast-path', nargs='?', type=float, const=FAST_PATH_MAX_DAILY_UNITS, metavar='UNITS',
+                        dest='fast_path_units',
+                        help="Forecast SKUs selling fewer than UNITS per day (default %(const)s) with fast "
+                             "statistical models instead of Prophet/XGBoost")
+    parser.add_argument('--feature-store', action='store_true',
+                        help="Keep computed features on disk and only compute them for new days")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run, skipping the SKUs whose results were already written")
+    parser.add_argument('--timings', action='store_true',
+                        help="Print the time spent in each stage at the end of the run")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="Sample the run's stacks into FILE as collapsed stacks (for flame graphs)")
+    args = parser.parse_args()
+    with profiled(args.profile):
+        main(workers=args.workers, chunk_size=args.chunk_size, horizon=args.horizon, global_xgb=args.global_xgb,
+             model_cache_dir=args.model_cache, model_cache_mb=args.model_cache_mb,
+             fast_path_units=args.fast_path_units, feature_store=args.feature_store, resume=args.resume)
+    if args.timings:
+        print_summary()
@@ -0,0 +1,70 @@
+import fcntl
+import logging
+import os
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Lock file, in the data directory, held by the process that runs the Shopify sync loop
+LEADER_LOCK_FILE = 'sync.lock'
+
+class LeaderLock:
+    """Exclusive ``flock`` on a file that elects one process out of many.
+
+    Web workers all try to take the lock; the one that gets it runs the
+    singleton background work and the others wait as standbys. The kernel
+    drops the lock when its holder exits, however it exits, so a standby takes
+    over without any stale-lock cleanup. The holder's pid is written to the
+    file for operators.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self, blocking=True):
+        """Take the lock, waiting for it unless ``blocking`` is False. Returns whether it is held."""
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode('utf-8'))
+        self._fd = fd
+        logger.info(f"Process {os.getpid()} holds the leader lock {self.path}")
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def holder(self):
+        """Pid written by the current or last holder, or None."""
+        try:
+            with open(self.path, 'r') as f:
+                return int(f.read().strip() or 0) or None
+        except (FileNotFoundError, ValueError):
+            return None
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive ``flock`` on ``path`` (created if missing) for the duration of the block.
+
+    Serializes read-modify-write of files shared by the worker processes.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
@@ -0,0 +1,183 @@
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets, as in the Prometheus client defaults plus longer runs
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# Seconds between samples of the sampling profiler
+PROFILE_INTERVAL = 0.005
+
+class Histogram:
+    """Cumulative-bucket histogram of observed durations for one label set."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+class Registry:
+    """In-memory histograms keyed by metric name and labels, rendered in Prometheus text format.
+
+    Only the current process is covered: timings recorded inside
+    ProcessPoolExecutor workers stay in those workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._help = {}
+
+    def observe(self, name, value, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def summary(self):
+        """Per-series ``(name, labels, count, total seconds)``, slowest total first."""
+        with self._lock:
+            rows = [(name, dict(labels), h.count, h.sum) for (name, labels), h in self._histograms.items()]
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name in sorted(self._help):
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                series = sorted(((labels, h) for (key, labels), h in self._histograms.items() if key == name),
+                                key=lambda item: item[0])
+                for labels, histogram in series:
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {count}")
+                    lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum!r}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+def _number(value):
+    return repr(float(value))
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+REGISTRY = Registry()
+STAGE_METRIC = 'holoo_stage_duration_seconds'
+REQUEST_METRIC = 'holoo_http_request_duration_seconds'
+
+@contextmanager
+def span(stage, **labels):
+    """Time the enclosed block as ``stage`` in the stage duration histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(STAGE_METRIC, time.perf_counter() - started,
+                         'Time spent in each pipeline stage', stage=stage, **labels)
+
+def timed(stage):
+    """Decorator form of ``span``."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def observe_request(route, method, status, seconds):
+    REGISTRY.observe(REQUEST_METRIC, seconds, 'Time spent handling each Flask route',
+                     route=route, method=method, status=str(status))
+
+def print_summary(registry=REGISTRY, file=None):
+    """Print the stage timings of this run, slowest first."""
+    file = file or sys.stdout
+    print(f"{'stage':<28}{'count':>8}{'total s':>12}{'mean ms':>12}", file=file)
+    for name, labels, count, total in registry.summary():
+        if name == STAGE_METRIC:
+            print(f"{labels['stage']:<28}{count:>8}{total:>12.3f}{1000 * total / count:>12.2f}", file=file)
+
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval.
+
+    ``dump()`` writes collapsed stacks (``frame;frame;frame count`` per line),
+    the input format of flamegraph.pl and speedscope. Sampling runs in a
+    daemon thread, so the profiled code is not instrumented at all.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+@contextmanager
+def profiled(path=None, interval=PROFILE_INTERVAL):
+    """Profile the enclosed block into ``path``; does nothing when ``path`` is None."""
+    if not path:
+        yield None
+        return
+    profiler = SamplingProfiler(interval).start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        profiler.dump(path)
+        print(f"Wrote {sum(profiler.samples.values())} profile samples to '{path}'")
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = 'model_cache'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+def _dump_prophet(model):
+    from prophet.serialize import model_to_json
+    return model_to_json(model).encode('utf-8')
+
+def _load_prophet(payload):
+    from prophet.serialize import model_from_json
+    return model_from_json(payload.decode('utf-8'))
+
+# How each kind of model is written to and read from disk
+SERIALIZERS = {
+    'prophet': (_dump_prophet, _load_prophet),
+    'xgb': (pickle.dumps, pickle.loads),
+}
+
+def fingerprint(training_data):
+    """Hash the contents of a training DataFrame (values and column names, not the index)."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(column) for column in training_data.columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(training_data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+class ModelCache:
+    """Size-bounded on-disk store of fitted models.
+
+    Entries are keyed by model kind, SKU, a fingerprint of the training slice
+    and the hyperparameters, so a SKU whose history has not changed reuses its
+    fitted model. When the store grows past ``max_bytes`` the least recently
+    used entries are evicted; a hit refreshes the entry's mtime.
+
+    Entry sizes and their LRU order are kept in memory with a running total,
+    so storing a model does not scan the directory. The directory is scanned
+    when the index is first needed, and again when the total goes over
+    ``max_bytes``, to pick up entries other processes wrote or removed.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = None
+        self._total = 0
+
+    def __getstate__(self):
+        # Sent to worker processes without the lock; each process builds its own index
+        state = dict(self.__dict__)
+        del state['_lock']
+        state['_entries'] = None
+        state['_total'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        """Rebuild the index from the directory, least recently used first. Call with the lock held."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.model'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, entry.path, stat.st_size))
+        entries.sort()
+        self._entries = OrderedDict((path, size) for _, path, size in entries)
+        self._total = sum(self._entries.values())
+
+    def _touch(self, path, size=None):
+        """Mark an entry most recently used, recording its new ``size`` if it was (re)written."""
+        with self._lock:
+            if self._entries is None:
+                self._scan()
+            if size is not None:
+                self._total += size - self._entries.pop(path, 0)
+                self._entries[path] = size
+            elif path in self._entries:
+                self._entries.move_to_end(path)
+
+    def make_key(self, kind, sku, training_data, params=None):
+        key_data = json.dumps({
+            'kind': kind,
+            'sku': str(sku),
+            'data': fingerprint(training_data),
+            'params': params or {},
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def _path(self, kind, key):
+        return os.path.join(self.directory, f"{kind}-{key}.model")
+
+    def get(self, kind, key):
+        """Return the cached model, or None on a miss or unreadable entry."""
+        path = self._path(kind, key)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self._forget(path)
+            return None
+        self._touch(path)
+        _, load = SERIALIZERS[kind]
+        try:
+            return load(payload)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cached model {path}: {str(e)}")
+            self._remove(path)
+            return None
+
+    def put(self, kind, key, model):
+        """Store a model atomically, then evict old entries if over budget."""
+        dump, _ = SERIALIZERS[kind]
+        payload = dump(model)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path(kind, key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self._touch(self._path(kind, key), len(payload))
+        if self._total > self.max_bytes:
+            self.evict()
+
+    def get_or_fit(self, kind, sku, training_data, params, fit):
+        """Return the cached model for this SKU/data/params, fitting and storing it on a miss."""
+        key = self.make_key(kind, sku, training_data, params)
+        model = self.get(kind, key)
+        if model is None:
+            model = fit()
+            try:
+                self.put(kind, key, model)
+            except Exception as e:
+                # A full disk or similar should not fail the forecast itself
+                logger.warning(f"Could not cache {kind} model for SKU {sku}: {str(e)}")
+        return model
+
+    def evict(self):
+        """Delete least recently used entries until the store fits in ``max_bytes``."""
+        with self._lock:
+            self._scan()
+            while self._total > self.max_bytes and self._entries:
+                path, size = self._entries.popitem(last=False)
+                self._total -= size
+                self._delete(path)
+
+    def _forget(self, path):
+        with self._lock:
+            if self._entries is not None and path in self._entries:
+                self._total -= self._entries.pop(path)
+
+    def _remove(self, path):
+        self._forget(path)
+        self._delete(path)
+
+    def _delete(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
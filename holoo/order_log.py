@@ -0,0 +1,296 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+from storage import get_storage, atomic_write, MANIFEST_FILE
+
+logger = logging.getLogger(__name__)
+
+# Partitions with at least this many segments are merged by compact()
+COMPACTION_MIN_SEGMENTS = 8
+# Seconds between background compactions
+COMPACTION_INTERVAL = 6 * 3600
+# Partition for rows whose date could not be parsed
+UNKNOWN_PARTITION = 'unknown'
+# In the names of segments of daily totals, whose order ids are only in the manifest
+DEMAND_MARKER = '-demand-'
+
+def _normalize_id(value):
+    """Order ids may come back as floats from CSV; index them as plain strings."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+class OrderLog:
+    """Append-only, date-partitioned order history with a persistent order_id index.
+
+    Each sync writes only its new rows as one segment file per order date, next
+    to the history rather than rewriting it. A segment becomes visible once its
+    manifest line (segment id and order ids) is appended; the same manifest
+    doubles as the dedup index, held in memory as a set for O(1) lookups.
+    ``compact()`` periodically merges a partition's small segments into one and
+    commits by atomically rewriting the manifest.
+
+    The log has a single writer: appends, compaction and crash recovery keep
+    the manifest in memory, so only one process may open it writable. Other
+    processes open it ``read_only``, which only reads the committed history.
+    """
+
+    def __init__(self, storage=None, dataset='input_data', read_only=False):
+        self.storage = storage or get_storage()
+        self.dataset = dataset
+        self.read_only = read_only
+        self.root = self.storage.dataset_dir(dataset)
+        self.manifest_path = os.path.join(self.root, MANIFEST_FILE)
+        self._lock = threading.Lock()
+        self._compaction_thread = None
+        self._segments = {}
+        self._order_ids = set()
+        if read_only:
+            return
+        self._migrate_legacy_file()
+        os.makedirs(self.root, exist_ok=True)
+        self._load()
+        self._ingest_legacy_file()
+
+    def __contains__(self, order_id):
+        return _normalize_id(order_id) in self._order_ids
+
+    def order_count(self):
+        """Number of distinct orders in the committed history."""
+        if self.read_only:
+            segments, _ = self.storage.read_manifest(self.dataset)
+            return len({order_id for ids in segments.values() for order_id in ids})
+        return len(self._order_ids)
+
+    def _load(self):
+        self._repair_manifest()
+        self._segments, tombstones = self.storage.read_manifest(self.dataset)
+        self._order_ids = {order_id for ids in self._segments.values() for order_id in ids}
+        self._recover(tombstones)
+
+    def _repair_manifest(self):
+        """Drop a torn final line left by a crash so later appends start on a fresh line."""
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, 'rb') as f:
+            content = f.read()
+        if content and not content.endswith(b'\n'):
+            keep = content[:content.rfind(b'\n') + 1]
+            atomic_write(self.manifest_path, lambda tmp_path: open(tmp_path, 'wb').write(keep))
+
+    def _recover(self, tombstones):
+        """Reconcile segment files on disk with the manifest after a crash."""
+        recovered = []
+        for partition in sorted(os.listdir(self.root)):
+            partition_dir = os.path.join(self.root, partition)
+            if not os.path.isdir(partition_dir):
+                continue
+            for filename in sorted(os.listdir(partition_dir)):
+                if filename.startswith('.'):
+                    # Temporary file from an interrupted write
+                    os.remove(os.path.join(partition_dir, filename))
+                    continue
+                segment, extension = os.path.splitext(filename)
+                segment = f"{partition}/{segment}"
+                if extension != self.storage.extension or segment in self._segments:
+                    continue
+                path = os.path.join(partition_dir, filename)
+                if segment in tombstones or '-compact-' in segment:
+                    # Superseded by a committed compaction, or output of one that never committed
+                    os.remove(path)
+                    continue
+                if DEMAND_MARKER in segment:
+                    # Daily totals whose order ids were never indexed; their sync or backfill
+                    # did not checkpoint either, so it fetches the orders again
+                    os.remove(path)
+                    continue
+                # Written before the crash but never committed to the manifest
+                rows = self.storage.read_file(path, self.dataset)
+                recovered.append(self._entry(segment, rows))
+        if recovered:
+            logger.info(f"Recovered {len(recovered)} uncommitted segment(s) in {self.root}")
+            self._commit(recovered)
+
+    def _migrate_legacy_file(self):
+        """Split an existing single-file history into partitions the first time the log is opened."""
+        legacy_path = self.storage.path(self.dataset)
+        if not os.path.exists(legacy_path) or os.path.isdir(self.root):
+            return
+        # Build the partitions aside and move them into place in one rename
+        staging = os.path.join(self.storage.directory, f".{self.dataset}.migrating")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        legacy = self.storage.read_file(legacy_path, self.dataset)
+        entries = self._write_partitions(staging, legacy)
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+        os.rename(staging, self.root)
+        logger.info(f"Migrated {len(legacy)} rows from {legacy_path} into {self.root}")
+        self._retire_legacy_file(legacy_path)
+
+    def _ingest_legacy_file(self):
+        """Append the orders of a single-file history placed next to an existing log.
+
+        Rows go through ``append``, so orders already in the log are skipped.
+        A file whose rows cannot be deduplicated, or that fails to load, is left
+        in place for an operator to look at.
+        """
+        legacy_path = self.storage.path(self.dataset)
+        if not os.path.exists(legacy_path):
+            return
+        try:
+            legacy = self.storage.read_file(legacy_path, self.dataset)
+            if 'order_id' not in legacy.columns:
+                logger.error(f"Error ingesting {legacy_path}: it has no order_id column to deduplicate "
+                             f"against {self.root}; leaving it in place")
+                return
+            written = self.append(legacy)
+        except Exception as e:
+            logger.error(f"Error ingesting {legacy_path} into {self.root}: {str(e)}")
+            return
+        logger.info(f"Ingested {written} of {len(legacy)} rows from {legacy_path} into {self.root}")
+        self._retire_legacy_file(legacy_path)
+
+    def _retire_legacy_file(self, legacy_path):
+        """Keep a migrated file as a backup, without replacing the backup of an earlier migration."""
+        backup = legacy_path + '.migrated'
+        number = 1
+        while os.path.exists(backup):
+            backup = f"{legacy_path}.migrated.{number}"
+            number += 1
+        os.rename(legacy_path, backup)
+
+    def _entry(self, segment, rows):
+        order_ids = []
+        if 'order_id' in rows.columns:
+            order_ids = sorted({_normalize_id(order_id) for order_id in rows['order_id'].dropna()})
+        return {'segment': segment, 'order_ids': order_ids}
+
+    def _write_partitions(self, root, df, compacted=False, order_ids=None):
+        """Write ``df`` as one new segment per order date under ``root``; returns manifest entries.
+
+        ``order_ids`` (see ``append``) are added to the entry of their date's segment.
+        """
+        dates = pd.to_datetime(df['date'], errors='coerce')
+        df = df.assign(date=dates)
+        partitions = dates.dt.strftime('%Y-%m-%d').fillna(UNKNOWN_PARTITION)
+        entries = []
+        for partition, rows in df.groupby(partitions, sort=True):
+            separator = '-' if order_ids is None else DEMAND_MARKER
+            name = f"{time.time_ns():020d}{separator}{uuid.uuid4().hex[:8]}"
+            segment = f"{partition}/{name}"
+            os.makedirs(os.path.join(root, partition), exist_ok=True)
+            self.storage.write_file(os.path.join(root, segment + self.storage.extension), self.dataset, rows)
+            entry = self._entry(segment, rows)
+            if order_ids is not None:
+                entry['order_ids'] = sorted(set(entry['order_ids'])
+                                            | {_normalize_id(order_id) for order_id in order_ids.get(partition, [])})
+            entries.append(entry)
+        return entries
+
+    def _commit(self, entries):
+        """Append manifest lines and fsync; this is what makes segments visible."""
+        with open(self.manifest_path, 'a') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        for entry in entries:
+            self._segments[entry['segment']] = entry['order_ids']
+            self._order_ids.update(entry['order_ids'])
+
+    def append(self, df, order_ids=None):
+        """Append the rows of orders not seen before. Returns the number of rows written.
+
+        Rows without an ``order_id`` cannot be deduplicated and are always written.
+        Rows that sum up many orders, such as the daily totals of a
+        ``DemandCounter``, pass those orders as ``order_ids`` (order date ->
+        ids) to have them indexed; the caller leaves out orders already in the log.
+        """
+        if self.read_only:
+            raise PermissionError(f"Order log {self.root} is open read-only")
+        if df.empty:
+            return 0
+        with self._lock:
+            df = df.reset_index(drop=True)
+            if 'order_id' in df.columns:
+                normalized = df['order_id'].map(_normalize_id)
+                new_rows = df['order_id'].isna() | ~normalized.isin(self._order_ids)
+                df = df[new_rows]
+            if df.empty:
+                return 0
+            self._commit(self._write_partitions(self.root, df, order_ids=order_ids))
+            return len(df)
+
+    def read(self, columns=None, filters=None):
+        """Read the committed history (see Storage.read)."""
+        return self.storage.read(self.dataset, columns=columns, filters=filters)
+
+    def compact(self, min_segments=COMPACTION_MIN_SEGMENTS):
+        """Merge partitions holding at least ``min_segments`` segments. Returns the number merged."""
+        if self.read_only:
+            return 0
+        with self._lock:
+            partitions = {}
+            for segment in self._segments:
+                partitions.setdefault(segment.split('/')[0], []).append(segment)
+            segments = dict(self._segments)
+            replaced = []
+            for partition, old_segments in sorted(partitions.items()):
+                if len(old_segments) < min_segments:
+                    continue
+                old_segments = sorted(old_segments)
+                merged = pd.concat(
+                    [self.storage.read_file(self.storage.segment_path(self.dataset, segment), self.dataset)
+                     for segment in old_segments],
+                    ignore_index=True
+                )
+                # Keep the first segment's timestamp so the merged segment sorts in its place
+                first_name = old_segments[0].split('/')[1].split('-')[0]
+                segment = f"{partition}/{first_name}-compact-{uuid.uuid4().hex[:8]}"
+                self.storage.write_file(self.storage.segment_path(self.dataset, segment), self.dataset, merged)
+                # The ids of daily totals are only in the manifest, so carry them over rather than reading the rows
+                segments[segment] = sorted({order_id for old_segment in old_segments
+                                            for order_id in segments.pop(old_segment)})
+                replaced.extend(old_segments)
+            if not replaced:
+                return 0
+
+            # Commit point: readers switch to the merged segments in one atomic rename
+            def write_manifest(tmp_path):
+                with open(tmp_path, 'w') as f:
+                    for segment in sorted(segments):
+                        f.write(json.dumps({'segment': segment, 'order_ids': segments[segment]}) + '\n')
+                    f.write(json.dumps({'compacted': replaced}) + '\n')
+            atomic_write(self.manifest_path, write_manifest)
+            self._segments = segments
+
+            for old_segment in replaced:
+                try:
+                    os.remove(self.storage.segment_path(self.dataset, old_segment))
+                except FileNotFoundError:
+                    pass
+            logger.info(f"Compacted {len(replaced)} segments in {self.root}")
+            return len(replaced)
+
+    def start_background_compaction(self, interval=COMPACTION_INTERVAL):
+        """Run compact() every ``interval`` seconds in a daemon thread."""
+        if self._compaction_thread is not None:
+            return
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"Error compacting order log: {str(e)}")
+        self._compaction_thread = threading.Thread(target=run, daemon=True)
+        self._compaction_thread.start()
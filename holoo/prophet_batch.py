@@ -0,0 +1,127 @@
+import copy
+import logging
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Date frames and seasonality matrices kept for reuse by later predictions
+MAX_CACHED_FRAMES = 64
+
+class _LruCache:
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def get(self, key, build):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        value = build()
+        self._entries[key] = value
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        return value
+
+_future_dates = _LruCache(MAX_CACHED_FRAMES)
+_seasonal_matrices = _LruCache(MAX_CACHED_FRAMES)
+
+def future_dates(start, periods):
+    """The ``periods`` days from ``start``, one shared index per start and length."""
+    start = pd.Timestamp(start)
+    return _future_dates.get(('range', start, periods), lambda: pd.date_range(start=start, periods=periods))
+
+def history_and_future_dates(model, horizon):
+    """The dates of ``model.make_future_dataframe(periods=horizon, freq='D')``, shared by models fit on the same days."""
+    history = model.history_dates.to_numpy(dtype='datetime64[ns]')
+    def build():
+        last_date = pd.Timestamp(history[-1])
+        dates = pd.date_range(start=last_date, periods=horizon + 1, freq='D')
+        return pd.DatetimeIndex(np.concatenate((history, dates[dates > last_date][:horizon].to_numpy())))
+    return _future_dates.get(('history', history.tobytes(), horizon), build)
+
+def _seasonality_spec(model):
+    return tuple((name, props['period'], props['fourier_order']) for name, props in model.seasonalities.items())
+
+def _seasonal_matrix(model, dates, dates_key):
+    """Prophet's seasonality design matrix of ``dates``, computed once per date frame and seasonality setup."""
+    spec = _seasonality_spec(model)
+    def build():
+        ds = pd.Series(dates)
+        features = [model.make_seasonality_features(ds, period, order, name).to_numpy() for name, period, order in spec]
+        # Prophet fits a single all-zero column when there is no seasonality
+        return np.hstack(features) if features else np.zeros((len(dates), 1))
+    return _seasonal_matrices.get((dates_key, spec), build)
+
+def batchable(model):
+    """Whether ``model``'s yhat can be computed by predict_yhat: linear trend and additive seasonalities only."""
+    holidays = model.holidays is not None or model.country_holidays is not None
+    conditional = any(props['condition_name'] is not None for props in model.seasonalities.values())
+    multiplicative = any(props['mode'] != 'additive' for props in model.seasonalities.values())
+    return (model.growth == 'linear' and not model.logistic_floor and not model.extra_regressors
+            and not holidays and not conditional and not multiplicative)
+
+def predict_without_uncertainty(model, df):
+    """``model.predict(df)`` without sampling uncertainty intervals, leaving ``model`` itself unchanged."""
+    model = copy.copy(model)
+    model.uncertainty_samples = 0
+    return model.predict(df)
+
+def predict_yhat(models, dates, dates_key=None):
+    """yhat of each fitted Prophet model on the same ``dates``, as an ``(n_models, len(dates))`` array.
+
+    Computes what ``predict`` gives without its uncertainty sampling, straight
+    from the fitted parameters: the piecewise linear trends of all models at
+    once, plus one matrix product of the shared seasonality design matrix with
+    the stacked seasonality coefficients. Models that are not ``batchable``
+    fall back to ``predict`` without uncertainty. ``dates_key`` identifies
+    ``dates`` in the matrix cache (default: the dates themselves).
+    """
+    dates = pd.DatetimeIndex(dates)
+    days = dates.to_numpy(dtype='datetime64[ns]')
+    if dates_key is None:
+        dates_key = days.tobytes()
+    yhat = np.empty((len(models), len(dates)))
+    groups = {}
+    for i, model in enumerate(models):
+        if batchable(model):
+            groups.setdefault(_seasonality_spec(model), []).append(i)
+        else:
+            yhat[i] = predict_without_uncertainty(model, pd.DataFrame({'ds': dates}))['yhat'].to_numpy()
+    for rows in groups.values():
+        group = [models[i] for i in rows]
+        X = _seasonal_matrix(group[0], dates, dates_key)
+        # A stack of matrix-vector products rounds exactly like predict's, unlike one matrix-matrix product
+        seasonal = np.matmul(X[None], _stack(group, 'beta')[:, :, None])[:, :, 0]
+        yhat[rows] = _linear_trends(group, days) + seasonal * _scales(group)
+    return yhat
+
+def _stack(models, name):
+    # Parameters are averaged over posterior samples, as predict does
+    return np.array([np.nanmean(model.params[name], axis=0) for model in models])
+
+def _scales(models):
+    return np.array([model.y_scale for model in models], dtype=float)[:, None]
+
+def _linear_trends(models, days):
+    """Piecewise linear trends of the models on ``days`` in the data's units, with the changepoints zero-padded."""
+    k = _stack(models, 'k').reshape(-1, 1)
+    m = _stack(models, 'm').reshape(-1, 1)
+    width = max(len(model.changepoints_t) for model in models)
+    changepoints = np.zeros((len(models), width))
+    deltas = np.zeros((len(models), width))
+    floors = np.zeros((len(models), 1))
+    t = np.empty((len(models), len(days)))
+    for i, model in enumerate(models):
+        count = len(model.changepoints_t)
+        changepoints[i, :count] = model.changepoints_t
+        deltas[i, :count] = np.nanmean(model.params['delta'], axis=0)
+        # Releases before 1.1.5 have no ``scaling`` option and always use a floor of 0
+        floors[i] = model.y_min if getattr(model, 'scaling', 'absmax') == 'minmax' else 0.0
+        t[i] = (days - np.datetime64(model.start, 'ns')) / np.timedelta64(model.t_scale, 'ns')
+    deltas_t = (changepoints[:, None, :] <= t[:, :, None]) * deltas[:, None, :]
+    k_t = deltas_t.sum(axis=2) + k
+    m_t = (deltas_t * -changepoints[:, None, :]).sum(axis=2) + m
+    return (k_t * t + m_t) * _scales(models) + floors
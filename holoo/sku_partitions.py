@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+from features import build_features
+
+class SkuPartitions:
+    """Order history grouped by SKU once, with per-SKU slices and metadata.
+
+    The frame is sorted by ``sku_id`` and ``date`` a single time so every SKU
+    occupies a contiguous block of rows. Forecasters get that block via
+    ``get(sku)`` (a positional slice, no boolean scan over the full history)
+    and cheap lookups such as the last inventory level via ``meta``. Model
+    features are computed for the whole history in one pass on first use and
+    sliced the same way by ``features(sku)``.
+    """
+
+    def __init__(self, df, sort=True):
+        df = df[df['sku_id'].notna()]
+        # SKUs are reported in order of first appearance, like df['sku_id'].unique()
+        self.skus = list(pd.unique(df['sku_id']))
+        if sort:
+            # Multi-column sorts are stable, so same-day rows keep their file order
+            df = df.sort_values(['sku_id', 'date'])
+        self.df = df.reset_index(drop=True)
+
+        sku_values = self.df['sku_id'].to_numpy()
+        if len(sku_values):
+            boundaries = np.flatnonzero(sku_values[1:] != sku_values[:-1]) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(sku_values)]))
+        else:
+            starts = ends = np.array([], dtype=int)
+        self._bounds = dict(zip(sku_values[starts], zip(starts, ends)))
+
+        dates = self.df['date']
+        meta = {
+            'rows': ends - starts,
+            'first_date': dates.to_numpy()[starts],
+            'last_date': dates.to_numpy()[ends - 1],
+        }
+        if 'inventory_level' in self.df.columns:
+            meta['last_inventory'] = self.df['inventory_level'].to_numpy()[ends - 1]
+        self.meta = pd.DataFrame(meta, index=pd.Index(sku_values[starts], name='sku_id'))
+        self._features = None
+
+    def __len__(self):
+        return len(self.skus)
+
+    def __contains__(self, sku):
+        return sku in self._bounds
+
+    def get(self, sku):
+        """Return the history rows for a single SKU, sorted by date."""
+        start, end = self._bounds[sku]
+        return self.df.iloc[start:end]
+
+    def features(self, sku=None):
+        """Feature rows (see features.build_features) aligned with ``get(sku)``, or with ``df`` if no SKU is given."""
+        if self._features is None:
+            self._features = build_features(self.df)
+        if sku is None:
+            return self._features
+        start, end = self._bounds[sku]
+        return self._features.iloc[start:end]
+
+    def use_feature_store(self, store):
+        """Take the features from ``store`` (a FeatureStore), which only computes the days it has not seen."""
+        self._features = store.features_for(self.df)
+
+    def last_inventory(self, sku):
+        """Return the most recent inventory level recorded for a SKU."""
+        return self.meta.at[sku, 'last_inventory']
+
+    def subset(self, skus):
+        """Return partitions restricted to ``skus``, e.g. to ship a chunk to a worker."""
+        skus = [sku for sku in skus if sku in self._bounds]
+        if not skus:
+            return SkuPartitions(self.df.iloc[0:0], sort=False)
+        subset = SkuPartitions(pd.concat([self.get(sku) for sku in skus]), sort=False)
+        subset.skus = skus
+        if self._features is not None:
+            # Workers get the features already computed instead of recomputing them
+            subset._features = pd.concat([self.features(sku) for sku in skus]).set_axis(subset.df.index)
+        return subset
@@ -0,0 +1,83 @@
+import numpy as np
+
+from metrics import timed
+
+# (max days until stockout, alert) from most to least severe
+ALERT_TIERS = [
+    (3, "CRITICAL: Stockout within 3 days!"),
+    (7, "URGENT: Stockout within a week!"),
+    (14, "WARNING: Stockout within two weeks"),
+]
+ALERT_OK = "OK"
+ALERT_NONE = "NO ALERT"
+
+def first_crossing(forecast, inventory, extrapolate=False):
+    """Index of the first day cumulative forecast demand exceeds the inventory, per row.
+
+    ``forecast`` is an ``(n_skus, horizon)`` matrix of daily demand and
+    ``inventory`` the stock on hand per row. The index equals the number of
+    whole days the stock lasts; it is -1 where the stock outlasts the forecast.
+    With ``extrapolate`` such rows keep depleting at the forecast's mean daily
+    rate past the horizon instead (rows with a non-positive rate stay -1).
+    """
+    forecast = np.asarray(forecast, dtype=float)
+    inventory = np.asarray(inventory, dtype=float)
+    cumulative = np.cumsum(forecast, axis=1)
+    # NaN inventory never compares greater, so those rows never stock out
+    crossed = cumulative > inventory[:, None]
+    days = np.where(crossed.any(axis=1), crossed.argmax(axis=1), -1)
+    if extrapolate and forecast.shape[1]:
+        rate = forecast.mean(axis=1)
+        beyond = (days < 0) & (rate > 0) & ~np.isnan(inventory)
+        remaining = inventory[beyond] - cumulative[beyond, -1]
+        days[beyond] = forecast.shape[1] + np.floor(remaining / rate[beyond]).astype(np.int64)
+    return days
+
+def alert_tiers(days_until):
+    """Vectorized get_stockout_alert: ``days_until`` < 0 means no stockout projected."""
+    days_until = np.asarray(days_until)
+    conditions = [days_until < 0] + [days_until <= limit for limit, _ in ALERT_TIERS]
+    choices = [ALERT_NONE] + [alert for _, alert in ALERT_TIERS]
+    return np.select(conditions, choices, default=ALERT_OK)
+
+def stockout_dates(dates, days):
+    """Date of day ``days`` of each row of an ``(n_skus, horizon)`` date matrix; NaT where ``days`` < 0.
+
+    Days past the horizon (from extrapolation) count on from the last column.
+    """
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    horizon = dates.shape[1]
+    picked = dates[np.arange(len(dates)), np.clip(days, 0, horizon - 1)]
+    picked = picked + np.maximum(days - (horizon - 1), 0).astype('timedelta64[D]')
+    return np.where(days >= 0, picked, np.datetime64('NaT'))
+
+@timed('stockout')
+def compute_stockouts(forecast, inventory, dates, restock_days=14, lower=None, upper=None, extrapolate=False):
+    """Stockout analysis for every SKU in one pass over the forecast matrix.
+
+    ``dates`` holds the date of each forecast column per row. Returns a dict of
+    per-row arrays:
+
+    - ``first_day``: first_crossing() of the forecast
+    - ``stockout_date``: date of that day (NaT if none)
+    - ``restock``: stockout within ``restock_days`` of the first forecast date
+    - ``alert``: alert tier for ``first_day`` days until stockout
+
+    Given Prophet's ``yhat_upper``/``yhat_lower`` matrices, ``earliest_date``
+    and ``latest_date`` are the stockout dates at those quantiles.
+    """
+    first_day = first_crossing(forecast, inventory, extrapolate)
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    stockout_date = stockout_dates(dates, first_day)
+    restock = ~np.isnat(stockout_date) & ((stockout_date - dates[:, 0]) <= np.timedelta64(restock_days, 'D'))
+    result = {
+        'first_day': first_day,
+        'stockout_date': stockout_date,
+        'restock': restock,
+        'alert': alert_tiers(first_day),
+    }
+    if upper is not None:
+        result['earliest_date'] = stockout_dates(dates, first_crossing(upper, inventory, extrapolate))
+    if lower is not None:
+        result['latest_date'] = stockout_dates(dates, first_crossing(lower, inventory, extrapolate))
+    return result
@@ -1,115 +1,272 @@
 import pandas as pd
 import numpy as np
-from prophet import Prophet
 from datetime import datetime, timedelta
-import xgboost as xgb
-from sklearn.metrics import mean_absolute_error, mean_squared_error
+import argparse
+from collections import Counter
+from sku_partitions import SkuPartitions
+from features import build_features, calendar, FeatureStore, CALENDAR_FEATURES
+from storage import get_storage
+from daily_demand import load_daily_demand
+from model_cache import ModelCache, DEFAULT_MAX_BYTES
+from forecast_results import ResultWriter
+from inventory_forecast import positive_int
+from prophet_batch import predict_yhat, future_dates
+from stockout_engine import compute_stockouts, alert_tiers
+from metrics import timed, span, profiled, print_summary
 import warnings
 warnings.filterwarnings('ignore')
 
-def load_data(file_path):
+# Model hyperparameters; also part of the model cache key
+PROPHET_PARAMS = {'yearly_seasonality': False, 'weekly_seasonality': True, 'daily_seasonality': False}
+XGB_PARAMS = {'objective': 'reg:squarederror', 'random_state': 42}
+# Boosting rounds added on top of the previous model when warm-starting XGBoost
+XGB_WARM_START_ROUNDS = 20
+# Warm starts stop adding rounds at this many trees: the next refit starts from scratch, so
+# the booster (and its predict time) stays bounded and does not drift from a cold fit
+XGB_MAX_WARM_START_TREES = 200
+
+@timed('load_data')
+def load_data(storage=None):
     """Load and preprocess the data"""
-    df = pd.read_csv(file_path)
-    df['date'] = pd.to_datetime(df['date'])
-    return df
-
-def prepare_prophet_data(df, sku, end_date=None):
-    """Prepare data for Prophet model"""
-    sku_data = df[df['sku_id'] == sku].copy()
-    if end_date:
-        sku_data = sku_data[sku_data['date'] <= end_date]
+    # Streamed and summed into one row per SKU and day (see daily_demand)
+    return load_daily_demand(storage)
+
+def prepare_prophet_data(sku_data, end_date=None):
+    """Prepare data for Prophet model from a single SKU's date-sorted history"""
+    if end_date is not None:
+        # History is sorted by date, so the cut-off is a positional slice
+        sku_data = sku_data.iloc[:sku_data['date'].searchsorted(end_date, side='right')]
     prophet_df = sku_data[['date', 'units_sold']].rename(columns={'date': 'ds', 'units_sold': 'y'})
     return prophet_df, sku_data
 
-def train_prophet_model(prophet_df):
-    """Train Prophet model"""
-    model = Prophet(yearly_seasonality=False, 
-                   weekly_seasonality=True,
-                   daily_seasonality=False)
-    model.fit(prophet_df)
+@timed('prophet_fit')
+def train_prophet_model(prophet_df, init=None, cache=None, sku=None):
+    """Train Prophet model, optionally warm-started from previous parameters
+
+    Cold fits are looked up in ``cache`` (a ModelCache) first when one is given.
+    """
+    # Deferred: importing Prophet loads cmdstanpy and takes over a second
+    from prophet import Prophet
+    def fit():
+        model = Prophet(**PROPHET_PARAMS)
+        model.fit(prophet_df)
+        return model
+    if init is None:
+        if cache is None:
+            return fit()
+        return cache.get_or_fit('prophet', sku, prophet_df, PROPHET_PARAMS, fit)
+    model = Prophet(**PROPHET_PARAMS)
+    try:
+        model.fit(prophet_df, init=init)
+    except Exception:
+        # The changepoint count grows with short histories, so old parameters
+        # may not fit the new model's shape; fall back to a cold start.
+        model = fit()
     return model
 
-def train_xgboost_model(sku_data):
-    """Train XGBoost model"""
-    # Create features
-    sku_data['day_of_week'] = sku_data['date'].dt.dayofweek
-    sku_data['month'] = sku_data['date'].dt.month
-    sku_data['day'] = sku_data['date'].dt.day
+def prophet_warm_start_params(model):
+    """Extract a fitted Prophet model's parameters to initialise the next fit"""
+    params = {}
+    for name in ['k', 'm', 'sigma_obs']:
+        params[name] = model.params[name][0][0]
+    for name in ['delta', 'beta']:
+        params[name] = model.params[name][0]
+    return params
+
+def xgb_warm_start_base(init_model):
+    """The model to continue boosting, or None for a cold refit once it has XGB_MAX_WARM_START_TREES trees"""
+    if init_model is None:
+        return None
+    trees = init_model.get_booster().num_boosted_rounds()
+    return init_model if trees + XGB_WARM_START_ROUNDS <= XGB_MAX_WARM_START_TREES else None
+
+@timed('xgb_fit')
+def train_xgboost_model(sku_data, init_model=None, cache=None, feature_rows=None):
+    """Train XGBoost model, optionally continuing to boost ``init_model``
+
+    ``feature_rows`` are the precomputed features of ``sku_data``'s rows (see features.build_features).
+    """
+    if feature_rows is None:
+        feature_rows = build_features(sku_data)
     
     # Prepare features and target
-    features = ['day_of_week', 'month', 'day']
-    X = sku_data[features]
+    features = CALENDAR_FEATURES
+    X = feature_rows[features]
     y = sku_data['units_sold']
     
     # Train model
-    model = xgb.XGBRegressor(objective='reg:squarederror', random_state=42)
-    model.fit(X, y)
+    init_model = xgb_warm_start_base(init_model)
+    if init_model is None and cache is not None:
+        key_params = {'model': XGB_PARAMS, 'features': features}
+        model = cache.get_or_fit('xgb', sku_data['sku_id'].iloc[0], sku_data[['date', 'units_sold']],
+                                 key_params, lambda: fit_xgboost(X, y))
+    else:
+        model = fit_xgboost(X, y, init_model)
+    return model, features
+
+def fit_xgboost(X, y, init_model=None):
+    """Fit a regressor from scratch, or add a few rounds on top of a previous one"""
+    import xgboost as xgb
+    if init_model is None:
+        model = xgb.XGBRegressor(**XGB_PARAMS)
+        model.fit(X, y)
+    else:
+        model = xgb.XGBRegressor(**XGB_PARAMS, n_estimators=XGB_WARM_START_ROUNDS)
+        model.fit(X, y, xgb_model=init_model.get_booster())
+    return model
+
+@timed('xgb_global_fit')
+def train_global_xgboost_model(history, sku_codes, init_model=None, cache=None, feature_rows=None):
+    """Train one XGBoost model across all SKUs, with the SKU encoded as a feature"""
+    features = CALENDAR_FEATURES + ['sku_code']
+    if feature_rows is None:
+        feature_rows = build_features(history)
+    X = feature_rows[CALENDAR_FEATURES].assign(sku_code=history['sku_id'].map(sku_codes).astype(int))
+    y = history['units_sold']
+    
+    init_model = xgb_warm_start_base(init_model)
+    if init_model is None and cache is not None:
+        key_params = {'model': XGB_PARAMS, 'features': features}
+        model = cache.get_or_fit('xgb', '*', history[['sku_id', 'date', 'units_sold']],
+                                 key_params, lambda: fit_xgboost(X[features], y))
+    else:
+        model = fit_xgboost(X[features], y, init_model)
     return model, features
 
+@timed('xgb_predict')
+def forecast_sales_global(model, features, sku_codes, skus, last_date, forecast_days=30):
+    """Generate sales forecasts for many SKUs with a single predict call
+
+    Returns a DataFrame indexed by future date with one column per SKU.
+    """
+    future_dates = pd.date_range(start=last_date + timedelta(days=1), periods=forecast_days)
+    n_skus = len(skus)
+    future_df = pd.DataFrame({
+        name: np.tile(values, n_skus) for name, values in calendar(future_dates.to_numpy()).items()
+    })
+    future_df['sku_code'] = np.repeat([sku_codes[sku] for sku in skus], forecast_days)
+    forecast = model.predict(future_df[features]).reshape(n_skus, forecast_days)
+    return pd.DataFrame(forecast.T, index=future_dates, columns=skus)
+
+@timed('xgb_predict')
 def forecast_sales(model, features, last_date, forecast_days=30):
     """Generate sales forecast"""
     # Create future dates
     future_dates = pd.date_range(start=last_date + timedelta(days=1), periods=forecast_days)
     
     # Prepare features for future dates
-    future_df = pd.DataFrame({
-        'date': future_dates,
-        'day_of_week': future_dates.dayofweek,
-        'month': future_dates.month,
-        'day': future_dates.day
-    })
+    future_df = pd.DataFrame(calendar(future_dates.to_numpy()))
     
     # Make predictions
     forecast = model.predict(future_df[features])
     return pd.Series(forecast, index=future_dates)
 
-def calculate_stockout_date(current_inventory, daily_sales, start_date):
-    """Calculate estimated stockout date"""
-    if daily_sales <= 0:
-        return None
-    days_until_stockout = int(current_inventory / daily_sales)
-    return start_date + timedelta(days=days_until_stockout)
+def calculate_stockouts(current_date, inventory, forecasts, lower=None, upper=None):
+    """Stockout dates and alerts for all SKUs forecast as of ``current_date``
+
+    ``forecasts`` is an ``(n_skus, forecast_days)`` matrix of daily sales. The
+    stock runs out once cumulative forecast sales exceed the inventory; past
+    the forecast it keeps depleting at the forecast's average rate. Days until
+    stockout count the whole days the stock lasts, so a flat forecast gives
+    ``int(inventory / daily_sales)``. Prophet's interval bounds, if given, add
+    the earliest and latest stockout dates.
+    """
+    n_skus, forecast_days = np.shape(forecasts)
+    dates = np.datetime64(current_date, 'D') + np.tile(np.arange(forecast_days), (n_skus, 1))
+    return compute_stockouts(forecasts, inventory, dates, lower=lower, upper=upper, extrapolate=True)
 
 def get_stockout_alert(days_until_stockout):
     """Generate stockout alert based on days until stockout"""
-    if days_until_stockout is None:
-        return "NO ALERT"
-    elif days_until_stockout <= 3:
-        return "CRITICAL: Stockout within 3 days!"
-    elif days_until_stockout <= 7:
-        return "URGENT: Stockout within a week!"
-    elif days_until_stockout <= 14:
-        return "WARNING: Stockout within two weeks"
-    else:
-        return "OK"
+    return str(alert_tiers(-1 if days_until_stockout is None else days_until_stockout))
 
-def main():
-    # Load data
-    df = load_data('input_data.csv')
-    
-    # Get unique SKUs
-    skus = df['sku_id'].unique()
+class WalkForwardState:
+    """Models carried from one backtest date to the next for a single SKU"""
+    def __init__(self):
+        self.prophet_model = None
+        self.xgb_model = None
+        self.features = None
+        self.dates_since_fit = None
+
+    def needs_refit(self, refit_every):
+        return self.dates_since_fit is None or self.dates_since_fit + 1 >= refit_every
+
+def walk_forward_backtest(partitions, refit_every=1, warm_start=False, global_xgb=False, forecast_days=30,
+                          cache=None, quantiles=False):
+    """Replay history date by date and return the stockout forecasts as of every date (see iter_walk_forward)"""
+    return [row for _, rows in iter_walk_forward(partitions, refit_every, warm_start, global_xgb, forecast_days,
+                                                 cache, quantiles)
+            for row in rows]
+
+def iter_walk_forward(partitions, refit_every=1, warm_start=False, global_xgb=False, forecast_days=30,
+                      cache=None, quantiles=False, skip_dates=None):
+    """Replay history date by date and yield ``(date, result rows)`` as each date is forecast
+
+    Models are refit every ``refit_every`` dates of a SKU's history and reused
+    to predict in between. With ``warm_start`` a refit starts Prophet from the
+    previous fit's parameters and continues boosting the previous XGBoost model
+    instead of training from scratch. Cold fits are reused from ``cache`` when
+    the same history was fit on a previous run. With ``quantiles`` the results
+    also give the stockout dates implied by Prophet's uncertainty interval.
+    Dates in ``skip_dates`` (e.g. already written by an interrupted run) are
+    not forecast; models due a refit then refit on the first date that is.
+    """
+    if refit_every < 1:
+        raise ValueError(f"refit_every must be at least 1, got {refit_every}")
+    sku_codes = {sku: code for code, sku in enumerate(partitions.skus)}
+    states = {}
+    global_state = WalkForwardState()
     
-    # Initialize results storage
-    results = []
+    # Every date that has sales, with the SKUs that sold on it
+    snapshots = partitions.df[['date', 'sku_id']].drop_duplicates()
     
-    for sku in skus:
-        # Get all dates for this SKU
-        dates = df[df['sku_id'] == sku]['date'].unique()
+    # Walk through history date by date, making a forecast for each SKU
+    for current_date, date_skus in snapshots.groupby('date', sort=True)['sku_id']:
+        if skip_dates and str(current_date) in skip_dates:
+            continue
+        date_skus = list(date_skus)
+        forecasted = []
+        prophet_models = []
+        xgb_forecasts = []
         
-        # For each date, make a forecast
-        for current_date in dates:
+        # In global mode one model per date covers every SKU
+        global_forecasts = None
+        if global_xgb:
+            if global_state.needs_refit(refit_every):
+                in_history = (partitions.df['date'] <= current_date).to_numpy()
+                history = partitions.df[in_history]
+                init_model = global_state.xgb_model if warm_start else None
+                global_state.xgb_model, global_state.features = train_global_xgboost_model(
+                    history, sku_codes, init_model=init_model, cache=cache,
+                    feature_rows=partitions.features()[in_history])
+                global_state.dates_since_fit = 0
+            else:
+                global_state.dates_since_fit += 1
+            global_forecasts = forecast_sales_global(global_state.xgb_model, global_state.features, sku_codes,
+                                                     date_skus, current_date, forecast_days)
+        
+        for sku in date_skus:
             # Prepare data up to current date
-            prophet_df, sku_data = prepare_prophet_data(df, sku, current_date)
+            prophet_df, sku_data = prepare_prophet_data(partitions.get(sku), current_date)
             
             if len(prophet_df) < 7:  # Need at least a week of data
                 continue
-                
-            # Train Prophet model
-            prophet_model = train_prophet_model(prophet_df)
             
-            # Train XGBoost model
-            xgb_model, features = train_xgboost_model(sku_data)
+            # Train models, or keep the previous fit until the next refit is due
+            state = states.setdefault(sku, WalkForwardState())
+            if state.needs_refit(refit_every):
+                if warm_start and state.prophet_model is not None:
+                    state.prophet_model = train_prophet_model(prophet_df, init=prophet_warm_start_params(state.prophet_model))
+                else:
+                    state.prophet_model = train_prophet_model(prophet_df, cache=cache, sku=sku)
+                if not global_xgb:
+                    init_model = state.xgb_model if warm_start else None
+                    # Features are computed once per SKU; the history up to this date is a prefix of them
+                    feature_rows = partitions.features(sku).iloc[:len(sku_data)]
+                    state.xgb_model, state.features = train_xgboost_model(sku_data, init_model=init_model,
+                                                                          cache=cache, feature_rows=feature_rows)
+                state.dates_since_fit = 0
+            else:
+                state.dates_since_fit += 1
             
             # Get current inventory
             current_inventory = sku_data['inventory_level'].iloc[-1]
@@ -118,47 +275,118 @@ def main():
             if current_inventory == 0:
                 continue
             
-            # Generate forecasts
-            future_dates = pd.date_range(start=current_date + timedelta(days=1), periods=30)
-            prophet_forecast = prophet_model.predict(pd.DataFrame({'ds': future_dates}))
-            xgb_forecast = forecast_sales(xgb_model, features, current_date)
-            
-            # Combine forecasts (simple average)
-            combined_forecast = (prophet_forecast['yhat'].values + xgb_forecast.values) / 2
-            
-            # Calculate average daily sales
-            avg_daily_sales = np.mean(combined_forecast)
-            
-            # Calculate stockout date
-            stockout_date = calculate_stockout_date(current_inventory, avg_daily_sales, current_date)
-            
-            # Calculate days until stockout
-            days_until_stockout = (stockout_date - current_date).days if stockout_date else None
-            
-            # Get alert
-            alert = get_stockout_alert(days_until_stockout)
-            
-            # Store results
-            results.append({
+            # Generate the XGBoost forecast; Prophet predicts all of the date's SKUs together below
+            if global_xgb:
+                xgb_forecast = global_forecasts[sku]
+            else:
+                xgb_forecast = forecast_sales(state.xgb_model, state.features, current_date, forecast_days)
+            forecasted.append((sku, current_inventory))
+            prophet_models.append(state.prophet_model)
+            xgb_forecasts.append(xgb_forecast.values)
+        
+        if not forecasted:
+            yield current_date, []
+            continue
+        # Every SKU of the date is forecast over the same days
+        dates = future_dates(current_date + timedelta(days=1), forecast_days)
+        xgb_forecasts = np.array(xgb_forecasts)
+        lower = upper = None
+        with span('prophet_predict'):
+            if quantiles:
+                # The interval comes from Prophet's sampled trajectories, one model at a time
+                prophet_forecasts = [model.predict(pd.DataFrame({'ds': dates})) for model in prophet_models]
+                yhat = np.array([forecast['yhat'].values for forecast in prophet_forecasts])
+                lower = (np.array([forecast['yhat_lower'].values for forecast in prophet_forecasts]) + xgb_forecasts) / 2
+                upper = (np.array([forecast['yhat_upper'].values for forecast in prophet_forecasts]) + xgb_forecasts) / 2
+            else:
+                yhat = predict_yhat(prophet_models, dates)
+        
+        # Combine forecasts (simple average); stockouts are computed for the whole date at once
+        combined = (yhat + xgb_forecasts) / 2
+        inventory = np.array([current_inventory for _, current_inventory in forecasted], dtype=float)
+        stockouts = calculate_stockouts(current_date, inventory, combined, lower=lower, upper=upper)
+        avg_daily_sales = np.mean(combined, axis=1)
+        results = []
+        for i, (sku, current_inventory) in enumerate(forecasted):
+            stocks_out = stockouts['first_day'][i] >= 0
+            result = {
                 'Date': current_date,
                 'SKU': sku,
                 'Current Inventory': current_inventory,
-                'Average Daily Sales': round(avg_daily_sales, 2),
-                'Days Until Stockout': days_until_stockout,
-                'Estimated Stockout Date': stockout_date,
-                'Alert': alert
-            })
+                'Average Daily Sales': round(avg_daily_sales[i], 2),
+                'Days Until Stockout': int(stockouts['first_day'][i]) if stocks_out else None,
+                'Estimated Stockout Date': pd.Timestamp(stockouts['stockout_date'][i]) if stocks_out else None,
+                'Alert': str(stockouts['alert'][i])
+            }
+            if quantiles:
+                result['Earliest Stockout Date'] = pd.Timestamp(stockouts['earliest_date'][i])
+                result['Latest Stockout Date'] = pd.Timestamp(stockouts['latest_date'][i])
+            results.append(result)
+        yield current_date, results
+
+def main(global_xgb=False, refit_every=1, warm_start=False, model_cache_dir=None,
+         model_cache_mb=DEFAULT_MAX_BYTES // (1024 * 1024), quantiles=False, feature_store=False, resume=False):
+    # Load data
+    storage = get_storage()
+    df = load_data(storage)
+    
+    # Group the history by SKU once
+    partitions = SkuPartitions(df)
+    if feature_store:
+        # Only days not seen by an earlier run get their features computed
+        partitions.use_feature_store(FeatureStore(storage))
+    
+    # Reuse models fitted on earlier runs for unchanged histories
+    cache = None
+    if model_cache_dir:
+        cache = ModelCache(model_cache_dir, max_bytes=model_cache_mb * 1024 * 1024)
     
-    # Create results DataFrame
-    results_df = pd.DataFrame(results)
+    # Results are written out in batches, in date order, as dates complete; a resumed run skips the dates already written
+    writer = ResultWriter(storage, 'stockout_forecast_results', 'Date', resume=resume)
+    if writer.completed:
+        print(f"Resuming: {len(writer.completed)} dates already backtested")
     
-    # Sort by date
-    results_df = results_df.sort_values('Date')
+    # Replay the history and forecast as of every date
+    alerts = Counter()
+    for current_date, rows in iter_walk_forward(partitions, refit_every=refit_every, warm_start=warm_start,
+                                                global_xgb=global_xgb, cache=cache, quantiles=quantiles,
+                                                skip_dates=writer.completed):
+        writer.add(rows, [current_date])
+        alerts.update(row['Alert'] for row in rows)
     
-    # Save results
-    results_df.to_csv('stockout_forecast_results.csv', index=False)
-    print("\nForecast Results:")
-    print(results_df.to_string(index=False))
+    # Join the batches into the results file
+    with span('write_results'):
+        writer.finish()
+    print(f"\nBacktest complete. Results saved to '{storage.path('stockout_forecast_results')}'")
+    for alert, count in alerts.most_common():
+        print(f"{alert}: {count}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Backtest stockout forecasts over the order history.")
+    parser.add_argument('--global-xgb', action='store_true',
+                        help="Train one XGBoost model across all SKUs per date instead of one per SKU")
+    parser.add_argument('--refit-every', type=positive_int, default=1,
+                        help="Refit models every N dates and reuse them to predict in between")
+    parser.add_argument('--warm-start', action='store_true',
+                        help="Start each refit from the previous fit instead of from scratch")
+    parser.add_argument('--model-cache', metavar='DIR',
+                        help="Directory for cached fitted models; unchanged histories skip refitting")
+    parser.add_argument('--model-cache-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Size limit of the model cache in megabytes")
+    parser.add_argument('--quantiles', action='store_true',
+                        help="Add the earliest and latest stockout dates from Prophet's uncertainty interval")
+    parser.add_argument('--feature-store', action='store_true',
+                        help="Keep computed features on disk and only compute them for new days")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted backtest, skipping the dates whose results were already written")
+    parser.add_argument('--timings', action='store_true',
+                        help="Print the time spent in each stage at the end of the run")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="Sample the run's stacks into FILE as collapsed stacks (for flame graphs)")
+    args = parser.parse_args()
+    with profiled(args.profile):
+        main(global_xgb=args.global_xgb, refit_every=args.refit_every, warm_start=args.warm_start,
+             model_cache_dir=args.model_cache, model_cache_mb=args.model_cache_mb, quantiles=args.quantiles,
+             feature_store=args.feature_store, resume=args.resume)
+    if args.timings:
+        print_summary() 
\ No newline at end of file
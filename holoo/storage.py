@@ -0,0 +1,406 @@
+import argparse
+import io
+import json
+import logging
+import operator
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Backend used when none is requested explicitly: 'csv' or 'parquet'
+STORAGE_BACKEND = os.environ.get('HOLOO_STORAGE', 'csv')
+STORAGE_DIR = os.environ.get('HOLOO_DATA_DIR', '.')
+
+# Manifest of committed segments inside a partitioned dataset directory
+MANIFEST_FILE = '_index.jsonl'
+# Rows per chunk yielded by Storage.read_chunks
+CHUNK_ROWS = 250000
+# The process umask, read once at import: reading it means setting it, which is not safe once threads run
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Columns stored as dates in each dataset. CSV parses them on read, Parquet
+# stores them typed so they are never reparsed.
+DATE_COLUMNS = {
+    'input_data': ['date'],
+    'inventory_forecast_results': ['Prophet_Estimated_Stockout_Date', 'XGB_Estimated_Stockout_Date'],
+    'stockout_forecast_results': ['Date', 'Estimated Stockout Date'],
+    'inventory_snapshot': ['as_of'],
+}
+
+_OPERATORS = {
+    '==': operator.eq,
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda column, value: column.isin(value),
+    'not in': lambda column, value: ~column.isin(value),
+}
+
+def _parse_dates(name, df):
+    for column in DATE_COLUMNS.get(name, []):
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+    return df
+
+def _apply_filters(df, filters):
+    """Apply pyarrow-style ``[(column, op, value), ...]`` filters (ANDed) to a DataFrame."""
+    if not filters:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        mask &= _OPERATORS[op](df[column], value)
+    return df[mask]
+
+def _partition_matches(partition, filters):
+    """Check a date partition name against the comparison filters on ``date``."""
+    date_filters = [f for f in filters or [] if f[0] == 'date' and f[1] not in ('in', 'not in')]
+    if not date_filters:
+        return True
+    try:
+        partition_date = pd.Timestamp(partition)
+    except ValueError:
+        return True
+    return all(_OPERATORS[op](partition_date, pd.Timestamp(value)) for _, op, value in date_filters)
+
+def atomic_write(path, write):
+    """Write via a temporary file in the same directory so readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    # Dot-prefixed so dataset readers skip it
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        # mkstemp creates the file 0600; keep the target's mode, or give a new file the usual umask mode
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class Storage:
+    """Base class for dataset storage.
+
+    A dataset is either a single file (``<name><extension>``) or, when written
+    through an OrderLog, a directory of date partitions holding append-only
+    segment files (``<name>/<YYYY-MM-DD>/<segment><extension>``). Subclasses
+    implement ``read_file`` and ``write_file`` for their format.
+    """
+    extension = None
+
+    def __init__(self, directory=STORAGE_DIR):
+        self.directory = directory
+
+    def path(self, name):
+        return os.path.join(self.directory, name + self.extension)
+
+    def dataset_dir(self, name):
+        return os.path.join(self.directory, name)
+
+    def is_partitioned(self, name):
+        return os.path.isdir(self.dataset_dir(name))
+
+    def exists(self, name):
+        return self.is_partitioned(name) or os.path.exists(self.path(name))
+
+    def segment_path(self, name, segment):
+        return os.path.join(self.dataset_dir(name), segment + self.extension)
+
+    def read_manifest(self, name):
+        """Read a partitioned dataset's manifest.
+
+        Returns ``(segments, tombstones)``: an ordered dict of committed segment
+        id (``<partition>/<segment>``) -> order ids, and the set of segment ids
+        superseded by a compaction whose files may still be on disk.
+        """
+        segments = {}
+        tombstones = set()
+        path = os.path.join(self.dataset_dir(name), MANIFEST_FILE)
+        if not os.path.exists(path):
+            return segments, tombstones
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn final line from a crash mid-append
+                    continue
+                if 'segment' in entry:
+                    segments[entry['segment']] = entry.get('order_ids', [])
+                tombstones.update(entry.get('compacted', []))
+        return segments, tombstones
+
+    def segment_paths(self, name, filters=None):
+        """List committed segment files of a partitioned dataset, skipping partitions excluded by date filters."""
+        segments, _ = self.read_manifest(name)
+        return [
+            self.segment_path(name, segment)
+            for segment in sorted(segments)
+            if _partition_matches(segment.split('/')[0], filters)
+        ]
+
+    def read(self, name, columns=None, filters=None):
+        """Read a dataset, decoding only ``columns`` and keeping rows matching ``filters``.
+
+        ``filters`` are pyarrow-style ``[(column, op, value), ...]`` predicates, ANDed.
+        """
+        if not self.is_partitioned(name):
+            return self.read_file(self.path(name), name, columns, filters)
+        for attempt in range(3):
+            try:
+                frames = [self.read_file(path, name, columns, filters) for path in self.segment_paths(name, filters)]
+                break
+            except FileNotFoundError:
+                # A compaction replaced segments while we were reading; list them again
+                if attempt == 2:
+                    raise
+        if not frames:
+            return pd.DataFrame(columns=columns or [])
+        return pd.concat(frames, ignore_index=True)
+
+    def read_chunks(self, name, columns=None, chunksize=CHUNK_ROWS):
+        """Yield a dataset as DataFrames of at most ``chunksize`` rows, decoding only ``columns``.
+
+        Files are streamed one chunk at a time, so memory use is bounded by the
+        chunk size rather than the dataset size.
+        """
+        paths = self.segment_paths(name) if self.is_partitioned(name) else [self.path(name)]
+        for path in paths:
+            for chunk in self.iter_file(path, name, columns, chunksize):
+                yield chunk
+
+    def write(self, name, df):
+        self.write_file(self.path(name), name, df)
+
+    def concat_files(self, name, paths):
+        """Write dataset ``name`` as the rows of ``paths``, in order.
+
+        ``paths`` are files written by ``write_file`` with the same columns. They
+        are copied one at a time, so memory use does not grow with the dataset.
+        """
+        self.concat_file(self.path(name), name, paths)
+
+    def read_file(self, path, name, columns=None, filters=None):
+        raise NotImplementedError
+
+    def iter_file(self, path, name, columns=None, chunksize=CHUNK_ROWS):
+        raise NotImplementedError
+
+    def iter_file_from(self, path, name, position=0, chunksize=CHUNK_ROWS):
+        """Yield ``(chunk, ends)`` for the rows of a file from ``position`` on, without decoding the rows before it.
+
+        ``ends[i]`` is the position right after the chunk's i-th row, so reading
+        can later resume at the next row. Positions are only meaningful to the
+        backend that returned them (0 is always the first row).
+        """
+        raise NotImplementedError
+
+    def write_file(self, path, name, df):
+        raise NotImplementedError
+
+    def concat_file(self, path, name, paths):
+        raise NotImplementedError
+
+class CsvStorage(Storage):
+    """Datasets stored as CSV files (the original format)."""
+    extension = '.csv'
+
+    def read_file(self, path, name, columns=None, filters=None):
+        usecols = None
+        if columns is not None:
+            # Filter columns have to be parsed too, even if not returned;
+            # columns missing from this file are filled in afterwards
+            wanted = list(dict.fromkeys(list(columns) + [f[0] for f in filters or []]))
+            usecols = lambda column: column in wanted
+        df = pd.read_csv(path, usecols=usecols)
+        df = _apply_filters(_parse_dates(name, df), filters)
+        if columns is not None:
+            df = df.reindex(columns=list(columns))
+        return df
+
+    def iter_file(self, path, name, columns=None, chunksize=CHUNK_ROWS):
+        usecols = None if columns is None else (lambda column: column in columns)
+        with pd.read_csv(path, usecols=usecols, chunksize=chunksize) as reader:
+            for chunk in reader:
+                chunk = _parse_dates(name, chunk)
+                yield chunk if columns is None else chunk.reindex(columns=list(columns))
+
+    def iter_file_from(self, path, name, position=0, chunksize=CHUNK_ROWS):
+        # Positions are byte offsets of records, found by splitting lines where
+        # the quotes are balanced, since a quoted field may span lines
+        with open(path, 'rb') as f:
+            header = f.readline()
+            offset = max(position, len(header))
+            f.seek(offset)
+            lines, ends, record, quotes = [], [], [], 0
+            for line in f:
+                offset += len(line)
+                record.append(line)
+                quotes += line.count(b'"')
+                if quotes % 2:
+                    continue
+                quotes = 0
+                # Blank lines are not rows
+                if len(record) > 1 or line.strip():
+                    lines.extend(record)
+                    ends.append(offset)
+                record = []
+                if len(ends) == chunksize:
+                    yield self._parse_lines(name, header, lines), ends
+                    lines, ends = [], []
+            if ends:
+                yield self._parse_lines(name, header, lines), ends
+
+    def _parse_lines(self, name, header, lines):
+        return _parse_dates(name, pd.read_csv(io.BytesIO(header + b''.join(lines))))
+
+    def write_file(self, path, name, df):
+        atomic_write(path, lambda tmp_path: df.to_csv(tmp_path, index=False))
+
+    def concat_file(self, path, name, paths):
+        def write(tmp_path):
+            header = None
+            with open(tmp_path, 'wb') as out:
+                for source in paths:
+                    with open(source, 'rb') as f:
+                        # Only the first file's header is kept
+                        line = f.readline()
+                        if header is None:
+                            header = line
+                            out.write(line)
+                        elif line != header:
+                            raise ValueError(f"{source} does not have the columns of {paths[0]}")
+                        shutil.copyfileobj(f, out)
+        atomic_write(path, write)
+
+class ParquetStorage(Storage):
+    """Datasets stored as typed Parquet files with column and predicate pushdown."""
+    extension = '.parquet'
+
+    def __init__(self, directory=STORAGE_DIR):
+        if pq is None:
+            raise RuntimeError("pyarrow is required for the parquet storage backend")
+        super().__init__(directory)
+
+    def read_file(self, path, name, columns=None, filters=None):
+        # Only ``columns`` are decoded and row groups not matching ``filters`` are skipped
+        if columns is not None:
+            present = set(pq.read_schema(path).names)
+            table = pq.read_table(path, columns=[c for c in columns if c in present], filters=filters or None)
+            return table.to_pandas().reindex(columns=list(columns))
+        return pq.read_table(path, filters=filters or None).to_pandas()
+
+    def iter_file(self, path, name, columns=None, chunksize=CHUNK_ROWS):
+        parquet_file = pq.ParquetFile(path)
+        read_columns = None
+        if columns is not None:
+            present = set(parquet_file.schema_arrow.names)
+            read_columns = [c for c in columns if c in present]
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=read_columns):
+            chunk = batch.to_pandas()
+            yield chunk if columns is None else chunk.reindex(columns=list(columns))
+
+    def iter_file_from(self, path, name, position=0, chunksize=CHUNK_ROWS):
+        # Positions are row numbers; the row group holding ``position`` is found
+        # from the file metadata and the groups before it are never read
+        parquet_file = pq.ParquetFile(path)
+        first = 0
+        for group in range(parquet_file.num_row_groups):
+            rows = parquet_file.metadata.row_group(group).num_rows
+            if first + rows > position:
+                break
+            first += rows
+        else:
+            return
+        row = first
+        groups = list(range(group, parquet_file.num_row_groups))
+        for batch in parquet_file.iter_batches(batch_size=chunksize, row_groups=groups):
+            skip = min(max(position - row, 0), batch.num_rows)
+            row += batch.num_rows
+            if skip == batch.num_rows:
+                continue
+            batch = batch.slice(skip)
+            yield batch.to_pandas(), list(range(row - batch.num_rows + 1, row + 1))
+
+    def write_file(self, path, name, df):
+        df = _parse_dates(name, df.copy())
+        # One resolution for every file of a dataset, whatever pandas inferred, so the files can be concatenated
+        df = df.astype({column: 'datetime64[ns]' for column in DATE_COLUMNS.get(name, []) if column in df.columns})
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        atomic_write(path, lambda tmp_path: pq.write_table(table, tmp_path))
+
+    def concat_file(self, path, name, paths):
+        # Columns that were all null in some files take their type from the others
+        schema = pa.unify_schemas([pq.read_schema(source) for source in paths])
+        def write(tmp_path):
+            with pq.ParquetWriter(tmp_path, schema) as writer:
+                for source in paths:
+                    writer.write_table(pq.read_table(source).cast(schema))
+        atomic_write(path, write)
+
+BACKENDS = {
+    'csv': CsvStorage,
+    'parquet': ParquetStorage,
+}
+
+def get_storage(backend=None, directory=STORAGE_DIR):
+    """Return the storage backend named ``backend`` (default: $HOLOO_STORAGE or csv)."""
+    backend = backend or STORAGE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return BACKENDS[backend](directory)
+
+def migrate_csv_to_parquet(directory=STORAGE_DIR, names=None, overwrite=False):
+    """Convert existing CSV datasets to Parquet. Returns the names that were migrated."""
+    source = CsvStorage(directory)
+    target = ParquetStorage(directory)
+    migrated = []
+    for name in names or DATE_COLUMNS:
+        if source.is_partitioned(name):
+            # Order log segments are converted in place, one file at a time;
+            # segment ids in the manifest carry no extension
+            segments = source.segment_paths(name)
+            for path in segments:
+                target.write_file(os.path.splitext(path)[0] + target.extension, name, source.read_file(path, name))
+                os.remove(path)
+            if segments:
+                migrated.append(name)
+                logger.info(f"Migrated {len(segments)} segment(s) of {source.dataset_dir(name)}")
+            continue
+        if not source.exists(name):
+            continue
+        if target.exists(name) and not overwrite:
+            logger.info(f"Skipping {name}: {target.path(name)} already exists")
+            continue
+        target.write(name, source.read(name))
+        migrated.append(name)
+        logger.info(f"Migrated {source.path(name)} to {target.path(name)}")
+    return migrated
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Migrate CSV datasets to Parquet.")
+    parser.add_argument('--dir', default=STORAGE_DIR, help="Directory holding the datasets")
+    parser.add_argument('--overwrite', action='store_true', help="Replace existing Parquet files")
+    args = parser.parse_args()
+    migrated = migrate_csv_to_parquet(args.dir, overwrite=args.overwrite)
+    print(f"Migrated {len(migrated)} dataset(s): {', '.join(migrated) or 'none'}")
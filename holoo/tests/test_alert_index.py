@@ -0,0 +1,27 @@
+from datetime import date
+
+import pandas as pd
+
+from alert_index import AlertIndex
+from storage import get_storage
+
+COLUMNS = ['Prophet_Estimated_Stockout_Date', 'XGB_Estimated_Stockout_Date']
+
+def test_missing_results_give_no_alerts(tmp_path):
+    index = AlertIndex(get_storage('csv', str(tmp_path)), 'inventory_forecast_results', COLUMNS)
+    index.refresh()
+    assert index.built_at is not None
+    assert index.alerts(date(2024, 3, 1), 7) == []
+
+def test_alerts_follow_the_results_file(tmp_path):
+    storage = get_storage('csv', str(tmp_path))
+    index = AlertIndex(storage, 'inventory_forecast_results', COLUMNS)
+    index.refresh()
+    storage.write('inventory_forecast_results', pd.DataFrame({
+        'SKU_ID': ['A', 'B'],
+        'Prophet_Estimated_Stockout_Date': ['2024-03-03', 'No stockout projected'],
+        'XGB_Estimated_Stockout_Date': ['2024-03-20', '2024-03-05'],
+    }))
+    index.refresh()
+    alerts = index.alerts(date(2024, 3, 1), 7)
+    assert [alert['message'].split(' for SKU ')[1].split()[0] for alert in alerts] == ['A', 'B']
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+import app as app_module
+from storage import get_storage
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    storage = get_storage('csv', str(tmp_path))
+    storage.write(app_module.ML_FORECAST_DATASET, pd.DataFrame({
+        'SKU_ID': [f'SKU{i}' for i in range(5)],
+        'Prophet_Estimated_Stockout_Date': 'No stockout projected',
+        'XGB_Estimated_Stockout_Date': 'No stockout projected',
+    }))
+    monkeypatch.setattr(app_module, 'storage', storage)
+    return app_module.app.test_client()
+
+@pytest.mark.parametrize('limit', ['abc', '2.5', '-5', '0', '1001'])
+def test_forecasts_reject_a_bad_limit(client, limit):
+    response = client.get(f'/api/forecasts?limit={limit}')
+    assert response.status_code == 400
+    assert 'limit' in response.get_json()['error']
+
+def test_forecasts_page_by_limit(client):
+    page = client.get('/api/forecasts?limit=3').get_json()
+    assert [item['SKU_ID'] for item in page['items']] == ['SKU0', 'SKU1', 'SKU2']
+    page = client.get(f"/api/forecasts?limit=3&cursor={page['next_cursor']}").get_json()
+    assert [item['SKU_ID'] for item in page['items']] == ['SKU3', 'SKU4']
+    assert page['next_cursor'] is None
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from daily_demand import load_daily_demand, save_inventory_snapshot, DEMAND_COLUMNS
+from inventory_forecast import load_data
+from order_log import OrderLog
+from storage import get_storage
+
+def _line_items(seed=0, rows=500):
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 20, rows), unit='D')
+    # Several line items per SKU and day, some with a time of day
+    dates = dates + pd.to_timedelta(rng.integers(0, 3, rows) * 6, unit='h')
+    return pd.DataFrame({
+        'order_id': np.arange(rows),
+        'date': dates.strftime('%Y-%m-%d %H:%M:%S'),
+        'sku_id': rng.choice(['A', 'B', 'C', 'D'], rows),
+        'units_sold': rng.integers(0, 5, rows),
+        'inventory_level': rng.integers(0, 50, rows),
+        'customer': 'x',
+    })
+
+def _reference(df):
+    """One row per SKU and day from the whole history in memory, in order of first appearance."""
+    df = df.assign(date=pd.to_datetime(df['date']).dt.normalize())
+    return df.groupby(['sku_id', 'date'], sort=False).agg(
+        units_sold=('units_sold', 'sum'), inventory_level=('inventory_level', 'last')).reset_index()
+
+def _compare(result, expected):
+    assert list(result.columns) == DEMAND_COLUMNS
+    result = result.assign(sku_id=result['sku_id'].astype(str))
+    pd.testing.assert_frame_equal(result, expected[DEMAND_COLUMNS], check_dtype=False)
+
+@pytest.mark.parametrize('chunksize', [7, 64, 10000])
+def test_streamed_aggregate_matches_whole_file(tmp_path, chunksize):
+    storage = get_storage('csv', str(tmp_path))
+    line_items = _line_items()
+    storage.write('input_data', line_items)
+    _compare(load_daily_demand(storage, chunksize=chunksize), _reference(line_items))
+
+def test_load_data_reads_the_order_log(tmp_path):
+    storage = get_storage('csv', str(tmp_path))
+    line_items = _line_items()
+    log = OrderLog(storage)
+    log.append(line_items.iloc[:200])
+    log.append(line_items.iloc[200:])
+    result = load_data(storage)
+    # Segments are read by date partition, so compare by SKU and day
+    expected = _reference(line_items).sort_values(['sku_id', 'date']).reset_index(drop=True)
+    result = result.assign(sku_id=result['sku_id'].astype(str)).sort_values(['sku_id', 'date']).reset_index(drop=True)
+    _compare(result, expected)
+    assert result['units_sold'].dtype == np.int32
+
+def test_missing_inventory_is_rebuilt_from_the_snapshot(tmp_path):
+    storage = get_storage('csv', str(tmp_path))
+    storage.write('input_data', pd.DataFrame({
+        'sku_id': ['A', 'A', 'A'],
+        'date': ['2024-01-01', '2024-01-02', '2024-01-03'],
+        'units_sold': [2, 3, 4],
+        'inventory_level': [np.nan, np.nan, np.nan],
+    }))
+    save_inventory_snapshot(storage, {'A': 10}, '2024-01-02')
+    # 10 on hand at the end of the 2nd: 13 at the end of the 1st, 6 at the end of the 3rd
+    assert load_daily_demand(storage)['inventory_level'].tolist() == [13, 10, 6]
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_forecast import demand_matrix, ses, croston, fast_forecast, FAST_ALPHA
+from inventory_forecast import forecast_fast_path, AVG_SALES_COLUMN
+from sku_partitions import SkuPartitions
+
+def _partitions(units_by_sku, start='2024-01-01'):
+    frames = [pd.DataFrame({
+        'sku_id': sku,
+        'date': pd.date_range(start, periods=len(units)),
+        'units_sold': units,
+        'inventory_level': 100,
+    }) for sku, units in units_by_sku.items()]
+    return SkuPartitions(pd.concat(frames, ignore_index=True))
+
+def test_ses_starts_at_the_first_observed_day():
+    demand = np.array([[9.0, 9.0, 4.0, 0.0, 2.0]])
+    # Only the last three days are within the SKU's history
+    level = ses(demand, np.array([3]))
+    expected = 4.0
+    for x in [0.0, 2.0]:
+        expected += FAST_ALPHA * (x - expected)
+    assert level[0] == pytest.approx(expected)
+
+def test_croston_smooths_sizes_and_intervals():
+    demand = np.array([[0.0, 3.0, 0.0, 0.0, 5.0]])
+    rate = croston(demand, np.array([5]))
+    # Sizes 3 then 5, intervals 2 then 3 days
+    size = 3.0 + FAST_ALPHA * (5.0 - 3.0)
+    interval = 2.0 + FAST_ALPHA * (3.0 - 2.0)
+    assert rate[0] == pytest.approx((1 - FAST_ALPHA / 2) * size / interval)
+
+def test_croston_without_sales_forecasts_zero():
+    assert croston(np.zeros((1, 4)), np.array([4])).tolist() == [0.0]
+
+def test_intermittent_rows_use_croston():
+    demand = np.array([
+        [0.0, 0.0, 4.0, 0.0, 2.0],
+        [1.0, 2.0, 1.0, 3.0, 2.0],
+    ])
+    observed = np.array([5, 5])
+    forecast, methods = fast_forecast(demand, observed, horizon=7)
+    assert methods.tolist() == ['croston', 'ses']
+    assert forecast.shape == (2, 7)
+    assert forecast[0, 0] == pytest.approx(croston(demand, observed)[0])
+    assert forecast[1, -1] == pytest.approx(ses(demand, observed)[1])
+
+def test_demand_matrix_aligns_on_each_skus_last_day():
+    partitions = _partitions({'A': [1, 2, 3], 'B': [5, 6]})
+    demand, observed = demand_matrix(partitions, ['A', 'B'], window=4)
+    assert demand.tolist() == [[0, 1, 2, 3], [0, 0, 5, 6]]
+    assert observed.tolist() == [3, 2]
+
+def test_fast_path_routes_by_average_daily_units():
+    partitions = _partitions({'slow': [0, 1] * 20, 'busy': [4, 6] * 20, 'edge': [1] * 40})
+    rows, full_skus = forecast_fast_path(partitions, ['slow', 'busy', 'edge'], horizon=14, max_daily_units=1.0)
+    # Only SKUs selling strictly less than the cut-off skip the full models
+    assert [row['SKU_ID'] for row in rows] == ['slow']
+    assert full_skus == ['busy', 'edge']
+    row = rows[0]
+    assert row[AVG_SALES_COLUMN.format('Prophet')] == row[AVG_SALES_COLUMN.format('XGB')]
+    assert row['Horizon_Days'] == 14
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import build_features, FeatureStore, FEATURE_COLUMNS
+from storage import get_storage
+
+def _history(days=60, skus=('A', 'B', 'C'), seed=0):
+    rng = np.random.default_rng(seed)
+    frames = [pd.DataFrame({
+        'sku_id': sku,
+        'date': pd.date_range('2024-01-01', periods=days),
+        'units_sold': rng.integers(0, 9, days),
+    }) for sku in skus]
+    return pd.concat(frames, ignore_index=True)
+
+@pytest.fixture(params=['csv', 'parquet'])
+def store(request, tmp_path):
+    if request.param == 'parquet':
+        pytest.importorskip('pyarrow')
+    return FeatureStore(get_storage(request.param, str(tmp_path)))
+
+def _assert_matches_rebuild(result, df):
+    expected = build_features(df)
+    assert list(result.columns) == FEATURE_COLUMNS
+    np.testing.assert_allclose(result.to_numpy(dtype=float), expected.to_numpy(dtype=float))
+
+def _written_rows(store):
+    return [len(store.storage.read_file(path, store.dataset)) for path in store._segments()]
+
+def test_unchanged_history_is_read_back(store):
+    df = _history()
+    _assert_matches_rebuild(store.features_for(df), df)
+    _assert_matches_rebuild(store.features_for(df), df)
+    # The second run computed nothing, so wrote no segment
+    assert _written_rows(store) == [len(df)]
+
+def test_new_days_and_skus_are_computed_incrementally(store):
+    df = _history(days=60)
+    store.features_for(df)
+    later = _history(days=70, skus=('A', 'B', 'C', 'D'), seed=1)
+    later = later[(later['date'] >= '2024-03-01') | (later['sku_id'] == 'D')]
+    grown = pd.concat([df, later]).sort_values(['sku_id', 'date'], kind='stable').reset_index(drop=True)
+    _assert_matches_rebuild(store.features_for(grown), grown)
+    # Ten new days for each old SKU plus the new SKU's whole history
+    assert _written_rows(store) == [180, 3 * 10 + 70]
+
+def test_changed_day_recomputes_the_rest_of_its_sku(store):
+    df = _history()
+    store.features_for(df)
+    changed = df.copy()
+    changed.loc[(changed['sku_id'] == 'B') & (changed['date'] == '2024-02-10'), 'units_sold'] += 5
+    _assert_matches_rebuild(store.features_for(changed), changed)
+    # 2024-02-10 is day 41 of 60, so B's last 20 rows are recomputed
+    assert _written_rows(store)[-1] == 20
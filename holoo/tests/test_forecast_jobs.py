@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import forecast_jobs
+from forecast_jobs import ForecastScheduler, ForecastJob, SUCCEEDED, CANCELLED, FAILED, FINISHED
+from storage import get_storage
+
+def _history():
+    return pd.DataFrame({
+        'sku_id': ['A', 'A', 'B', 'B'],
+        'date': pd.to_datetime(['2024-01-01', '2024-01-02'] * 2),
+        'units_sold': [1.0, 2.0, 3.0, 4.0],
+        'inventory_level': [10.0, 9.0, 8.0, 7.0],
+    })
+
+def _wait(scheduler, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = scheduler.get(job_id)
+        if job.status in FINISHED:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(forecast_jobs, 'load_data', lambda storage: _history())
+    monkeypatch.setattr(forecast_jobs, 'run_forecasts', lambda partitions, skus, **kwargs: ([], []))
+    return get_storage('csv', str(tmp_path))
+
+def test_job_is_visible_to_other_workers(storage, monkeypatch):
+    def run_forecasts(partitions, skus, progress=None, **kwargs):
+        for done in range(1, len(skus) + 1):
+            progress(done, len(skus))
+        return [{'SKU_ID': sku} for sku in skus], []
+    monkeypatch.setattr(forecast_jobs, 'run_forecasts', run_forecasts)
+    # Two schedulers on one data directory stand for two gunicorn workers
+    accepting, polled = ForecastScheduler(storage), ForecastScheduler(storage)
+    job = accepting.submit(['B'])
+    finished = _wait(polled, job.id)
+    assert finished.status == SUCCEEDED
+    assert finished.progress() == {'done': 1, 'total': 1, 'percent': 100.0}
+    assert [listed.id for listed in polled.jobs()] == [job.id]
+    assert list(storage.read('inventory_forecast_results')['SKU_ID']) == ['B']
+
+def test_cancel_from_other_worker(storage, monkeypatch):
+    started = threading.Event()
+    def run_forecasts(partitions, skus, progress=None, **kwargs):
+        started.set()
+        for _ in range(500):
+            progress(0, len(skus))
+            time.sleep(0.01)
+        return [], []
+    monkeypatch.setattr(forecast_jobs, 'run_forecasts', run_forecasts)
+    owner, other = ForecastScheduler(storage), ForecastScheduler(storage)
+    job = owner.submit()
+    assert started.wait(5)
+    other.cancel(job.id)
+    assert _wait(other, job.id).status == CANCELLED
+
+def test_queued_job_absorbs_requests_from_other_workers(storage):
+    scheduler = ForecastScheduler(storage)
+    queued = ForecastJob(['A'])
+    with scheduler.store.update() as jobs:
+        jobs[queued.id] = queued
+    job = ForecastScheduler(storage).submit(['B'], source='sync')
+    assert job.id == queued.id
+    assert scheduler.get(queued.id).skus == {'A', 'B'}
+    assert scheduler.get(queued.id).sources == ['api', 'sync']
+
+def test_job_of_exited_worker_is_failed(storage):
+    scheduler = ForecastScheduler(storage)
+    orphan = ForecastJob()
+    # No process has this pid: pids are capped well below it
+    orphan.owner = 2 ** 30
+    with scheduler.store.update() as jobs:
+        jobs[orphan.id] = orphan
+    job = scheduler.get(orphan.id)
+    assert job.status == FAILED
+    replacement = scheduler.submit()
+    assert replacement.id != orphan.id
+    assert _wait(scheduler, replacement.id).status == SUCCEEDED
@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from forecast_results import read_page, InvalidCursor
+from stockout_engine import ALERT_TIERS, ALERT_OK
+from storage import get_storage
+
+DATASET = 'inventory_forecast_results'
+
+def _results():
+    return pd.DataFrame({
+        'SKU': [f'SKU{i}' for i in range(57)],
+        # Quoted fields spanning lines must not be split into rows
+        'Product_Name': [f'Item "{i}"\nsecond line' if i % 5 == 0 else f'Item {i}' for i in range(57)],
+        'Alert': [ALERT_TIERS[0][1] if i % 3 == 0 else ALERT_OK for i in range(57)],
+    })
+
+@pytest.fixture(params=['csv', 'parquet'])
+def storage(request, tmp_path):
+    if request.param == 'parquet':
+        pytest.importorskip('pyarrow')
+    storage = get_storage(request.param, str(tmp_path))
+    storage.write(DATASET, _results())
+    return storage
+
+def _all_pages(storage, **kwargs):
+    pages = []
+    cursor = None
+    while True:
+        page = read_page(storage, DATASET, 'SKU', cursor=cursor, chunksize=7, **kwargs)
+        pages.append(page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return pages
+
+def test_pages_cover_every_row_once(storage):
+    pages = _all_pages(storage, limit=10)
+    assert [len(items) for items in pages] == [10, 10, 10, 10, 10, 7]
+    assert [item['SKU'] for items in pages for item in items] == list(_results()['SKU'])
+    assert pages[0][5]['Product_Name'] == 'Item "5"\nsecond line'
+
+def test_pages_of_filtered_rows(storage):
+    pages = _all_pages(storage, limit=4, tiers=['critical'])
+    expected = _results().loc[lambda df: df['Alert'] == ALERT_TIERS[0][1], 'SKU']
+    assert [item['SKU'] for items in pages for item in items] == list(expected)
+
+def test_cursor_seeks_past_earlier_rows(tmp_path):
+    storage = get_storage('csv', str(tmp_path))
+    storage.write(DATASET, _results())
+    cursor = read_page(storage, DATASET, 'SKU', limit=10)['next_cursor']
+    position = int(cursor.split('-')[0])
+    with open(storage.path(DATASET), 'rb') as f:
+        data = f.read()
+    # The cursor is the byte offset of the row after the last one returned
+    assert data[position:].startswith(b'SKU10,')
+
+def test_cursor_from_rewritten_results_is_rejected(storage):
+    cursor = read_page(storage, DATASET, 'SKU', limit=10)['next_cursor']
+    storage.write(DATASET, _results().iloc[::-1])
+    with pytest.raises(InvalidCursor):
+        read_page(storage, DATASET, 'SKU', cursor=cursor)
+
+def test_parquet_cursor_starts_at_its_row_group(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    storage = get_storage('parquet', str(tmp_path))
+    pq.write_table(pa.Table.from_pandas(_results(), preserve_index=False), storage.path(DATASET), row_group_size=8)
+    chunks = list(storage.iter_file_from(storage.path(DATASET), DATASET, position=20, chunksize=7))
+    assert chunks[0][0]['SKU'].iloc[0] == 'SKU20'
+    assert chunks[0][1][0] == 21
+    assert sum(len(chunk) for chunk, _ in chunks) == 37
@@ -0,0 +1,84 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import inventory_forecast
+from inventory_forecast import (positive_int, run_forecasts, create_global_features, recursive_forecast,
+                                forecast_xgb_global)
+from sku_partitions import SkuPartitions
+
+def test_positive_int_accepts_whole_numbers_from_one():
+    assert positive_int('1') == 1
+    assert positive_int('250') == 250
+
+@pytest.mark.parametrize('value', ['0', '-3', '1.5', 'many'])
+def test_positive_int_rejects_other_values(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        positive_int(value)
+
+@pytest.mark.parametrize('workers, chunk_size', [(0, 10), (-1, 10), (2, 0)])
+def test_run_forecasts_rejects_empty_pools_and_chunks(workers, chunk_size):
+    with pytest.raises(ValueError):
+        run_forecasts(None, skus=[], workers=workers, chunk_size=chunk_size)
+
+def _partitions():
+    rng = np.random.default_rng(0)
+    frames = [pd.DataFrame({
+        'sku_id': sku,
+        'date': pd.date_range('2024-01-01', periods=90),
+        'units_sold': rng.poisson(rate, 90),
+        'inventory_level': 60,
+    }) for sku, rate in [('A', 3), ('B', 8), ('C', 1), ('D', 5)]]
+    return SkuPartitions(pd.concat(frames, ignore_index=True))
+
+def test_process_pool_matches_serial_run():
+    pytest.importorskip('prophet')
+    pytest.importorskip('xgboost')
+    partitions = _partitions()
+    serial, serial_failures = run_forecasts(partitions, horizon=14)
+    pooled, pooled_failures = run_forecasts(partitions, workers=2, chunk_size=1, horizon=14)
+    assert serial_failures == pooled_failures == []
+    # Same rows, in the order of the SKUs, whichever worker finished first
+    assert [row['SKU_ID'] for row in pooled] == ['A', 'B', 'C', 'D']
+    assert pooled == serial
+
+def test_global_features_stay_within_each_sku():
+    partitions = _partitions()
+    df = create_global_features(partitions.df, partitions.features())
+    for code, sku in enumerate(['A', 'B', 'C', 'D']):
+        rows = df[df['sku_id'] == sku]
+        units = rows['units_sold'].to_numpy(dtype=float)
+        # The first rows of a SKU have no earlier sales, not the previous SKU's
+        assert rows['lag1'].tolist() == [0.0] + units[:-1].tolist()
+        assert rows['lag7'].tolist() == [0.0] * 7 + units[:-7].tolist()
+        assert (rows['sku_code'] == code).all()
+        assert rows['sku_mean_sales'].iloc[0] == pytest.approx(units.mean())
+
+def test_recursive_forecast_feeds_predictions_back_as_lags():
+    history = np.array([[1, 2, 3, 4, 5, 6, 7], [0, 0, 0, 0, 0, 0, 10]], dtype=float)
+    # Tomorrow sells lag1 + lag7
+    dates, predictions = recursive_forecast(lambda X: X[:, 3] + X[:, 4], history,
+                                            np.array(['2024-03-01', '2024-03-10'], dtype='datetime64[D]'), 3)
+    assert predictions[0].tolist() == [8.0, 10.0, 13.0]
+    assert predictions[1].tolist() == [10.0, 10.0, 10.0]
+    assert dates[1].tolist() == list(np.datetime64('2024-03-11') + np.arange(3))
+
+def test_global_model_forecasts_every_sku():
+    pytest.importorskip('xgboost')
+    partitions = _partitions()
+    forecasts, failures = forecast_xgb_global(partitions, ['D', 'A', 'missing'], horizon=5)
+    assert failures == []
+    assert list(forecasts) == ['D', 'A']
+    assert all(len(forecast) == 5 for forecast in forecasts.values())
+    assert forecasts['A']['ds'].iloc[0] == pd.Timestamp('2024-03-31')
+
+def test_global_model_failure_fails_every_sku(monkeypatch):
+    def fail(partitions, cache=None):
+        raise ValueError("no rows")
+    monkeypatch.setattr(inventory_forecast, 'fit_global_xgb_model', fail)
+    forecasts, failures = forecast_xgb_global(_partitions(), ['A', 'B'])
+    assert forecasts == {}
+    assert [failure['SKU_ID'] for failure in failures] == ['A', 'B']
+    assert 'no rows' in failures[0]['Error']
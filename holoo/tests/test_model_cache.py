@@ -0,0 +1,41 @@
+import os
+import pickle
+
+import model_cache
+from model_cache import ModelCache
+
+def _count_scans(monkeypatch):
+    calls = []
+    scandir = os.scandir
+    def counting(path):
+        calls.append(path)
+        return scandir(path)
+    monkeypatch.setattr(model_cache.os, 'scandir', counting)
+    return calls
+
+def test_puts_within_budget_scan_once(tmp_path, monkeypatch):
+    cache = ModelCache(str(tmp_path))
+    scans = _count_scans(monkeypatch)
+    for sku in range(50):
+        cache.put('xgb', f'key{sku}', {'sku': sku})
+    assert len(scans) == 1
+    assert cache.get('xgb', 'key7') == {'sku': 7}
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    size = len(pickle.dumps({'sku': 0}))
+    cache = ModelCache(str(tmp_path), max_bytes=3 * size)
+    for sku in range(3):
+        cache.put('xgb', f'key{sku}', {'sku': sku})
+    # A hit makes key0 the most recently used entry
+    assert cache.get('xgb', 'key0') == {'sku': 0}
+    cache.put('xgb', 'key3', {'sku': 3})
+    assert cache.get('xgb', 'key1') is None
+    assert [cache.get('xgb', f'key{sku}') is not None for sku in (0, 2, 3)] == [True, True, True]
+    total = sum(entry.stat().st_size for entry in os.scandir(str(tmp_path)) if entry.name.endswith('.model'))
+    assert total <= 3 * size
+
+def test_cache_pickles_for_worker_processes(tmp_path):
+    cache = ModelCache(str(tmp_path))
+    cache.put('xgb', 'key', [1, 2])
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy.get('xgb', 'key') == [1, 2]
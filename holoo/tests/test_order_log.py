@@ -0,0 +1,77 @@
+import os
+
+import pandas as pd
+import pytest
+
+from order_log import OrderLog, DEMAND_MARKER
+from storage import get_storage
+
+def _line_items():
+    return pd.DataFrame({
+        'order_id': [101, 102, 103],
+        'date': ['2024-03-01', '2024-03-01', '2024-03-02'],
+        'sku_id': ['A', 'B', 'A'],
+        'units_sold': [1, 2, 3],
+        'inventory_level': [10, 20, 7],
+    })
+
+def _crash_before_commit(log, monkeypatch):
+    def crash(entries):
+        raise RuntimeError("crashed before commit")
+    monkeypatch.setattr(log, '_commit', crash)
+
+def test_line_items_are_recovered_after_crash(tmp_path, monkeypatch):
+    storage = get_storage('csv', str(tmp_path))
+    log = OrderLog(storage)
+    _crash_before_commit(log, monkeypatch)
+    with pytest.raises(RuntimeError):
+        log.append(_line_items())
+    segments = [name for _, _, names in os.walk(log.root) for name in names if name.endswith(storage.extension)]
+    assert len(segments) == 2
+    assert not any(DEMAND_MARKER in name for name in segments)
+
+    reopened = OrderLog(storage)
+    assert all(order_id in reopened for order_id in ['101', '102', '103'])
+    history = reopened.read()
+    assert sorted(history['order_id']) == [101, 102, 103]
+    assert reopened.append(_line_items()) == 0
+
+def test_uncommitted_daily_totals_are_dropped(tmp_path, monkeypatch):
+    storage = get_storage('csv', str(tmp_path))
+    log = OrderLog(storage)
+    totals = pd.DataFrame({'date': ['2024-03-01'], 'sku_id': ['A'], 'units_sold': [5]})
+    _crash_before_commit(log, monkeypatch)
+    with pytest.raises(RuntimeError):
+        log.append(totals, order_ids={'2024-03-01': [201, 202]})
+
+    reopened = OrderLog(storage)
+    assert '201' not in reopened
+    assert reopened.read().empty
+    assert reopened.append(totals, order_ids={'2024-03-01': [201, 202]}) == 1
+    assert '201' in reopened and '202' in reopened
+
+def test_legacy_file_placed_next_to_existing_log_is_ingested(tmp_path):
+    storage = get_storage('csv', str(tmp_path))
+    storage.write('input_data', _line_items().iloc[:2])
+    OrderLog(storage)
+    assert os.path.exists(storage.path('input_data') + '.migrated')
+
+    # A second export overlapping the first, dropped in after the migration
+    storage.write('input_data', _line_items().iloc[1:])
+    log = OrderLog(storage)
+    assert sorted(log.read()['order_id']) == [101, 102, 103]
+    assert not os.path.exists(storage.path('input_data'))
+    # Both exports are kept as backups
+    with open(storage.path('input_data') + '.migrated') as f:
+        assert '103' not in f.read()
+    with open(storage.path('input_data') + '.migrated.1') as f:
+        assert '103' in f.read()
+
+def test_legacy_file_without_order_ids_is_left_in_place(tmp_path):
+    storage = get_storage('csv', str(tmp_path))
+    OrderLog(storage).append(_line_items())
+    storage.write('input_data', _line_items().drop(columns='order_id'))
+    log = OrderLog(storage)
+    assert len(log.read()) == 3
+    assert os.path.exists(storage.path('input_data'))
+    assert not os.path.exists(storage.path('input_data') + '.migrated')
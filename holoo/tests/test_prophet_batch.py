@@ -0,0 +1,52 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+prophet = pytest.importorskip('prophet')
+
+from prophet_batch import predict_yhat, future_dates, history_and_future_dates
+
+logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+
+def _fit(days, seed, **params):
+    rng = np.random.default_rng(seed)
+    history = pd.DataFrame({'ds': pd.date_range('2024-01-01', periods=days), 'y': rng.poisson(5, days) + 1.0})
+    model = prophet.Prophet(yearly_seasonality=False, **params)
+    model.fit(history)
+    return model
+
+@pytest.fixture(scope='module')
+def models():
+    # Different history lengths give different changepoint counts
+    return [_fit(days, seed) for seed, days in enumerate([40, 90, 150])]
+
+def _predict(model, dates):
+    return model.predict(pd.DataFrame({'ds': dates}))['yhat'].to_numpy()
+
+def test_batch_matches_predict(models):
+    dates = future_dates('2024-06-01', 30)
+    expected = np.array([_predict(model, dates) for model in models])
+    np.testing.assert_array_equal(predict_yhat(models, dates), expected)
+
+def test_history_and_future_match_make_future_dataframe(models):
+    model = models[1]
+    future = model.make_future_dataframe(periods=30, freq='D')
+    dates = history_and_future_dates(model, 30)
+    assert (dates == future['ds']).all()
+    np.testing.assert_array_equal(predict_yhat([model], dates)[0], model.predict(future)['yhat'].to_numpy())
+
+def test_model_without_scaling_option(models):
+    # Prophet releases before 1.1.5 have no ``scaling`` and scale y from a floor of 0
+    model = _fit(60, 7)
+    dates = future_dates('2024-04-01', 14)
+    expected = _predict(model, dates)
+    if hasattr(model, 'scaling'):
+        del model.scaling
+    np.testing.assert_array_equal(predict_yhat([model], dates)[0], expected)
+
+def test_unbatchable_model_falls_back_to_predict(models):
+    model = _fit(60, 3, seasonality_mode='multiplicative')
+    dates = future_dates('2024-04-01', 14)
+    np.testing.assert_allclose(predict_yhat([model, models[0]], dates)[0], _predict(model, dates))
@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_pool import HttpPool, HttpError
+from shopify_integration import ShopifyIntegration, TokenBucket
+from demand_backfill import backfill_demand
+from storage import get_storage
+
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+ORDERS = [
+    {'id': 1000 + i, 'created_at': (START + timedelta(hours=i)).isoformat(),
+     'updated_at': (START + timedelta(hours=i)).isoformat(),
+     'line_items': [{'sku': f'SKU{i % 3}', 'quantity': 1 + i % 2}]}
+    for i in range(25)
+]
+
+class StubShopify(BaseHTTPRequestHandler):
+    """Serves orders.json a few orders per page with Link cursors, like the Admin API."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.client_address[1], self.path))
+        if server.throttle:
+            server.throttle -= 1
+            self._send(429, headers=[('Retry-After', '0')])
+            return
+        parsed = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        if not parsed.path.endswith('/orders.json'):
+            self._send(404)
+            return
+        if 'page_info' in query:
+            start, end, offset = query['page_info'].split('|')
+            offset = int(offset)
+        else:
+            # Orders are never edited here, so created_at and updated_at windows match the same orders
+            field = 'created_at' if 'created_at_min' in query else 'updated_at'
+            start, end, offset = query[f'{field}_min'], query[f'{field}_max'], 0
+        matching = [order for order in ORDERS
+                    if datetime.fromisoformat(start) <= datetime.fromisoformat(order['updated_at'])
+                    < datetime.fromisoformat(end)]
+        page = matching[offset:offset + server.page_size]
+        headers = []
+        if offset + server.page_size < len(matching):
+            cursor = urllib.parse.quote(f"{start}|{end}|{offset + server.page_size}")
+            headers.append(('Link', f'<{server.base_url}/orders.json?page_info={cursor}>; rel="next"'))
+        self._send(200, json.dumps({'orders': page}).encode('utf-8'), headers)
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubShopify)
+    server.requests = []
+    server.throttle = 0
+    server.page_size = 10
+    server.base_url = f"http://127.0.0.1:{server.server_port}/admin/api/2024-01"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client(stub, tmp_path):
+    return ShopifyIntegration('stub.myshopify.com', 'token', storage=get_storage('csv', str(tmp_path)),
+                              api_base_url=stub.base_url, read_only=True)
+
+def test_pool_reuses_keep_alive_connections(stub):
+    pool = HttpPool()
+    for _ in range(3):
+        query = urllib.parse.urlencode({'updated_at_min': START.isoformat(), 'updated_at_max': START.isoformat()})
+        status, _, _ = pool.request('GET', f"{stub.base_url}/orders.json?{query}")
+        assert status == 200
+    # Every request came in over the same client port
+    assert len({port for port, _ in stub.requests}) == 1
+    pool.close()
+
+def test_pool_raises_http_error(stub):
+    pool = HttpPool()
+    with pytest.raises(HttpError) as error:
+        pool.request('GET', f"{stub.base_url}/missing.json")
+    assert error.value.code == 404
+    pool.close()
+
+def test_cursor_pagination_fetches_every_order(client, stub):
+    orders = client.fetch_orders(START, START + timedelta(days=2), slices=1)
+    assert [order['id'] for order in orders] == [order['id'] for order in ORDERS]
+    # 25 orders at 10 per page, following the Link cursor twice
+    assert len(stub.requests) == 3
+    assert 'page_info=' in stub.requests[-1][1]
+
+def test_sliced_fetch_keeps_each_order_once(client):
+    orders = client.fetch_orders(START, START + timedelta(days=2), slices=4)
+    assert sorted(order['id'] for order in orders) == [order['id'] for order in ORDERS]
+
+def test_throttled_requests_are_retried(client, stub):
+    stub.throttle = 2
+    orders = client.fetch_orders(START, START + timedelta(hours=5), slices=1)
+    assert len(orders) == 5
+    assert len(stub.requests) == 3
+
+def test_demand_is_counted_per_sku_and_day(client):
+    counter = client.fetch_demand(START, START + timedelta(days=2), slices=2)
+    demand = counter.to_frame()
+    assert demand['units_sold'].sum() == sum(item['quantity'] for order in ORDERS for item in order['line_items'])
+    assert counter.orders == len(ORDERS)
+
+def test_token_bucket_limits_the_request_rate():
+    bucket = TokenBucket(rate=50, capacity=2)
+    started = time.monotonic()
+    for _ in range(7):
+        bucket.acquire()
+    # Two requests from the burst, then five at 50 per second
+    assert time.monotonic() - started >= 0.09
+
+def test_client_shares_rate_limit_across_pages(client, stub, monkeypatch):
+    monkeypatch.setattr(client, 'rate_limiter', TokenBucket(rate=20, capacity=1))
+    started = time.monotonic()
+    client.fetch_orders(START, START + timedelta(days=2), slices=1)
+    assert time.monotonic() - started >= 0.09
+
+def test_backfill_keeps_its_stats_apart_from_the_last_sync(stub, tmp_path):
+    client = ShopifyIntegration('stub.myshopify.com', 'token', storage=get_storage('csv', str(tmp_path)),
+                                api_base_url=stub.base_url)
+    rows = backfill_demand(client, START, START + timedelta(days=2))
+    status = client.sync_status()
+    assert status['last_sync_at'] is None
+    assert status['last_backfill_orders'] == len(ORDERS)
+    assert status['last_backfill_rows'] == rows
+    # Orders, not the SKU-day rows they were folded into
+    assert status['total_orders'] == len(ORDERS)
+    assert status['total_rows'] == rows < len(ORDERS)
+
+    # A sync that finds only orders the backfill already loaded
+    client.save_watermark(START + timedelta(days=2))
+    client.sync_orders()
+    status = client.sync_status()
+    assert status['last_sync_at'] is not None
+    assert status['last_sync_rows'] == 0
+    assert status['total_orders'] == len(ORDERS)
+    assert status['last_backfill_orders'] == len(ORDERS)
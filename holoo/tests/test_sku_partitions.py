@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from features import build_features
+from sku_partitions import SkuPartitions
+
+def _history():
+    rng = np.random.default_rng(0)
+    rows = 300
+    return pd.DataFrame({
+        'sku_id': rng.choice(['C', 'A', 'B'], rows),
+        'date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 60, rows), unit='D'),
+        'units_sold': rng.integers(0, 9, rows),
+        'inventory_level': rng.integers(0, 100, rows),
+    })
+
+def _filtered(df, sku):
+    """The baseline's boolean filter of one SKU's history."""
+    return df[df['sku_id'] == sku].sort_values('date', kind='stable')
+
+def test_get_matches_a_boolean_filter():
+    df = _history()
+    partitions = SkuPartitions(df)
+    assert partitions.skus == list(df['sku_id'].unique())
+    for sku in partitions.skus:
+        expected = _filtered(df, sku)
+        pd.testing.assert_frame_equal(partitions.get(sku).reset_index(drop=True), expected.reset_index(drop=True))
+        assert partitions.last_inventory(sku) == expected['inventory_level'].iloc[-1]
+        assert partitions.meta.at[sku, 'rows'] == len(expected)
+        assert partitions.meta.at[sku, 'first_date'] == expected['date'].iloc[0]
+
+def test_rows_without_a_sku_are_dropped():
+    df = _history()
+    df.loc[:9, 'sku_id'] = None
+    partitions = SkuPartitions(df)
+    assert len(partitions.df) == len(df) - 10
+    assert None not in partitions
+
+def test_subset_keeps_the_slices_and_computed_features():
+    partitions = SkuPartitions(_history())
+    partitions.features()
+    subset = partitions.subset(['B', 'missing', 'C'])
+    assert subset.skus == ['B', 'C']
+    assert 'A' not in subset
+    pd.testing.assert_frame_equal(subset.get('C').reset_index(drop=True),
+                                  partitions.get('C').reset_index(drop=True))
+    # Features come along rather than being recomputed on the smaller frame
+    assert subset._features is not None
+    np.testing.assert_array_equal(subset.features('B').to_numpy(), partitions.features('B').to_numpy())
+    # Lags and rolling windows stay within the SKU, so its slice equals its features computed alone
+    np.testing.assert_array_equal(partitions.features('A').to_numpy(), build_features(partitions.get('A')).to_numpy())
+
+def test_empty_subset():
+    subset = SkuPartitions(_history()).subset(['missing'])
+    assert len(subset) == 0
+    assert subset.df.empty
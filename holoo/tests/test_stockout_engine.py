@@ -0,0 +1,51 @@
+import numpy as np
+
+from stockout_engine import compute_stockouts, first_crossing, ALERT_TIERS, ALERT_OK, ALERT_NONE
+
+def _dates(n_skus, horizon, start='2024-05-01'):
+    days = np.datetime64(start, 'D') + np.arange(horizon)
+    return np.tile(days, (n_skus, 1))
+
+def test_first_crossing_is_the_day_cumulative_demand_exceeds_stock():
+    forecast = np.array([
+        [2.0, 2.0, 2.0, 2.0],   # 4 units last two days; the third day's sales exceed them
+        [1.0, 1.0, 1.0, 1.0],   # exactly 4 units sold over the horizon: never exceeded
+        [5.0, 0.0, 0.0, 0.0],   # out on the first day
+    ])
+    assert first_crossing(forecast, [4, 4, 3]).tolist() == [2, -1, 0]
+
+def test_missing_inventory_never_stocks_out():
+    assert first_crossing([[10.0, 10.0]], [np.nan], extrapolate=True).tolist() == [-1]
+
+def test_extrapolation_continues_at_the_mean_rate():
+    forecast = np.array([
+        [1.0, 3.0],   # 4 units over the horizon at 2 per day; 6 more units last 3 more days
+        [0.0, 0.0],   # no demand: still never runs out
+        [3.0, 3.0],   # crossed within the horizon: unchanged
+    ])
+    inventory = [10, 10, 5]
+    assert first_crossing(forecast, inventory).tolist() == [-1, -1, 1]
+    assert first_crossing(forecast, inventory, extrapolate=True).tolist() == [5, -1, 1]
+
+def test_compute_stockouts_dates_restock_and_alerts():
+    forecast = np.ones((4, 10))
+    inventory = np.array([2, 6, 20, 9])
+    result = compute_stockouts(forecast, inventory, _dates(4, 10), restock_days=5)
+    assert result['first_day'].tolist() == [2, 6, -1, 9]
+    assert result['stockout_date'][0] == np.datetime64('2024-05-03')
+    assert np.isnat(result['stockout_date'][2])
+    assert result['restock'].tolist() == [True, False, False, False]
+    assert result['alert'].tolist() == [ALERT_TIERS[0][1], ALERT_TIERS[1][1], ALERT_NONE, ALERT_TIERS[2][1]]
+
+def test_extrapolated_dates_count_on_past_the_horizon():
+    result = compute_stockouts(np.ones((1, 10)), np.array([40]), _dates(1, 10), extrapolate=True)
+    assert result['first_day'].tolist() == [40]
+    assert result['stockout_date'][0] == np.datetime64('2024-05-01') + 40
+    assert result['alert'].tolist() == [ALERT_OK]
+
+def test_quantile_forecasts_bound_the_stockout_date():
+    forecast = np.full((1, 10), 2.0)
+    result = compute_stockouts(forecast, np.array([9]), _dates(1, 10),
+                               lower=forecast / 2, upper=forecast * 2)
+    assert result['earliest_date'][0] < result['stockout_date'][0] < result['latest_date'][0]
+    assert result['stockout_date'][0] == np.datetime64('2024-05-05')
@@ -0,0 +1,13 @@
+import pandas as pd
+import pytest
+
+from sku_partitions import SkuPartitions
+from stockout_forecast import iter_walk_forward
+
+@pytest.mark.parametrize('refit_every', [0, -1])
+def test_refit_stride_must_be_positive(refit_every):
+    partitions = SkuPartitions(pd.DataFrame({
+        'sku_id': 'A', 'date': pd.date_range('2024-01-01', periods=5), 'units_sold': 1, 'inventory_level': 9,
+    }))
+    with pytest.raises(ValueError):
+        next(iter_walk_forward(partitions, refit_every=refit_every))
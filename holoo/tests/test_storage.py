@@ -0,0 +1,42 @@
+import os
+import stat
+
+import pandas as pd
+import pytest
+
+from storage import atomic_write, get_storage
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+def _write_text(text):
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+    return write
+
+def test_new_file_gets_the_umask_mode(tmp_path):
+    path = tmp_path / 'config.json'
+    atomic_write(str(path), _write_text('{}'))
+    # The same mode open() gives a new file, not mkstemp's 0600
+    reference = tmp_path / 'reference'
+    reference.write_text('')
+    assert _mode(path) == _mode(reference)
+
+def test_rewrite_keeps_the_existing_mode(tmp_path):
+    path = tmp_path / 'forecast_jobs.json'
+    path.write_text('[]')
+    os.chmod(path, 0o640)
+    atomic_write(str(path), _write_text('[{}]'))
+    assert path.read_text() == '[{}]'
+    assert _mode(path) == 0o640
+
+@pytest.mark.parametrize('backend', ['csv', 'parquet'])
+def test_dataset_files_are_readable_by_others(tmp_path, backend):
+    if backend == 'parquet':
+        pytest.importorskip('pyarrow')
+    storage = get_storage(backend, str(tmp_path))
+    storage.write('inventory_forecast_results', pd.DataFrame({'SKU_ID': ['A']}))
+    reference = tmp_path / 'reference'
+    reference.write_text('')
+    assert _mode(storage.path('inventory_forecast_results')) == _mode(reference)
@@ -0,0 +1,32 @@
+import importlib
+import logging
+import time
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Dependencies imported on first use; together they take seconds to load
+HEAVY_MODULES = ['prophet', 'xgboost']
+
+def prewarm(modules=HEAVY_MODULES):
+    """Import the deferred dependencies now instead of on first use.
+
+    Prophet also loads its compiled Stan model, which otherwise happens on
+    the first fit. Call this before forking workers (e.g. under
+    ``gunicorn --preload``) so every worker starts with the modules loaded.
+    Modules that are not installed are skipped. Returns the seconds spent on
+    each module.
+    """
+    timings = {}
+    for name in modules:
+        started = time.perf_counter()
+        with span('import', module=name):
+            try:
+                module = importlib.import_module(name)
+                if name == 'prophet':
+                    module.Prophet()
+            except ImportError as e:
+                logger.warning(f"Could not pre-import {name}: {str(e)}")
+        timings[name] = time.perf_counter() - started
+    return timings